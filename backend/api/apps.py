@@ -1,9 +1,24 @@
+import logging
+
 from django.apps import AppConfig
-import firebase_admin
-from firebase_admin import credentials
-import os
-from dotenv import load_dotenv
-import sys
+
+logger = logging.getLogger(__name__)
+
+
+def start_worker_threads():
+    """
+    Starts the background threads a server process needs. Called from wsgi.py and asgi.py, which
+    only servers import, so management commands don't start them. Each start() is a no-op if this
+    process already runs its threads.
+    """
+    from .idtokens import id_token_verifier
+    from .outbox import email_outbox
+    # Registers the 'order_emails' sender before any job is picked up
+    from .views import orders  # noqa: F401
+    email_outbox.start()
+    # Fetch the ID token signing keys in the background, before the first authenticated request
+    id_token_verifier.key_store.start()
+
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -11,35 +26,14 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         # This method is called once when the Django app is ready.
-        if not firebase_admin._apps:
-            print("Initializing Firebase...")
-            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            load_dotenv(os.path.join(project_root, '.env'))
-
-            try:
-                private_key = os.getenv('PRIVATE_KEY', '').replace('\\n', '\n')
-                creds_info = {
-                    "type": os.getenv("TYPE"),
-                    "project_id": os.getenv("PROJECT_ID"),
-                    "private_key_id": os.getenv("PRIVATE_KEY_ID"),
-                    "private_key": private_key,
-                    "client_email": os.getenv("CLIENT_EMAIL"),
-                    "client_id": os.getenv("CLIENT_ID"),
-                    "auth_uri": os.getenv("AUTH_URI"),
-                    "token_uri": os.getenv("TOKEN_URI"),
-                    "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
-                    "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
-                    "universe_domain": os.getenv("UNIVERSE_DOMAIN")
-                }
-                
-                if not all(creds_info.values()):
-                    print("WARNING: Missing one or more Firebase credentials. Firebase integration might fail.")
-                else:
-                    cred = credentials.Certificate(creds_info)
-                    firebase_admin.initialize_app(cred)
-                    print("Firebase App initialized successfully for Django.")
-
-            except Exception as e:
-                print(f"Error initializing Firebase App for Django: {e}")
-                # We raise this to ensure the server doesn't start in a broken state.
-                raise e 
\ No newline at end of file
+        # Only the Firebase app is set up here; Firestore clients are created lazily,
+        # per process, on first use (see api/firebase.py).
+        from .firebase import initialize_firebase
+        try:
+            initialize_firebase()
+        except ValueError:
+            logger.warning("Missing one or more Firebase credentials. Firebase integration might fail.")
+        except Exception as e:
+            logger.exception("Error initializing Firebase App for Django: %s", e)
+            # We raise this to ensure the server doesn't start in a broken state.
+            raise e
@@ -1,8 +1,64 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
 from rest_framework import exceptions
+from django.conf import settings
 from django.contrib.auth.models import User
 from firebase_admin import auth
 
+from .idtokens import verify_id_token
+
+
+class VerifiedTokenCache:
+    """
+    Recently verified ID tokens and the Django user each one maps to, keyed by a hash of the token.
+    A cached token skips signature verification and the user lookup. Entries are dropped when the
+    token expires (its `exp` claim), and least recently used first when the cache is full.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """Returns the user for `token`, or None if it isn't cached (or has expired)."""
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token, expires_at, user):
+        if self.max_entries <= 0:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 1024))
+
+
 class FirebaseAuthentication(BaseAuthentication):
     """
     Custom authentication class for Firebase.
@@ -21,7 +77,11 @@ class FirebaseAuthentication(BaseAuthentication):
 
         try:
             token = auth_header[1].decode('utf-8')
-            decoded_token = auth.verify_id_token(token)
+            user = token_cache.get(token)
+            if user is not None:
+                return (user, None)
+
+            decoded_token = verify_id_token(token)
             uid = decoded_token['uid']
             
             # Here, we get or create a Django user.
@@ -35,7 +95,8 @@ class FirebaseAuthentication(BaseAuthentication):
                 if is_admin:
                     user.is_staff = True
                     user.save()
-            
+
+            token_cache.put(token, decoded_token['exp'], user)
             return (user, None) # Authentication successful
 
         except auth.InvalidIdTokenError:
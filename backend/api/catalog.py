@@ -0,0 +1,393 @@
+"""
+In-process, read-only snapshot of the product catalog.
+
+The catalog (products joined with their categories) changes only a few times a day,
+so each worker keeps a copy in memory and serves catalog reads from it.
+The copy is kept fresh by Firestore `on_snapshot` listeners on the `products` and
+`categories` collections, and on the stock shards (so every worker shows, and hashes into
+its version, the same remaining stock). If listeners can't be started, a background thread polls
+a version document (`meta/catalog`) that every catalog write bumps, and reloads the catalog
+at least every CATALOG_STOCK_REFRESH_INTERVAL seconds so remaining stock doesn't go stale.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils.http import parse_etags
+from firebase_admin import firestore
+
+from .firebase import get_db
+from .pagination import DOCUMENT_ID, InvalidPageParams
+from .stock import SHARDS_COLLECTION, remaining_stock, shard_counts, stock_levels
+
+VERSION_DOC_PATH = ('meta', 'catalog')
+
+# The fields `?fields=` may ask for
+PRODUCT_FIELDS = frozenset({
+    'id', 'name', 'description', 'price', 'image', 'category', 'categoryId', 'categoryName',
+    'quantity', 'stock', 'isAvailable', 'isActive', 'isOnSale', 'salePercentage',
+})
+CATEGORY_FIELDS = frozenset({'id', 'name', 'isActive', 'productCount'})
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_categories(db, category_refs):
+    """
+    Fetches the given category references with a single batched `get_all` call.
+    Duplicate and missing references are ignored.
+    Returns a dict mapping each category document path to its data (including the id).
+    """
+    unique_refs = {ref.path: ref for ref in category_refs if ref is not None}
+    if not unique_refs:
+        return {}
+
+    categories = {}
+    for category_doc in db.get_all(list(unique_refs.values())):
+        if category_doc.exists:
+            categories[category_doc.reference.path] = {"id": category_doc.id, **category_doc.to_dict()}
+    return categories
+
+
+def serialize_product(doc_id, product_data, categories):
+    """
+    Builds the API representation of a product document, replacing its
+    `categoryRef` with the resolved category from `categories` (see resolve_categories).
+    Products written through the API also carry `categoryId`/`categoryName`, which
+    stand in for the category when it wasn't resolved.
+    """
+    category_ref = product_data.pop('categoryRef', None)
+    if category_ref is not None and category_ref.path in categories:
+        product_data['category'] = categories[category_ref.path]
+    elif 'categoryName' in product_data:
+        product_data['category'] = {"id": product_data.get('categoryId'), "name": product_data['categoryName']}
+    return {"id": doc_id, **product_data}
+
+
+def category_refs_to_resolve(docs):
+    """
+    Returns the category references that must be read to serialize `(id, data)` product pairs:
+    only those of products without denormalized category data (e.g. created outside the API).
+    """
+    return [data.get('categoryRef') for _, data in docs if 'categoryName' not in data]
+
+
+def category_id_of(product):
+    """Returns the category id of a product, given either its raw document data or its serialized form."""
+    if not product:
+        return None
+    # categoryRef is what the admin UI writes, so it wins over a categoryId it may have left stale
+    category_ref = product.get('categoryRef')
+    if category_ref is not None:
+        return category_ref.id
+    if isinstance(product.get('category'), dict):
+        return product['category'].get('id')
+    return product.get('categoryId')
+
+
+def iter_products(db, product_docs, chunk_size=100):
+    """
+    Lazily serializes an iterable of product snapshots (e.g. `query.stream()`),
+    resolving categories with one batched read per `chunk_size` products.
+    Categories already fetched for an earlier chunk are not fetched again.
+    """
+    categories = {}
+    chunk = []
+
+    def flush():
+        missing = [ref for ref in category_refs_to_resolve(chunk) if ref is not None and ref.path not in categories]
+        categories.update(resolve_categories(db, missing))
+        for doc_id, data in chunk:
+            yield serialize_product(doc_id, data, categories)
+        chunk.clear()
+
+    for doc in product_docs:
+        chunk.append((doc.id, doc.to_dict()))
+        if len(chunk) >= chunk_size:
+            yield from flush()
+    yield from flush()
+
+
+def get_fields_param(query_params, allowed):
+    """
+    Reads a sparse fieldset (`?fields=id,name,price`).
+    Returns the set of requested field names, or None when the caller wants every field.
+    Raises InvalidPageParams for a name not in `allowed` (PRODUCT_FIELDS or CATEGORY_FIELDS).
+    """
+    fields = query_params.get('fields')
+    if not fields:
+        return None
+    fields = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = fields - allowed
+    if unknown:
+        raise InvalidPageParams(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return fields
+
+
+def project(item, fields):
+    """Keeps only `fields` (plus the id) of an API item. `fields=None` keeps everything."""
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key == 'id' or key in fields}
+
+
+def product_field_paths(fields, extra=()):
+    """
+    Maps requested product fields to the Firestore field paths to `select()`.
+    The joined `category` comes from the stored category fields; the id is always returned.
+    """
+    paths = set(extra)
+    for field in fields:
+        if field == 'category':
+            paths.update(('categoryRef', 'categoryId', 'categoryName'))
+        elif field != 'id':
+            paths.add(field)
+    # An empty projection would return every field, so ask for the document id alone instead
+    return sorted(paths) or [DOCUMENT_ID]
+
+
+def category_field_paths(fields):
+    """The Firestore field paths to `select()` for the requested category fields (see product_field_paths)."""
+    return sorted(fields - {'id'}) or [DOCUMENT_ID]
+
+
+def filter_products(products, category_id=None, name_query=None):
+    """Applies the product list filters (see ProductViewSet.list) to snapshot products."""
+    if category_id:
+        products = [p for p in products if p.get('category', {}).get('id') == category_id]
+    if name_query:
+        products = [p for p in products if p.get('name', '').startswith(name_query)]
+    return products
+
+
+def catalog_etag(version, full_path):
+    """
+    Builds a strong ETag for a catalog response: the same catalog version and
+    the same URL (path + query string) always produce the same body.
+    """
+    digest = hashlib.sha1(f"{version}:{full_path}".encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def conditional_headers(request, snapshot):
+    """
+    Returns (headers, not_modified) for a catalog read: the Cache-Control and ETag headers to send,
+    and whether the request's If-None-Match already matches that ETag.
+    ETags need a snapshot version, so with `snapshot=None` only Cache-Control is sent.
+    """
+    headers = {'Cache-Control': settings.CATALOG_CACHE_CONTROL}
+    if snapshot is None:
+        return headers, False
+
+    etag = catalog_etag(snapshot.version, request.get_full_path())
+    headers['ETag'] = etag
+    if_none_match = request.headers.get('If-None-Match')
+    not_modified = bool(if_none_match) and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match))
+    return headers, not_modified
+
+
+class CatalogSnapshot:
+    """
+    An immutable view of the catalog at one point in time.
+    Products and categories are sorted by document id.
+    `version` is a hash of the content, so it is the same in every worker holding the same data.
+    """
+    def __init__(self, products, categories):
+        self.products = tuple(sorted(products, key=lambda p: p['id']))
+        self.categories = tuple(sorted(categories, key=lambda c: c['id']))
+        self.products_by_id = {p['id']: p for p in self.products}
+        self.categories_by_id = {c['id']: c for c in self.categories}
+        payload = json.dumps([self.products, self.categories], sort_keys=True, default=str)
+        self.version = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_documents(cls, product_docs, category_docs):
+        """
+        Joins raw `(id, data)` pairs from the products and categories collections.
+        Each category's `productCount` is counted from the products, since products written by the
+        admin UI straight to Firestore don't update the stored counter.
+        """
+        counts = Counter(category_id_of(data) for _, data in product_docs)
+        categories = [{"id": doc_id, **data, "productCount": counts[doc_id]} for doc_id, data in category_docs]
+        categories_by_path = {f"categories/{c['id']}": c for c in categories}
+        products = [serialize_product(doc_id, dict(data), categories_by_path) for doc_id, data in product_docs]
+        return cls(products, categories)
+
+
+class CatalogCache:
+    """
+    Holds the current CatalogSnapshot for this worker process.
+    The snapshot is loaded on first use; after that, reads never wait on Firestore.
+    """
+    def __init__(self, poll_interval=None):
+        self._lock = threading.Lock()
+        self._poll_interval = poll_interval
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._snapshot = None
+        self._watches = []
+        self._poller = None
+        self._stop = threading.Event()
+        self._known_version = None
+        # Latest documents delivered by the listeners, keyed by collection name
+        self._live_docs = {}
+        self._stock_levels = {}
+        # Whether a listener keeps _stock_levels current, else when they were last summed
+        self._stock_live = False
+        self._stock_loaded_at = None
+
+    @property
+    def db(self):
+        return get_db()
+
+    def get(self):
+        """Returns the current snapshot, loading it (and starting the refresh machinery) if needed."""
+        snapshot = self._snapshot
+        if snapshot is not None and self._pid == os.getpid():
+            return snapshot
+
+        with self._lock:
+            self._ensure_started()
+            return self._snapshot
+
+    def peek(self):
+        """Returns this worker's snapshot if it already has one, without ever loading it."""
+        return self._snapshot if self._pid == os.getpid() else None
+
+    def refresh(self):
+        """
+        Rebuilds the snapshot from Firestore right away and tells the other workers about it.
+        Called after every catalog write so the writer reads its own changes.
+        Does nothing (and returns None) when the catalog cache is disabled.
+        """
+        if not settings.CATALOG_CACHE_ENABLED:
+            return None
+        self._bump_version()
+        # The load runs under the lock, so a listener update can't land in the middle and be overwritten
+        with self._lock:
+            if not self._ensure_started():
+                self._snapshot = self._load()
+            return self._snapshot
+
+    def _ensure_started(self):
+        """
+        Loads the first snapshot and starts the refresh machinery if this process hasn't yet.
+        Called with the lock held. Returns whether it loaded the snapshot just now.
+        """
+        if self._pid != os.getpid():
+            # Forked from a process that already had a snapshot (e.g. gunicorn --preload).
+            # Threads and listeners don't survive a fork, so start over.
+            self._reset()
+        if self._snapshot is not None:
+            return False
+        self._snapshot = self._load()
+        self._start_watching()
+        return True
+
+    def _load(self):
+        product_docs = [(doc.id, doc.to_dict()) for doc in self.db.collection('products').stream()]
+        category_docs = [(doc.id, doc.to_dict()) for doc in self.db.collection('categories').stream()]
+        if self._stock_stale():
+            try:
+                self._stock_levels = stock_levels(self.db)
+                self._stock_loaded_at = time.monotonic()
+            except Exception as e:
+                logger.warning("Could not load stock levels: %s", e)
+        return CatalogSnapshot.from_documents(self._with_stock(product_docs), category_docs)
+
+    def _stock_stale(self):
+        """
+        Whether the stock shards need summing again: not while the stock listener keeps them current,
+        nor within CATALOG_STOCK_REFRESH_INTERVAL of the last sum, so catalog writes don't each scan every shard.
+        """
+        if self._stock_live or not getattr(settings, 'STOCK_TRACKING_ENABLED', True):
+            return False
+        interval = getattr(settings, 'CATALOG_STOCK_REFRESH_INTERVAL', 300)
+        return self._stock_loaded_at is None or time.monotonic() - self._stock_loaded_at >= interval
+
+    def _with_stock(self, product_docs):
+        # Remaining stock comes from the sharded counters (see api/stock.py)
+        return [
+            (doc_id, {**data, 'stock': remaining_stock(data, self._stock_levels.get(doc_id))})
+            for doc_id, data in product_docs
+        ]
+
+    def _version_ref(self):
+        return self.db.collection(VERSION_DOC_PATH[0]).document(VERSION_DOC_PATH[1])
+
+    def _bump_version(self):
+        try:
+            self._version_ref().set({'version': firestore.Increment(1)}, merge=True)
+        except Exception as e:
+            logger.warning("Could not bump catalog version: %s", e)
+
+    # --- Refresh machinery ---
+
+    def _start_watching(self):
+        try:
+            self._watches = [
+                self.db.collection(name).on_snapshot(self._make_listener(name))
+                for name in ('products', 'categories')
+            ]
+            if getattr(settings, 'STOCK_TRACKING_ENABLED', True):
+                self._watches.append(self.db.collection_group(SHARDS_COLLECTION).on_snapshot(self._on_stock_snapshot))
+        except Exception as e:
+            logger.warning("Catalog listeners unavailable (%s), falling back to version polling.", e)
+            for watch in self._watches:
+                watch.unsubscribe()
+            self._watches = []
+            self._start_polling()
+
+    def _make_listener(self, collection_name):
+        def on_snapshot(docs, changes, read_time):
+            with self._lock:
+                self._live_docs[collection_name] = [(doc.id, doc.to_dict()) for doc in docs]
+                self._rebuild_live()
+        return on_snapshot
+
+    def _on_stock_snapshot(self, docs, changes, read_time):
+        levels = shard_counts(docs)
+        with self._lock:
+            self._stock_levels = levels
+            self._stock_live = True
+            self._rebuild_live()
+
+    def _rebuild_live(self):
+        # Called with the lock held
+        if len(self._live_docs) < 2:
+            return  # Wait until both collections have reported in
+        self._snapshot = CatalogSnapshot.from_documents(
+            self._with_stock(self._live_docs['products']), self._live_docs['categories']
+        )
+
+    def _start_polling(self):
+        interval = self._poll_interval or getattr(settings, 'CATALOG_POLL_INTERVAL', 30)
+        self._known_version = self._read_version()
+
+        def poll():
+            while not self._stop.wait(interval):
+                try:
+                    version = self._read_version()
+                    if version != self._known_version or self._stock_stale():
+                        with self._lock:
+                            self._snapshot = self._load()
+                            self._known_version = version
+                except Exception as e:
+                    logger.warning("Catalog version poll failed: %s", e)
+
+        self._poller = threading.Thread(target=poll, name='catalog-poller', daemon=True)
+        self._poller.start()
+
+    def _read_version(self):
+        doc = self._version_ref().get()
+        return doc.to_dict().get('version') if doc.exists else None
+
+
+catalog = CatalogCache()
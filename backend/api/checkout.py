@@ -0,0 +1,134 @@
+"""
+The checkout rules shared by the WSGI (views/orders.py) and ASGI (views/orders_async.py)
+versions of `create_order`. Nothing here does I/O: the views fetch the PayPal order, the
+cart prices, the coupon and the redemption record, and these functions decide what they mean.
+"""
+import datetime
+import logging
+from decimal import Decimal
+
+from firebase_admin import firestore
+
+from .pricing import apply_discount, order_items, to_money
+
+DELIVERY_FEE = Decimal('20')
+FREE_DELIVERY_THRESHOLD = Decimal('100')
+AMOUNT_TOLERANCE = Decimal('0.02')
+
+COUPON_ALREADY_USED_MESSAGE = 'קופון זה כבר נוצל על ידי כתובת האימייל שלך.'
+
+# Captured payments that didn't become an order, kept (by PayPal order ID) for an admin to refund
+PAYMENT_REVIEWS_COLLECTION = 'payment_reviews'
+
+# The verbose step-by-step lines of each checkout; sampled by LOG_TRACE_SAMPLE_RATE (see api/logs.py)
+trace = logging.getLogger('api.checkout.trace')
+
+
+def payer_email_from(paypal_details, verified_paypal_order=None):
+    """The payer's email, preferring what the browser sent so coupon checks can start before PayPal answers."""
+    if 'payer' in paypal_details and 'email_address' in paypal_details['payer']:
+        return paypal_details['payer']['email_address']
+    if verified_paypal_order and 'email_address' in verified_paypal_order.get('payer', {}):
+        return verified_paypal_order['payer']['email_address']
+    return None
+
+
+def coupon_discount(coupon_code, found_coupon):
+    """The percentage off `found_coupon` gives right now (0 if it is missing or expired)."""
+    if not found_coupon:
+        trace.info("Coupon '%s' not found or is not active.", coupon_code)
+        return 0
+    expires_at = found_coupon.get('expiresAt')
+    if expires_at and expires_at.timestamp() > datetime.datetime.now().timestamp():
+        return float(found_coupon.get('percentageOff', 0))
+    trace.info("Coupon '%s' has expired.", coupon_code)
+    return 0
+
+
+def order_total(subtotal, discount_percentage, shipping_method):
+    """Cart subtotal with the coupon discount and delivery fee applied."""
+    total = apply_discount(subtotal, discount_percentage) if discount_percentage else subtotal
+    if shipping_method == 'delivery' and total > 0 and total < FREE_DELIVERY_THRESHOLD:
+        total += DELIVERY_FEE # Add the standard shipping fee
+    return total
+
+
+def paid_amount(verified_paypal_order):
+    return to_money(verified_paypal_order["purchase_units"][0]["amount"]["value"])
+
+
+def amount_matches(server_total, verified_paypal_order):
+    # Allow for rounding differences in the browser's total
+    return abs(server_total - paid_amount(verified_paypal_order)) <= AMOUNT_TOLERANCE
+
+
+def payment_review_data(paypal_order_id, verified_paypal_order, reason, message, price_changes=()):
+    """
+    A captured payment that was rejected instead of becoming an order (a stale or tampered price,
+    a product that is gone, or a total PayPal didn't charge). Nothing of the cart is reserved,
+    redeemed or counted; the record and the admin email say what to refund.
+    """
+    purchase_unit = verified_paypal_order.get("purchase_units", [{}])[0]
+    return {
+        "order_id": paypal_order_id,
+        "paypal_capture_id": purchase_unit.get("payments", {}).get("captures", [{}])[0].get("id"),
+        "amount": purchase_unit.get("amount"),
+        "payer_email": verified_paypal_order.get("payer", {}).get("email_address"),
+        "reason": reason,
+        "message": message,
+        "price_changes": list(price_changes),
+        "status": "refund_pending",
+        "created_at": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def build_order_data(paypal_order_id, verified_paypal_order, cart_lines, coupon_code, discount_percentage, shipping_method):
+    purchase_unit = verified_paypal_order.get("purchase_units", [{}])[0]
+    payer_info = verified_paypal_order.get("payer", {})
+
+    return {
+        "order_id": paypal_order_id,
+        "paypal_capture_id": purchase_unit.get("payments", {}).get("captures", [{}])[0].get("id"),
+        "status": verified_paypal_order.get("status"),
+        "amount": purchase_unit.get("amount"),
+        "items": order_items(cart_lines),
+        "payer_email": payer_info.get("email_address"),
+        "customer_name": f"{payer_info.get('name', {}).get('given_name', '')} {payer_info.get('name', {}).get('surname', '')}".strip(),
+        "shipping_address": purchase_unit.get("shipping", {}).get("address", {}),
+        "payment_time": verified_paypal_order.get("create_time"), # or update_time
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "coupon_used": coupon_code if discount_percentage > 0 else None,
+        "discount_percentage": discount_percentage,
+        "shipping_method": shipping_method,
+        "backordered": [],
+        "needs_review": False,
+    }
+
+
+def with_backorders(order_data, backordered):
+    """
+    `order_data` with the lines stock couldn't fully cover (see stock.reserve_stock). The payment is
+    already captured, so the order is still saved, flagged with `needs_review` so the shop can restock
+    or refund.
+    """
+    if not backordered:
+        return order_data
+    return {**order_data, "backordered": backordered, "needs_review": True}
+
+
+def redemption_data(coupon_code, payer_email, paypal_order_id):
+    return {
+        "code": coupon_code,
+        "payer_email": payer_email,
+        "order_id": paypal_order_id,
+        "created_at": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def email_payload(order_data):
+    """The order (or payment review) as queued for the email outbox (the server timestamp sentinel isn't JSON)."""
+    return {k: v for k, v in order_data.items() if k != 'created_at'}
+
+
+def order_created_result(order_data):
+    return {'message': 'Order created successfully', 'paypal_capture_id': order_data.get('paypal_capture_id')}
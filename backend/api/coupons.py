@@ -0,0 +1,129 @@
+"""
+Coupon lookups for checkout.
+
+Active coupons are kept in memory, keyed by code, so applying a coupon doesn't query Firestore.
+Coupons are edited from the admin frontend directly in Firestore, so the table is kept fresh by
+an `on_snapshot` listener on `coupons`; if the listener can't be started, the table is reloaded
+when it is older than COUPON_CACHE_TTL seconds. Codes that aren't found are remembered for
+COUPON_MISS_TTL seconds, so unknown or mistyped codes don't each cost a Firestore query.
+
+Each use of a coupon is recorded as `coupon_redemptions/{code}:{email}`, written in the same
+batch as the order, so "has this email already used this coupon" is a single point read.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .firebase import get_db
+
+REDEMPTIONS_COLLECTION = 'coupon_redemptions'
+# At most this many missing codes are remembered per process
+MAX_REMEMBERED_MISSES = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def redemption_ref(db, coupon_code, payer_email):
+    """The redemption document for a coupon and an email. Emails are compared case-insensitively."""
+    doc_id = f"{coupon_code}:{payer_email.strip().lower()}".replace('/', '%2F')
+    return db.collection(REDEMPTIONS_COLLECTION).document(doc_id)
+
+
+class CouponCache:
+    """Active coupons for this worker process, keyed by code."""
+    def __init__(self, ttl=None):
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._coupons = None
+        self._loaded_at = 0
+        self._watch = None
+        # Code -> time.monotonic() until which it is known not to exist
+        self._misses = {}
+
+    @property
+    def db(self):
+        return get_db()
+
+    @property
+    def ttl(self):
+        return self._ttl or getattr(settings, 'COUPON_CACHE_TTL', 60)
+
+    @property
+    def miss_ttl(self):
+        return getattr(settings, 'COUPON_MISS_TTL', 10)
+
+    def get(self, code):
+        """Returns the active coupon with this code, or None."""
+        coupon = self._table().get(code)
+        if coupon is not None:
+            return coupon
+        now = time.monotonic()
+        if self._misses.get(code, 0) > now:
+            return None
+
+        # The listener may not have delivered a coupon created moments ago, so ask Firestore
+        coupon = self._query(code)
+        with self._lock:
+            if coupon is not None:
+                self._coupons = {**self._coupons, code: coupon}
+                return coupon
+            if len(self._misses) >= MAX_REMEMBERED_MISSES:
+                self._misses = {c: until for c, until in self._misses.items() if until > now}
+                if len(self._misses) >= MAX_REMEMBERED_MISSES:
+                    self._misses = {}
+            self._misses[code] = now + self.miss_ttl
+        return None
+
+    def _table(self):
+        coupons = self._coupons
+        if coupons is not None and self._pid == os.getpid() and (self._watch or time.monotonic() - self._loaded_at < self.ttl):
+            return coupons
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Listeners don't survive a fork
+                self._reset()
+            if self._coupons is None or (not self._watch and time.monotonic() - self._loaded_at >= self.ttl):
+                self._coupons = self._build(self.db.collection('coupons').where('isActive', '==', True).stream())
+                self._loaded_at = time.monotonic()
+                if self._watch is None:
+                    self._start_watching()
+            return self._coupons
+
+    def _query(self, code):
+        query = self.db.collection('coupons').where('code', '==', code).where('isActive', '==', True).limit(1)
+        for coupon_doc in query.stream():
+            return coupon_doc.to_dict()
+        return None
+
+    @staticmethod
+    def _build(docs):
+        coupons = {}
+        for doc in docs:
+            coupon = doc.to_dict()
+            if coupon.get('isActive') is True and coupon.get('code'):
+                coupons.setdefault(coupon['code'], coupon)
+        return coupons
+
+    def _start_watching(self):
+        def on_snapshot(docs, changes, read_time):
+            coupons = self._build(docs)
+            with self._lock:
+                self._coupons = coupons
+                self._loaded_at = time.monotonic()
+
+        try:
+            self._watch = self.db.collection('coupons').on_snapshot(on_snapshot)
+        except Exception as e:
+            logger.warning("Coupon listener unavailable (%s), reloading coupons every %ss.", e, self.ttl)
+            self._watch = False
+
+
+coupon_cache = CouponCache()
@@ -0,0 +1,109 @@
+"""
+The backend's single way of getting at Firebase.
+
+`initialize_firebase()` sets up the Firebase Admin app from the credentials in the environment
+(or backend/.env) once per process. `get_db()` and `get_async_db()` return this process's shared
+Firestore clients, creating them on first use.
+
+The clients are created lazily and per process: gRPC channels don't survive a fork, so a worker
+forked from a process that already had a client (e.g. gunicorn --preload) creates its own.
+This module doesn't import Django, so scripts can use it too.
+"""
+import logging
+import os
+import threading
+
+import firebase_admin
+from dotenv import load_dotenv
+from firebase_admin import credentials
+from google.cloud import firestore
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CREDENTIAL_ENV_VARS = {
+    "type": "TYPE",
+    "project_id": "PROJECT_ID",
+    "private_key_id": "PRIVATE_KEY_ID",
+    "private_key": "PRIVATE_KEY",
+    "client_email": "CLIENT_EMAIL",
+    "client_id": "CLIENT_ID",
+    "auth_uri": "AUTH_URI",
+    "token_uri": "TOKEN_URI",
+    "auth_provider_x509_cert_url": "AUTH_PROVIDER_X509_CERT_URL",
+    "client_x509_cert_url": "CLIENT_X509_CERT_URL",
+    "universe_domain": "UNIVERSE_DOMAIN",
+}
+
+_lock = threading.Lock()
+_clients = {}
+_clients_pid = None
+
+logger = logging.getLogger(__name__)
+
+
+def credentials_from_env():
+    """Builds the service account info from environment variables, loading backend/.env first."""
+    load_dotenv(os.path.join(BACKEND_DIR, '.env'))
+    creds = {key: os.getenv(env_var) for key, env_var in CREDENTIAL_ENV_VARS.items()}
+    creds['private_key'] = (creds['private_key'] or '').replace('\\n', '\n')
+    return creds
+
+
+def initialize_firebase():
+    """
+    Initializes the Firebase Admin app if it isn't already, and returns it.
+    Raises ValueError if any credential is missing.
+    """
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+
+    with _lock:
+        if firebase_admin._apps:
+            return firebase_admin.get_app()
+        creds = credentials_from_env()
+        if not all(creds.values()):
+            raise ValueError("Missing one or more Firebase credentials in .env file.")
+        app = firebase_admin.initialize_app(credentials.Certificate(creds))
+        logger.info("Firebase App initialized successfully.")
+        return app
+
+
+def _get_client(kind, client_class):
+    global _clients_pid
+    client = _clients.get(kind)
+    if client is not None and _clients_pid == os.getpid():
+        return client
+
+    app = initialize_firebase()
+    with _lock:
+        if _clients_pid != os.getpid():
+            # New process (or first use): never reuse a client created before a fork
+            _clients.clear()
+            _clients_pid = os.getpid()
+        if kind not in _clients:
+            _clients[kind] = client_class(credentials=app.credential.get_credential(), project=app.project_id)
+        return _clients[kind]
+
+
+def get_db():
+    """Returns this process's shared Firestore client."""
+    return _get_client('sync', firestore.Client)
+
+
+def get_async_db():
+    """
+    Returns this process's shared Firestore AsyncClient.
+    Its channel belongs to the event loop it is first used on, so only use it under ASGI.
+    """
+    return _get_client('async', firestore.AsyncClient)
+
+
+def _reset_after_fork():
+    # Drop the parent's clients (and a lock it may have been holding) in forked children right away
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,73 @@
+"""
+Short-lived, per-process memory of completed requests, keyed by an idempotency key.
+
+Checkout uses it with the PayPal order ID: a retried or double-clicked submission gets the
+stored result straight back. Concurrent submissions with the same key are serialized, so the
+second one waits for the first and then finds its result here.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+
+class RecentResults:
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._key_locks = {}
+        self._async_key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the stored result for `key`, or None if there isn't one (or it expired)."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._results[key]
+                return None
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = (time.monotonic(), result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    @contextmanager
+    def lock(self, key):
+        """Holds the lock for `key` so only one request per key is processed at a time in this process."""
+        with self._lock:
+            key_lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (key_lock, waiters + 1)
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (key_lock, waiters - 1)
+
+    @asynccontextmanager
+    async def async_lock(self, key):
+        """lock() for async views: waiting for another request with the same key doesn't block the event loop."""
+        key_lock, waiters = self._async_key_locks.get(key, (asyncio.Lock(), 0))
+        self._async_key_locks[key] = (key_lock, waiters + 1)
+        try:
+            async with key_lock:
+                yield
+        finally:
+            key_lock, waiters = self._async_key_locks[key]
+            if waiters == 1:
+                del self._async_key_locks[key]
+            else:
+                self._async_key_locks[key] = (key_lock, waiters - 1)
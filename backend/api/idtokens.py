@@ -0,0 +1,197 @@
+"""
+Verifies Firebase ID tokens locally, against a process-wide store of Google's public signing keys.
+
+firebase_admin's `auth.verify_id_token` fetches Google's certificates on the request thread when
+its cache is cold or stale. Here the keys are kept by a `GoogleKeyStore`, which fetches them when
+the worker starts (see api/apps.py) and refreshes them from a background thread shortly before
+the `Cache-Control: max-age` Google sends runs out. Verification itself is one RSA signature
+check plus the claim checks Firebase documents, with no I/O.
+
+The key store is pluggable: `StaticKeyStore` holds fixed keys, e.g. a local key pair for tests
+and benchmarks (`id_token_verifier.key_store = StaticKeyStore({...})`).
+Errors are firebase_admin's own exceptions, so callers handle them as before.
+This module doesn't import Django, so scripts can use it too.
+"""
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+from firebase_admin import auth
+from google.auth import crypt
+from requests.adapters import HTTPAdapter
+
+from .firebase import credentials_from_env
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+CLOCK_SKEW_SECONDS = 10
+REQUEST_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+def max_age(cache_control, default=3600):
+    """The max-age, in seconds, of a Cache-Control header value."""
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else default
+
+
+class StaticKeyStore:
+    """A fixed set of keys: {key id: PEM certificate or public key}."""
+    def __init__(self, keys):
+        self._verifiers = {kid: crypt.RSAVerifier.from_string(pem) for kid, pem in keys.items()}
+
+    def start(self):
+        pass
+
+    def get(self, kid):
+        return self._verifiers.get(kid)
+
+
+class GoogleKeyStore:
+    """
+    Google's token signing certificates, kept fresh by a background thread in each process.
+    Requests only wait for a fetch while this worker's first one is in flight (for at most
+    `first_load_wait` seconds); a key ID it hasn't seen triggers a background refresh.
+    """
+    def __init__(self, url=GOOGLE_CERTS_URL, refresh_margin=300, retry_interval=30,
+                 min_refresh_interval=60, first_load_wait=5):
+        self.url = url
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.first_load_wait = first_load_wait
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _reset(self):
+        self._verifiers = {}
+        self._fetched_at = None
+        self._refresh_at = 0
+        self._first_fetch_done = threading.Event()
+        self._wakeup = threading.Event()
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    def start(self):
+        """Starts this process's refresh thread (the first fetch happens right away)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._reset()
+            threading.Thread(target=self._run, name='id-token-keys', daemon=True).start()
+            # Published last: get() skips the lock once it sees this pid, so everything it reads must exist by then
+            self._pid = os.getpid()
+
+    def get(self, kid):
+        self.start()
+        if not self._first_fetch_done.is_set():
+            self._first_fetch_done.wait(self.first_load_wait)
+        verifier = self._verifiers.get(kid)
+        if verifier is None:
+            self.request_refresh()
+        return verifier
+
+    def request_refresh(self):
+        """Asks the refresh thread to fetch the keys now, unless it just did."""
+        if self._fetched_at is None or time.monotonic() - self._fetched_at >= self.min_refresh_interval:
+            self._wakeup.set()
+
+    def refresh(self):
+        response = self._session.get(self.url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        verifiers = {kid: crypt.RSAVerifier.from_string(pem) for kid, pem in response.json().items()}
+        lifetime = max_age(response.headers.get('Cache-Control'))
+        self._verifiers = verifiers
+        self._fetched_at = time.monotonic()
+        self._refresh_at = self._fetched_at + max(self.min_refresh_interval, lifetime - self.refresh_margin)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                delay = self._refresh_at - time.monotonic()
+            except Exception as e:
+                logger.warning("Could not fetch Firebase token signing keys: %s", e)
+                delay = self.retry_interval
+            self._first_fetch_done.set()
+            self._wakeup.wait(max(0, delay))
+            self._wakeup.clear()
+
+
+class IdTokenVerifier:
+    def __init__(self, key_store=None, project_id=None):
+        self.key_store = key_store or GoogleKeyStore()
+        self.project_id = project_id
+
+    def _project_id(self):
+        if self.project_id is None:
+            self.project_id = credentials_from_env()['project_id']
+        return self.project_id
+
+    def verify(self, token):
+        """
+        Verifies a Firebase ID token and returns its claims, with `uid` set like firebase_admin does.
+        Raises auth.InvalidIdTokenError, or auth.ExpiredIdTokenError for a token past its `exp`.
+        """
+        if os.getenv('FIREBASE_AUTH_EMULATOR_HOST'):
+            # Emulator tokens aren't signed; firebase_admin knows how to check them
+            return auth.verify_id_token(token)
+
+        try:
+            encoded = token.encode('ascii') if isinstance(token, str) else token
+            signed_part, signature = encoded.rsplit(b'.', 1)
+            header_segment, payload_segment = signed_part.split(b'.')
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature)
+        except (ValueError, UnicodeError) as e:
+            raise auth.InvalidIdTokenError(f'Malformed ID token: {e}', e)
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise auth.InvalidIdTokenError('Malformed ID token.')
+
+        if header.get('alg') != 'RS256' or not header.get('kid'):
+            raise auth.InvalidIdTokenError('ID token has an unexpected algorithm or no key ID.')
+        verifier = self.key_store.get(header['kid'])
+        if verifier is None:
+            raise auth.InvalidIdTokenError('ID token was signed by an unknown key.')
+        if not verifier.verify(signed_part, signature):
+            raise auth.InvalidIdTokenError('ID token has an invalid signature.')
+
+        project_id = self._project_id()
+        now = time.time()
+        if claims.get('aud') != project_id:
+            raise auth.InvalidIdTokenError('ID token has an incorrect audience.')
+        if claims.get('iss') != ISSUER_PREFIX + project_id:
+            raise auth.InvalidIdTokenError('ID token has an incorrect issuer.')
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError('ID token has an invalid subject.')
+        if not isinstance(claims.get('iat'), (int, float)) or claims['iat'] > now + CLOCK_SKEW_SECONDS:
+            raise auth.InvalidIdTokenError('ID token was issued in the future.')
+        if not isinstance(claims.get('exp'), (int, float)):
+            raise auth.InvalidIdTokenError('ID token has no expiry.')
+        if claims['exp'] <= now - CLOCK_SKEW_SECONDS:
+            raise auth.ExpiredIdTokenError('ID token has expired.', None)
+
+        claims['uid'] = subject
+        return claims
+
+
+id_token_verifier = IdTokenVerifier()
+
+
+def verify_id_token(token):
+    return id_token_verifier.verify(token)
@@ -0,0 +1,169 @@
+"""
+Structured logging for the backend.
+
+Every record is written as one JSON object per line to stdout, with the ID of the request it was
+logged from. Request threads never write to stdout themselves: `QueueLogHandler` puts records on a
+queue and a listener thread does the formatting and I/O.
+
+Each request gets an ID from RequestIdMiddleware: the incoming `X-Request-ID` header if there is one,
+otherwise a new one. It is echoed back in the response. The verbose per-order lines are logged to the
+`api.checkout.trace` logger. `SamplingFilter` keeps them for only LOG_TRACE_SAMPLE_RATE of requests,
+always all or none of one request's lines, so a sampled order can be followed end to end.
+"""
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps each record with the current request's ID (None outside requests)."""
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps records for a `rate` fraction of requests, chosen by a hash of the request ID."""
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if self.rate >= 1:
+            return True
+        if self.rate <= 0:
+            return False
+        request_id = getattr(record, 'request_id', None) or request_id_var.get()
+        if request_id is None:
+            return True
+        return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hands records to a listener thread that writes them to stdout as JSON.
+    The listener is (re)started lazily in each process, since threads don't survive a fork.
+    """
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        self.addFilter(RequestIdFilter())
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue.maxsize)
+            output = logging.StreamHandler(sys.stdout)
+            output.setFormatter(JsonFormatter())
+            self._listener = QueueListener(self.queue, output, respect_handler_level=False)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, keep the record's `extra` fields for the JSON formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Drop the record rather than block the request
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def close(self):
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+        super().close()
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """Gives every request an ID (see the module docstring) for its log records and its response."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _request_id(self, request):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        return incoming[:64] if incoming and incoming.isprintable() else new_request_id()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request_id = self._request_id(request)
+        token = request_id_var.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self._request_id(request)
+        token = request_id_var.set(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from firebase_admin import firestore
+
+from api.coupons import redemption_ref
+from api.firebase import get_db
+
+# Firestore commits at most 500 writes per batch
+BATCH_LIMIT = 500
+
+
+class Command(BaseCommand):
+    help = ('Creates a "coupon_redemptions" document for every existing order that used a coupon, '
+            'so orders placed before redemptions were recorded still count. Safe to run more than once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        try:
+            db = get_db()
+            redemptions = {}
+            for doc in db.collection('orders').where('coupon_used', '!=', None).stream():
+                order = doc.to_dict()
+                if not order.get('coupon_used') or not order.get('payer_email'):
+                    continue
+                ref = redemption_ref(db, order['coupon_used'], order['payer_email'])
+                redemptions.setdefault(ref.path, (ref, {
+                    'code': order['coupon_used'],
+                    'payer_email': order['payer_email'],
+                    'order_id': order.get('order_id'),
+                    'created_at': order.get('created_at') or firestore.SERVER_TIMESTAMP,
+                }))
+
+            refs = [ref for ref, _ in redemptions.values()]
+            existing = {snapshot.reference.path for snapshot in db.get_all(refs) if snapshot.exists} if refs else set()
+            missing = [value for path, value in redemptions.items() if path not in existing]
+            self.stdout.write(self.style.SUCCESS(
+                f'Found {len(redemptions)} coupon redemptions in orders, {len(missing)} not yet recorded.'
+            ))
+            if dry_run:
+                self.stdout.write(self.style.NOTICE(f'Dry run: {len(missing)} documents would be created.'))
+                return
+
+            for start in range(0, len(missing), BATCH_LIMIT):
+                batch = db.batch()
+                for ref, fields in missing[start:start + BATCH_LIMIT]:
+                    batch.set(ref, fields)
+                batch.commit()
+
+            self.stdout.write(self.style.SUCCESS(f'Successfully created {len(missing)} documents.'))
+
+        except Exception as e:
+            raise CommandError(f'An error occurred: {e}')
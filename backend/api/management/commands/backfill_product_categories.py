@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.firebase import get_db
+
+# Firestore commits at most 500 writes per batch
+BATCH_LIMIT = 500
+
+
+class Command(BaseCommand):
+    help = ('Writes the denormalized "categoryId" and "categoryName" onto every product document '
+            'and recomputes "productCount" on every category. Safe to run more than once; run it on a '
+            'schedule to repair products the admin UI writes straight to Firestore.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        try:
+            db = get_db()
+            categories = {doc.id: doc.to_dict() for doc in db.collection('categories').stream()}
+            self.stdout.write(self.style.SUCCESS(f'Found {len(categories)} categories.'))
+
+            updates = []
+            counts = {category_id: 0 for category_id in categories}
+            orphans = 0
+            for doc in db.collection('products').stream():
+                product = doc.to_dict()
+                category_ref = product.get('categoryRef')
+                category_id = category_ref.id if category_ref is not None else product.get('categoryId')
+                if category_id not in categories:
+                    orphans += 1
+                    continue
+
+                counts[category_id] += 1
+                fields = {'categoryId': category_id, 'categoryName': categories[category_id].get('name')}
+                if any(product.get(key) != value for key, value in fields.items()):
+                    updates.append((doc.reference, fields))
+
+            updates += [
+                (db.collection('categories').document(category_id), {'productCount': count})
+                for category_id, count in counts.items()
+                if categories[category_id].get('productCount') != count
+            ]
+
+            if orphans:
+                self.stdout.write(self.style.WARNING(f'Skipped {orphans} products whose category does not exist.'))
+            if dry_run:
+                self.stdout.write(self.style.NOTICE(f'Dry run: {len(updates)} documents would be updated.'))
+                return
+
+            for start in range(0, len(updates), BATCH_LIMIT):
+                batch = db.batch()
+                for doc_ref, fields in updates[start:start + BATCH_LIMIT]:
+                    batch.update(doc_ref, fields)
+                batch.commit()
+
+            self.stdout.write(self.style.SUCCESS(f'Successfully updated {len(updates)} documents.'))
+
+        except Exception as e:
+            raise CommandError(f'An error occurred: {e}')
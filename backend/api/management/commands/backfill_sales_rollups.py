@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.firebase import get_db
+from api.rollups import ROLLUPS_COLLECTION, add_rollup, empty_rollup, period_keys, sale_totals
+
+# Firestore commits at most 500 writes per batch
+BATCH_LIMIT = 500
+
+
+class Command(BaseCommand):
+    help = ('Builds the sales rollups for orders placed before --before (e.g. when rollups were deployed); '
+            'newer orders are already counted by checkout. Each period gets one extra "backfill" shard, '
+            'overwritten on every run, so it is safe to run more than once with the same --before. '
+            'Revenue is written as whole cents (`revenue_cents`), like the rollups checkout writes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=str, required=True,
+                            help='Only count orders created before this ISO datetime (when rollups went live).')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything.')
+
+    def handle(self, *args, **options):
+        before = parse_datetime(options['before'])
+        if before is None:
+            raise CommandError('--before must be an ISO datetime, e.g. 2024-05-01T12:00:00+03:00.')
+        if timezone.is_naive(before):
+            before = timezone.make_aware(before)
+
+        try:
+            db = get_db()
+            rollups = {}
+            counted = 0
+            query = db.collection('orders').where('created_at', '<', before).select(
+                ['amount', 'items', 'coupon_used', 'shipping_method', 'created_at']
+            )
+            for doc in query.stream():
+                order = doc.to_dict()
+                totals = sale_totals(order)
+                for key in period_keys(order['created_at']):
+                    add_rollup(rollups.setdefault(key, empty_rollup()), totals)
+                counted += 1
+
+            self.stdout.write(self.style.SUCCESS(f'Counted {counted} orders into {len(rollups)} daily and weekly periods.'))
+            if options['dry_run']:
+                self.stdout.write(self.style.NOTICE(f'Dry run: {len(rollups)} rollup documents would be written.'))
+                return
+
+            items = list(rollups.items())
+            for start in range(0, len(items), BATCH_LIMIT):
+                batch = db.batch()
+                for key, rollup in items[start:start + BATCH_LIMIT]:
+                    batch.set(db.collection(ROLLUPS_COLLECTION).document(f'{key}_backfill'), {'period': key, **rollup})
+                batch.commit()
+
+            self.stdout.write(self.style.SUCCESS(f'Successfully wrote {len(items)} rollup documents.'))
+
+        except Exception as e:
+            raise CommandError(f'An error occurred: {e}')
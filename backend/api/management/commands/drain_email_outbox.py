@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.outbox import email_outbox
+# Registers the 'order_emails' sender
+import api.views.orders  # noqa: F401
+
+
+class Command(BaseCommand):
+    help = 'Sends every order email that is due in the outbox, e.g. after a deploy or from cron.'
+
+    def handle(self, *args, **options):
+        try:
+            sent = 0
+            while email_outbox.process_next():
+                sent += 1
+            stats = email_outbox.stats()
+            self.stdout.write(self.style.SUCCESS(f'Processed {sent} email jobs.'))
+            if stats['pending'] or stats['failed']:
+                self.stdout.write(self.style.WARNING(
+                    f"{stats['pending']} jobs still pending (waiting to retry), {stats['failed']} failed."
+                ))
+        except Exception as e:
+            raise CommandError(f'An error occurred: {e}')
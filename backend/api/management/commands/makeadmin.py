@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
-from firebase_admin import auth, firestore
+from firebase_admin import auth
+
+from api.firebase import get_db
 
 class Command(BaseCommand):
     help = 'Grants admin privileges to a Firebase user by adding them to the "admins" collection and setting a custom claim.'
@@ -20,7 +22,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('Set custom claim "isAdmin: True" on the user.'))
 
             # Add the user to the 'admins' collection in Firestore
-            db = firestore.client()
+            db = get_db()
             admin_ref = db.collection('admins').document(uid)
             admin_ref.set({'email': email, 'isSuperAdmin': False}) # You can extend this later
             
@@ -0,0 +1,172 @@
+"""
+In-process latency metrics.
+
+`span(name)` times a stage of the current request. Each stage is recorded twice: in a histogram
+for this worker (`registry`, served by the admin metrics endpoint), and in the request's own
+timings, which `timed_view` sends back as a `Server-Timing` header so a single slow request can
+be broken down from the browser's devtools. The request's timings live in a context variable,
+so spans work the same in sync views and in coroutines run with asyncio.gather.
+
+Histograms are per worker process; every worker reports its own.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+_current_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations (None when empty)."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total / self.count, 3) if self.count else None,
+                "p50_ms": self.percentile(0.5),
+                "p90_ms": self.percentile(0.9),
+                "p99_ms": self.percentile(0.99),
+                "max_ms": round(self.max, 3),
+                "buckets": {
+                    ('+Inf' if bound == float('inf') else str(bound)): count
+                    for bound, count in zip(self.buckets, self.counts)
+                },
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, value_ms):
+        self.histogram(name).observe(value_ms)
+
+    def snapshot(self):
+        return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+
+registry = MetricsRegistry()
+
+
+class span:
+    """
+    Times the enclosed block as stage `name` of the current request: `with span('paypal'): ...`.
+    The histogram is named '<prefix>.<name>', with the prefix given to timed_view.
+    """
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+            registry.observe(f"{timings.prefix}.{self.name}", elapsed)
+        else:
+            registry.observe(self.name, elapsed)
+        return False
+
+
+class RequestTimings(list):
+    """The (stage, milliseconds) spans recorded during one request."""
+    def __init__(self, prefix):
+        super().__init__()
+        self.prefix = prefix
+
+    def server_timing(self, total_ms):
+        entries = [f"{name};dur={elapsed:.1f}" for name, elapsed in self]
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+
+def _finish(timings, started, response):
+    total = (time.perf_counter() - started) * 1000
+    registry.observe(f"{timings.prefix}.total", total)
+    response['Server-Timing'] = timings.server_timing(total)
+    return response
+
+
+def timed_view(prefix):
+    """
+    Decorator for a view (sync or async): records its stages under `prefix`, its total time as
+    '<prefix>.total', and adds a Server-Timing header to its response.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                timings = RequestTimings(prefix)
+                token = _current_timings.set(timings)
+                started = time.perf_counter()
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    _current_timings.reset(token)
+                return _finish(timings, started, response)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timings = RequestTimings(prefix)
+            token = _current_timings.set(timings)
+            started = time.perf_counter()
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                _current_timings.reset(token)
+            return _finish(timings, started, response)
+        return wrapper
+    return decorator
+
+
+async def timed(name, awaitable):
+    """Awaits `awaitable` inside span(name); for timing coroutines passed to asyncio.gather."""
+    with span(name):
+        return await awaitable
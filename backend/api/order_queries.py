@@ -0,0 +1,114 @@
+"""
+Filtering and paging of the Firestore `orders` collection for the admin order listing.
+
+Every filter becomes part of the Firestore query, and pages are read with `start_after` cursors
+ordered by `created_at` (newest first), so a page costs `limit` reads however many orders exist.
+The equality filters combined with that ordering need the composite indexes in
+firestore.indexes.json at the repository root.
+"""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .pagination import InvalidPageParams, get_page_params, next_cursor_for, paginate_query
+
+DEFAULT_PAGE_SIZE = 50
+ORDER_FIELDS = ('created_at',)
+
+# What the listing returns for each order unless `view=full` is asked for
+SUMMARY_FIELDS = (
+    'order_id', 'created_at', 'status', 'amount', 'payer_email', 'customer_name',
+    'shipping_method', 'coupon_used', 'discount_percentage', 'needs_review',
+)
+
+# Query parameter -> order field, for the exact-match filters
+EQUALITY_FILTERS = {
+    'status': 'status',
+    'shipping_method': 'shipping_method',
+    'coupon': 'coupon_used',
+    'needs_review': 'needs_review',
+}
+
+
+def parse_bound(value, end_of_day=False):
+    """
+    Parses a `created_from`/`created_to` value: an ISO date or datetime (naive ones are in TIME_ZONE).
+    A bare date stands for the start of that day, or with `end_of_day` the start of the next one.
+    """
+    try:
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else None
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        parsed = datetime.datetime.combine(day + datetime.timedelta(days=1 if end_of_day else 0), datetime.time())
+    elif parsed is None:
+        raise InvalidPageParams(f"Invalid date: {value!r}.")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def get_order_filters(query_params):
+    """
+    Reads the listing filters from the request. Returns (equality filters {field: value}, from, to).
+    `coupon=none` matches orders without a coupon; `needs_review` takes `true` or `false`.
+    """
+    equals = {}
+    for param, field in EQUALITY_FILTERS.items():
+        value = query_params.get(param)
+        if not value:
+            continue
+        if field == 'needs_review':
+            if value not in ('true', 'false'):
+                raise InvalidPageParams("needs_review must be 'true' or 'false'.")
+            value = value == 'true'
+        equals[field] = None if field == 'coupon_used' and value == 'none' else value
+
+    created_from = query_params.get('created_from')
+    created_to = query_params.get('created_to')
+    created_from = parse_bound(created_from) if created_from else None
+    created_to = parse_bound(created_to, end_of_day=True) if created_to else None
+    return equals, created_from, created_to
+
+
+def get_listing_params(query_params):
+    """Returns (limit, cursor values, view) for the order listing; `limit` defaults to DEFAULT_PAGE_SIZE."""
+    limit, cursor = get_page_params(query_params)
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if cursor is not None:
+        # Cursors carry created_at as a string (see pagination.encode_cursor)
+        try:
+            created_at = parse_datetime(str(cursor.get('created_at')))
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            raise InvalidPageParams('Invalid cursor.')
+        cursor['created_at'] = created_at
+    view = query_params.get('view', 'summary')
+    if view not in ('summary', 'full'):
+        raise InvalidPageParams("view must be 'summary' or 'full'.")
+    return limit, cursor, view
+
+
+def orders_page_query(orders_ref, equals, created_from, created_to, limit, cursor, view):
+    """Builds the Firestore query for one page of orders, newest first."""
+    query = orders_ref
+    for field, value in equals.items():
+        query = query.where(field, '==', value)
+    if created_from is not None:
+        query = query.where('created_at', '>=', created_from)
+    if created_to is not None:
+        query = query.where('created_at', '<', created_to)
+    if view == 'summary':
+        query = query.select(list(SUMMARY_FIELDS))
+    return paginate_query(query, orders_ref, limit, cursor, ORDER_FIELDS, descending=True)
+
+
+def orders_page(docs, limit):
+    """Turns the `(id, data)` pairs of an orders_page_query into (orders, next_cursor)."""
+    docs, next_cursor = next_cursor_for(docs, limit, ORDER_FIELDS)
+    return [{"id": doc_id, **data} for doc_id, data in docs], next_cursor
+
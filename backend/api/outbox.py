@@ -0,0 +1,209 @@
+"""
+Durable local outbox for order confirmation emails.
+
+`create_order` only writes the order into a SQLite file (EMAIL_OUTBOX_PATH) and returns; a small
+pool of daemon threads in each worker process drains it in the background. The threads start with
+the worker (see api/apps.py start_worker_threads), so jobs left over from a restart go out without
+waiting for a new order. Both emails of an
+order go out through one email backend connection (`send_messages`). A failed send is retried
+with exponential backoff, and after EMAIL_OUTBOX_MAX_ATTEMPTS the job is kept as 'failed' so it
+can be inspected rather than lost.
+
+Jobs are claimed with a lease (`locked_until`), so several gunicorn workers can share the file,
+and a job whose worker died mid-send is picked up again once the lease runs out.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .metrics import span
+
+# A claimed job is invisible to other workers for this long
+LEASE_SECONDS = 120
+# Longest a worker sleeps before checking for new or retryable jobs
+IDLE_POLL_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS email_jobs_due ON email_jobs (status, next_attempt_at);
+"""
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number `attempts`: exponential, capped, with jitter."""
+    delay = min(settings.EMAIL_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class EmailOutbox:
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._workers_pid = None
+        self._schema_ready = False
+        self._senders = {}
+
+    @property
+    def path(self):
+        return str(self._path or settings.EMAIL_OUTBOX_PATH)
+
+    def register(self, kind, build_messages):
+        """Registers `build_messages(payload) -> [EmailMessage]` for jobs of type `kind`."""
+        self._senders[kind] = build_messages
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def enqueue(self, kind, payload):
+        """Stores a job durably and wakes a worker. Returns the job id."""
+        if kind not in self._senders:
+            raise ValueError(f"No sender registered for email job '{kind}'.")
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO email_jobs (kind, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, default=str), now, now),
+            )
+            job_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def _claim(self):
+        """Leases the next due job, or returns None. BEGIN IMMEDIATE keeps two workers from claiming the same one."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM email_jobs "
+                    "WHERE status = 'pending' AND next_attempt_at <= ? AND locked_until <= ? "
+                    "ORDER BY next_attempt_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE email_jobs SET locked_until = ? WHERE id = ?", (now + LEASE_SECONDS, row[0]))
+                conn.execute("COMMIT")
+            except Exception:
+                # Only reached once BEGIN succeeded, so there is a transaction to roll back
+                conn.execute("ROLLBACK")
+                raise
+            return row
+        finally:
+            conn.close()
+
+    def _complete(self, job_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM email_jobs WHERE id = ?", (job_id,))
+        finally:
+            conn.close()
+
+    def _fail(self, job_id, attempts, error):
+        status = 'failed' if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS else 'pending'
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE email_jobs SET status = ?, attempts = ?, next_attempt_at = ?, locked_until = 0, last_error = ? "
+                "WHERE id = ?",
+                (status, attempts, time.time() + backoff_delay(attempts), str(error)[:1000], job_id),
+            )
+        finally:
+            conn.close()
+        return status
+
+    def process_next(self):
+        """Sends the next due job. Returns False when nothing was due."""
+        job = self._claim()
+        if job is None:
+            return False
+
+        job_id, kind, payload, attempts = job
+        try:
+            messages = self._senders[kind](json.loads(payload))
+            connection = get_connection(fail_silently=False)
+            with span('email.send'):
+                connection.send_messages(messages)
+        except Exception as e:
+            status = self._fail(job_id, attempts + 1, e)
+            logger.error(
+                "Email job %s (%s) failed on attempt %s, now %s: %s", job_id, kind, attempts + 1, status, e,
+                extra={'job_id': job_id, 'kind': kind, 'attempts': attempts + 1, 'status': status},
+            )
+        else:
+            self._complete(job_id)
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self.process_next():
+                    continue
+            except Exception as e:
+                logger.exception("Email outbox worker error: %s", e)
+            self._wakeup.wait(IDLE_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self):
+        """Starts this process's worker threads if they aren't running (threads don't survive a fork)."""
+        if self._workers_pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            for i in range(settings.EMAIL_OUTBOX_WORKERS):
+                threading.Thread(target=self._run, name=f'email-outbox-{i}', daemon=True).start()
+            self._workers_pid = os.getpid()
+
+    def stats(self):
+        """Queue depth and age, for the admin metrics endpoint."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT status, COUNT(*), MIN(created_at), SUM(locked_until > ?) FROM email_jobs GROUP BY status",
+                (now,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        stats = {'pending': 0, 'in_flight': 0, 'failed': 0, 'oldest_pending_age_seconds': None}
+        for status, count, oldest, in_flight in rows:
+            stats[status] = count
+            if status == 'pending':
+                stats['in_flight'] = in_flight or 0
+                stats['oldest_pending_age_seconds'] = round(now - oldest, 3)
+        return stats
+
+
+email_outbox = EmailOutbox()
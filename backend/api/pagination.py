@@ -0,0 +1,155 @@
+"""
+Cursor pagination and streaming helpers for list endpoints.
+
+Cursors are opaque to clients: a urlsafe base64 encoding of the ordering values of the
+last item on the page. On the Firestore path they feed `start_after`, so a page costs
+`limit` reads no matter how deep into the listing it is.
+"""
+import base64
+import binascii
+import bisect
+import json
+
+from django.http import StreamingHttpResponse
+from google.cloud.firestore import Query
+from google.cloud.firestore_v1.field_path import FieldPath
+from rest_framework.utils.encoders import JSONEncoder
+
+MAX_PAGE_SIZE = 500
+DOCUMENT_ID = FieldPath.document_id()
+
+
+class InvalidPageParams(ValueError):
+    """Raised when a listing parameter (`limit`, `cursor`, `fields`, ...) can't be parsed."""
+
+
+def encode_cursor(values):
+    """Encodes a dict of ordering values (e.g. {'__name__': <doc id>}) into an opaque token."""
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Reverses encode_cursor. Raises InvalidPageParams for malformed tokens."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, ValueError, UnicodeError):
+        raise InvalidPageParams('Invalid cursor.')
+    if not isinstance(values, dict) or DOCUMENT_ID not in values:
+        raise InvalidPageParams('Invalid cursor.')
+    return values
+
+
+def get_page_params(query_params):
+    """
+    Reads `?limit=` and `?cursor=` from the request.
+    Returns (limit, cursor_values); limit is None when the caller didn't ask for pagination.
+    """
+    limit = query_params.get('limit')
+    cursor = query_params.get('cursor')
+    if limit is None:
+        if cursor:
+            raise InvalidPageParams('cursor requires limit.')
+        return None, None
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidPageParams('limit must be an integer.')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidPageParams(f'limit must be between 1 and {MAX_PAGE_SIZE}.')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def paginate_sorted(items, limit, cursor_values):
+    """
+    Pages through `items`, which must already be sorted by their 'id'.
+    Returns (page, next_cursor); next_cursor is None on the last page.
+    """
+    start = 0
+    if cursor_values:
+        after_id = cursor_values[DOCUMENT_ID]
+        start = bisect.bisect_right(items, after_id, key=lambda item: item['id'])
+    page = list(items[start:start + limit])
+    has_more = start + limit < len(items)
+    next_cursor = encode_cursor({DOCUMENT_ID: page[-1]['id']}) if has_more and page else None
+    return page, next_cursor
+
+
+def paginate_query(query, collection_ref, limit, cursor_values, order_fields=(), descending=False):
+    """
+    Applies `order_by` + `start_after` + `limit` to a Firestore query.
+    `order_fields` are any fields that must come first in the ordering (e.g. a range-filtered field);
+    the document id is always the final tie-breaker. `descending` reverses the whole ordering.
+    Fetches one extra document to know whether there is a next page.
+    """
+    direction = Query.DESCENDING if descending else Query.ASCENDING
+    for field in order_fields:
+        query = query.order_by(field, direction=direction)
+    query = query.order_by(DOCUMENT_ID, direction=direction)
+    if cursor_values:
+        start_after = {field: cursor_values.get(field) for field in order_fields}
+        start_after[DOCUMENT_ID] = collection_ref.document(cursor_values[DOCUMENT_ID])
+        query = query.start_after(start_after)
+    return query.limit(limit + 1)
+
+
+def next_cursor_for(docs, limit, order_fields=()):
+    """
+    Given the `(id, data)` pairs returned by a query built with paginate_query,
+    trims the look-ahead document and returns (docs, next_cursor).
+    """
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last_id, last_data = docs[-1]
+    values = {field: last_data.get(field) for field in order_fields}
+    values[DOCUMENT_ID] = last_id
+    return docs, encode_cursor(values)
+
+
+def get_stream_format(query_params):
+    """Returns 'json' or 'ndjson' when the caller opted into a streamed response, else None."""
+    stream = query_params.get('stream')
+    if not stream:
+        return None
+    if stream not in ('json', 'ndjson'):
+        raise InvalidPageParams("stream must be 'json' or 'ndjson'.")
+    return stream
+
+
+def streaming_response(items, stream_format):
+    """
+    Writes `items` (any iterable, typically a generator, or an async iterable under ASGI)
+    to the client as it is produced, either as one JSON array or as newline-delimited JSON.
+    """
+    def encode(item):
+        return json.dumps(item, cls=JSONEncoder, ensure_ascii=False)
+
+    if hasattr(items, '__aiter__'):
+        async def json_array():
+            yield '['
+            first = True
+            async for item in items:
+                yield ('' if first else ',') + encode(item)
+                first = False
+            yield ']'
+
+        async def ndjson():
+            async for item in items:
+                yield encode(item) + '\n'
+    else:
+        def json_array():
+            yield '['
+            for index, item in enumerate(items):
+                yield (',' if index else '') + encode(item)
+            yield ']'
+
+        def ndjson():
+            for item in items:
+                yield encode(item) + '\n'
+
+    if stream_format == 'ndjson':
+        return StreamingHttpResponse(ndjson(), content_type='application/x-ndjson; charset=utf-8')
+    return StreamingHttpResponse(json_array(), content_type='application/json; charset=utf-8')
@@ -0,0 +1,200 @@
+"""
+PayPal REST API client used to verify checkout payments.
+
+One client per process holds a keep-alive `requests.Session` (so calls reuse pooled TLS
+connections) and the OAuth access token, which is cached until shortly before it expires.
+When several threads find the token missing or stale at once, only one of them refreshes it.
+AsyncPayPalClient does the same on `httpx.AsyncClient` for the ASGI checkout view.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# PayPal credentials are read from backend/.env
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Use an explicit environment variable for PayPal's mode
+PAYPAL_MODE = os.getenv('PAYPAL_MODE', 'sandbox') # Default to sandbox for safety
+PAYPAL_API_BASE = "https://api-m.sandbox.paypal.com" if PAYPAL_MODE == 'sandbox' else "https://api-m.paypal.com"
+# Lets benchmarks point the backend at a local PayPal stand-in
+PAYPAL_API_BASE = os.getenv('PAYPAL_API_BASE', PAYPAL_API_BASE)
+
+# Refresh the access token this many seconds before PayPal says it expires
+TOKEN_REFRESH_MARGIN = 60
+REQUEST_TIMEOUT = 10
+
+TOKEN_HEADERS = {"Accept": "application/json", "Accept-Language": "en_US"}
+
+logger = logging.getLogger(__name__)
+
+
+def token_expiry(payload):
+    """When (on the monotonic clock) a token from this /v1/oauth2/token response should be refreshed."""
+    return time.monotonic() + max(0, int(payload.get("expires_in", 0)) - TOKEN_REFRESH_MARGIN)
+
+
+def completed_order(verified_order_data):
+    """Returns the PayPal order if its payment is COMPLETED, else None."""
+    if verified_order_data.get("status") == "COMPLETED":
+        return verified_order_data
+    logger.warning("PayPal payment not completed. Status: %s", verified_order_data.get('status'))
+    return None
+
+
+class PayPalClient:
+    def __init__(self, client_id, client_secret, api_base=PAYPAL_API_BASE, pool_size=10):
+        if not client_id or not client_secret:
+            raise ValueError("Missing PayPal API credentials in .env file.")
+        self.api_base = api_base
+        self._auth = (client_id, client_secret)
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def access_token(self):
+        """Returns a valid access token, fetching a new one only when the cached one is about to expire."""
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+
+        with self._token_lock:
+            # Another thread may have refreshed it while we waited for the lock
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+
+            response = self.session.post(
+                f"{self.api_base}/v1/oauth2/token",
+                headers=TOKEN_HEADERS,
+                auth=self._auth,
+                data={"grant_type": "client_credentials"},
+                timeout=REQUEST_TIMEOUT,
+            )
+            response.raise_for_status()
+            payload = response.json()
+            self._token = payload["access_token"]
+            self._token_expires_at = token_expiry(payload)
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+
+    def get_order(self, paypal_order_id):
+        """GET /v2/checkout/orders/{id}. Retries once with a fresh token if PayPal rejects the cached one."""
+        for attempt in range(2):
+            response = self.session.get(
+                f"{self.api_base}/v2/checkout/orders/{paypal_order_id}",
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.access_token()}"},
+                timeout=REQUEST_TIMEOUT,
+            )
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def verify_payment(self, paypal_order_id):
+        """
+        Verify the payment with PayPal's API to ensure it's legitimate.
+        Returns the verified order details from PayPal or None if invalid.
+        """
+        try:
+            verified_order_data = self.get_order(paypal_order_id)
+        except requests.exceptions.RequestException as e:
+            logger.error("Error verifying PayPal payment: %s", e)
+            return None
+
+        return completed_order(verified_order_data)
+
+
+class AsyncPayPalClient:
+    """
+    PayPalClient for async views. The connection pool belongs to the event loop it is first
+    used on, so only use it from the ASGI worker's loop.
+    """
+    def __init__(self, client_id, client_secret, api_base=PAYPAL_API_BASE, pool_size=20):
+        if not client_id or not client_secret:
+            raise ValueError("Missing PayPal API credentials in .env file.")
+        self._auth = (client_id, client_secret)
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            base_url=api_base,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def access_token(self):
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+
+        async with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+
+            response = await self.client.post(
+                "/v1/oauth2/token", headers=TOKEN_HEADERS, auth=self._auth, data={"grant_type": "client_credentials"},
+            )
+            response.raise_for_status()
+            payload = response.json()
+            self._token = payload["access_token"]
+            self._token_expires_at = token_expiry(payload)
+            return self._token
+
+    async def get_order(self, paypal_order_id):
+        for attempt in range(2):
+            response = await self.client.get(
+                f"/v2/checkout/orders/{paypal_order_id}",
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {await self.access_token()}"},
+            )
+            if response.status_code == 401 and attempt == 0:
+                self._token = None
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def verify_payment(self, paypal_order_id):
+        try:
+            verified_order_data = await self.get_order(paypal_order_id)
+        except httpx.HTTPError as e:
+            logger.error("Error verifying PayPal payment: %s", e)
+            return None
+        return completed_order(verified_order_data)
+
+
+_clients = {}
+_client_lock = threading.Lock()
+
+
+def _get_client(client_class):
+    # Pooled connections can't be shared with a forked child, so each process gets its own client
+    key = (client_class, os.getpid())
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _client_lock:
+        if key not in _clients:
+            _clients[key] = client_class(os.getenv("PAYPAL_CLIENT_ID"), os.getenv("PAYPAL_CLIENT_SECRET"))
+        return _clients[key]
+
+
+def get_paypal_client():
+    """Returns this process's shared PayPalClient, creating it on first use."""
+    return _get_client(PayPalClient)
+
+
+def get_async_paypal_client():
+    """Returns this process's shared AsyncPayPalClient, creating it on first use."""
+    return _get_client(AsyncPayPalClient)
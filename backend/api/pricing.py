@@ -0,0 +1,131 @@
+"""
+Server-side pricing for checkout.
+
+Cart lines arrive from the browser with the price the shopper saw. Before an order is accepted,
+every line is priced again from the product documents, fetched with one batched `get_all` no
+matter how many lines the cart has, and all totals are computed with Decimal.
+
+A price the browser sent that no longer matches the catalog rejects the cart with a per-line diff.
+The payment is already captured by then, so the checkout view holds it for a refund (see
+checkout.payment_review_data) instead of creating the order.
+"""
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+CENT = Decimal('0.01')
+# Only the fields pricing needs are read
+PRICING_FIELDS = ['name', 'price', 'isOnSale', 'salePercentage', 'isAvailable', 'isActive', 'quantity']
+
+# A cart line priced by the server. `stock` is the product's `quantity` field, the stock level
+# the admin set; what is left is tracked in sharded counters (api/stock.py).
+CartLine = namedtuple('CartLine', ['product_id', 'name', 'unit_price', 'quantity', 'stock'])
+
+
+class CartError(ValueError):
+    """The cart can't be ordered as sent. `changes` lists each line that differs from the catalog."""
+    def __init__(self, message, changes=(), status=400):
+        super().__init__(message)
+        self.changes = list(changes)
+        self.status = status
+
+
+def to_money(value):
+    """Converts a number (float, int, str or Decimal) to a Decimal rounded to whole cents."""
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def unit_price(product):
+    """A product's current price, with its sale applied (the same rule the storefront uses)."""
+    price = Decimal(str(product.get('price', 0)))
+    sale_percentage = product.get('salePercentage')
+    if product.get('isOnSale') and sale_percentage:
+        price *= 1 - Decimal(str(sale_percentage)) / 100
+    return price.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def apply_discount(amount, percentage):
+    return (amount * (1 - Decimal(str(percentage)) / 100)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _parse_cart(cart_items):
+    """Validates the shape of the cart and merges lines for the same product. Returns {id: (quantity, client price)}."""
+    parsed = {}
+    for index, item in enumerate(cart_items):
+        product_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(product_id, str) or not product_id or '/' in product_id:
+            raise CartError(f"Cart item {index} has no valid product id.")
+        try:
+            quantity = int(item.get('quantity'))
+            client_price = to_money(item.get('price'))
+        except (TypeError, ValueError, InvalidOperation):
+            raise CartError(f"Cart item {index} has an invalid price or quantity.")
+        if quantity <= 0:
+            raise CartError(f"Cart item {index} has an invalid price or quantity.")
+
+        previous_quantity, _ = parsed.get(product_id, (0, None))
+        parsed[product_id] = (previous_quantity + quantity, client_price)
+    return parsed
+
+
+def _product_refs(db, parsed):
+    return [db.collection('products').document(product_id) for product_id in parsed]
+
+
+def _price_lines(parsed, products):
+    """Prices the parsed cart against the fetched products ({id: data}). Returns (lines, subtotal)."""
+    lines = []
+    changes = []
+    for product_id, (quantity, client_price) in parsed.items():
+        product = products.get(product_id)
+        if product is None:
+            raise CartError(f"Product {product_id} no longer exists.")
+        if product.get('isAvailable') is False or product.get('isActive') is False:
+            raise CartError(f"Product '{product.get('name', product_id)}' is not available.")
+
+        line = CartLine(product_id, product.get('name'), unit_price(product), quantity, product.get('quantity'))
+        # Allow a cent for the browser's float rounding
+        if abs(line.unit_price - client_price) > CENT:
+            changes.append({
+                "id": product_id,
+                "name": line.name,
+                "field": "price",
+                "expected": str(line.unit_price),
+                "received": str(client_price),
+            })
+        lines.append(line)
+
+    if changes:
+        raise CartError("Some prices in your cart have changed.", changes, status=409)
+
+    subtotal = sum((line.unit_price * line.quantity for line in lines), Decimal('0.00'))
+    return lines, subtotal
+
+
+def price_cart(db, cart_items):
+    """
+    Prices every cart line from Firestore in a single round trip.
+    Returns (lines, subtotal). Raises CartError if a product is missing or unavailable (400)
+    or if any price the client sent no longer matches the catalog (409, with a diff per line).
+    """
+    if not cart_items:
+        raise CartError("Cart is empty.")
+    parsed = _parse_cart(cart_items)
+    docs = db.get_all(_product_refs(db, parsed), field_paths=PRICING_FIELDS)
+    return _price_lines(parsed, {doc.id: doc.to_dict() for doc in docs if doc.exists})
+
+
+async def price_cart_async(db, cart_items):
+    """price_cart on the Firestore AsyncClient."""
+    if not cart_items:
+        raise CartError("Cart is empty.")
+    parsed = _parse_cart(cart_items)
+    docs = db.get_all(_product_refs(db, parsed), field_paths=PRICING_FIELDS)
+    return _price_lines(parsed, {doc.id: doc.to_dict() async for doc in docs if doc.exists})
+
+
+def order_items(lines):
+    """The order's item snapshot, built from the server-priced lines."""
+    return [
+        {"id": line.product_id, "name": line.name, "price": float(line.unit_price), "quantity": line.quantity}
+        for line in lines
+    ]
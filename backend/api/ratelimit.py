@@ -0,0 +1,221 @@
+"""
+Admission control for the endpoints anyone can call that fan out to paid or slow services:
+checkout (PayPal, Firestore, email) and admin login (Firebase Identity Toolkit).
+
+RateLimitMiddleware checks each such request against token buckets, one per client IP and one
+per email address in the request body, before the view (and any remote call) runs. A request
+over the limit gets a 429 with Retry-After. The buckets live in a SQLite file in WAL mode
+(RATE_LIMIT_PATH), so every gunicorn worker on the machine shares them; each check is a
+single local transaction. The same file keeps allowed/limited counters per rule, served by the
+admin metrics endpoint. If the file can't be used, requests are let through (fail open).
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from .metrics import span
+
+# Buckets untouched for this long are full again, so their rows can be deleted
+STALE_BUCKET_SECONDS = 3600
+# Fraction of checks that also delete stale buckets
+CLEANUP_PROBABILITY = 0.01
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limit_counters (
+    rule TEXT PRIMARY KEY,
+    allowed INTEGER NOT NULL DEFAULT 0,
+    limited INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+Rule = namedtuple('Rule', 'name method path setting email_from error_key')
+
+
+def _checkout_email(data):
+    return (data.get('paypalDetails') or {}).get('payer', {}).get('email_address')
+
+
+def _login_email(data):
+    return data.get('email')
+
+
+RULES = (
+    Rule('checkout', 'POST', '/api/orders/', 'RATE_LIMIT_CHECKOUT', _checkout_email, 'message'),
+    Rule('admin_login', 'POST', '/api/admin/login/', 'RATE_LIMIT_ADMIN_LOGIN', _login_email, 'error'),
+)
+
+
+def parse_rate(rate):
+    """Parses 'requests/seconds' (e.g. '10/60') into (bucket capacity, tokens refilled per second)."""
+    requests, seconds = rate.split('/')
+    return int(requests), int(requests) / float(seconds)
+
+
+def client_ip(request):
+    """
+    The client's address. Behind RATE_LIMIT_PROXY_COUNT trusted proxies, it is the address the
+    outermost one saw, read from the right of X-Forwarded-For (the left part can be forged).
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 1)
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    if proxies and forwarded:
+        return forwarded[-min(proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimiter:
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        self._schema_ready = False
+
+    @property
+    def path(self):
+        return str(self._path or settings.RATE_LIMIT_PATH)
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Losing recent bucket updates in a crash is harmless
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, rule_name, keys, capacity, refill_rate):
+        """
+        Takes one token from each of `keys`' buckets, but only if every one of them has a token.
+        Returns (allowed, seconds until a retry could succeed).
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            buckets = {}
+            for key in keys:
+                row = conn.execute("SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill_rate)
+                buckets[key] = tokens
+            allowed = all(tokens >= 1 for tokens in buckets.values())
+            if allowed:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, tokens - 1, now) for key, tokens in buckets.items()],
+                )
+            conn.execute(
+                "INSERT INTO rate_limit_counters (rule, allowed, limited) VALUES (?, ?, ?) "
+                "ON CONFLICT (rule) DO UPDATE SET allowed = allowed + excluded.allowed, limited = limited + excluded.limited",
+                (rule_name, int(allowed), int(not allowed)),
+            )
+            if random.random() < CLEANUP_PROBABILITY:
+                conn.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - STALE_BUCKET_SECONDS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        retry_after = 0 if allowed else max((1 - tokens) / refill_rate for tokens in buckets.values() if tokens < 1)
+        return allowed, retry_after
+
+    def record_error(self, rule_name):
+        try:
+            self._connection().execute(
+                "INSERT INTO rate_limit_counters (rule, errors) VALUES (?, 1) "
+                "ON CONFLICT (rule) DO UPDATE SET errors = errors + 1",
+                (rule_name,),
+            )
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        """Allowed, limited and failed-open checks per rule, across all workers."""
+        rows = self._connection().execute("SELECT rule, allowed, limited, errors FROM rate_limit_counters").fetchall()
+        return {rule: {"allowed": allowed, "limited": limited, "errors": errors} for rule, allowed, limited, errors in rows}
+
+
+rate_limiter = RateLimiter()
+
+
+def match_rule(request):
+    for rule in RULES:
+        if request.method == rule.method and request.path == rule.path:
+            return rule
+    return None
+
+
+def check(request, rule):
+    """Returns a 429 response if `request` is over `rule`'s limit, else None."""
+    capacity, refill_rate = parse_rate(getattr(settings, rule.setting))
+    keys = [f"{rule.name}:ip:{client_ip(request)}"]
+    try:
+        email = rule.email_from(json.loads(request.body))
+    except (ValueError, AttributeError, TypeError):
+        email = None
+    if isinstance(email, str) and email:
+        keys.append(f"{rule.name}:email:{email.strip().lower()}")
+
+    try:
+        with span('rate_limit'):
+            allowed, retry_after = rate_limiter.hit(rule.name, keys, capacity, refill_rate)
+    except sqlite3.Error as e:
+        logger.warning("Rate limiter unavailable, letting the request through: %s", e)
+        rate_limiter.record_error(rule.name)
+        return None
+    if allowed:
+        return None
+
+    logger.warning("Rate limited %s request", rule.name, extra={'rule': rule.name, 'keys': keys})
+    response = JsonResponse({rule.error_key: 'Too many requests. Please try again shortly.'}, status=429)
+    response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+class RateLimitMiddleware:
+    """Rejects checkout and admin login requests over their rate limits (see the module docstring)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        rule = match_rule(request) if settings.RATE_LIMIT_ENABLED else None
+        if rule is not None:
+            rejected = check(request, rule)
+            if rejected is not None:
+                return rejected
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        rule = match_rule(request) if settings.RATE_LIMIT_ENABLED else None
+        if rule is not None:
+            # A quick local transaction, but it may wait on another worker's lock; keep it off the event loop
+            rejected = await sync_to_async(check, thread_sensitive=False)(request, rule)
+            if rejected is not None:
+                return rejected
+        return await self.get_response(request)
@@ -0,0 +1,120 @@
+"""
+Pre-aggregated sales figures, so dashboards never scan the `orders` collection.
+
+Every order adds its revenue, units per product, coupon and shipping method to a daily and a
+weekly rollup, in the same transaction that creates the order. Each period is split over
+SALES_ROLLUP_SHARDS documents in `sales_rollups` (id `<period>_<shard>`, e.g. `day-2024-05-01_3`);
+an order increments one shard chosen at random, so busy periods don't become a write hot spot.
+Reading a period sums its shards, which costs the same however many orders it had.
+Periods are calendar days and ISO weeks in TIME_ZONE. Revenue is stored as whole cents (agorot)
+in `revenue_cents` and added with integer increments, so totals never pick up float error.
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.utils import timezone
+from firebase_admin import firestore
+
+from .pricing import to_money
+
+ROLLUPS_COLLECTION = 'sales_rollups'
+GRANULARITIES = ('day', 'week')
+COUNTED_MAPS = ('units', 'coupons', 'shipping')
+
+
+def num_shards():
+    return getattr(settings, 'SALES_ROLLUP_SHARDS', 10)
+
+
+def period_key(granularity, day):
+    """The rollup period holding `day` (a date), e.g. 'day-2024-05-01' or 'week-2024-W18'."""
+    if granularity == 'day':
+        return f"day-{day.isoformat()}"
+    year, week, _ = day.isocalendar()
+    return f"week-{year}-W{week:02d}"
+
+
+def period_keys(moment):
+    """The daily and weekly periods an order placed at `moment` (an aware datetime) counts towards."""
+    day = timezone.localtime(moment).date()
+    return [period_key(granularity, day) for granularity in GRANULARITIES]
+
+
+def to_cents(amount):
+    """Converts a money amount (float, str or Decimal) to whole cents."""
+    return int(to_money(amount) * 100)
+
+
+def sale_totals(order_data):
+    """What one order adds to its rollups, as plain integers."""
+    amount = order_data.get('amount') or {}
+    units, names = {}, {}
+    for item in order_data.get('items', []):
+        units[item['id']] = units.get(item['id'], 0) + item['quantity']
+        names[item['id']] = item.get('name')
+    return {
+        'revenue_cents': to_cents(amount.get('value') or 0),
+        'orders': 1,
+        'units': units,
+        'product_names': names,
+        'coupons': {order_data['coupon_used']: 1} if order_data.get('coupon_used') else {},
+        'shipping': {order_data.get('shipping_method') or 'pickup': 1},
+    }
+
+
+def _increments(totals):
+    fields = {'revenue_cents': firestore.Increment(totals['revenue_cents']), 'orders': firestore.Increment(totals['orders'])}
+    for name in COUNTED_MAPS:
+        if totals[name]:
+            fields[name] = {key: firestore.Increment(count) for key, count in totals[name].items()}
+    fields['product_names'] = totals['product_names']
+    return fields
+
+
+def record_sale(db, transaction, order_data, moment=None):
+    """Adds an order to its daily and weekly rollups inside `transaction` (blind writes, no reads)."""
+    totals = sale_totals(order_data)
+    shard = random.randrange(num_shards())
+    for key in period_keys(moment or timezone.now()):
+        ref = db.collection(ROLLUPS_COLLECTION).document(f"{key}_{shard}")
+        transaction.set(ref, {'period': key, **_increments(totals)}, merge=True)
+
+
+def empty_rollup():
+    return {'revenue_cents': 0, 'orders': 0, 'units': {}, 'product_names': {}, 'coupons': {}, 'shipping': {}}
+
+
+def add_rollup(into, rollup):
+    """Adds the figures of `rollup` (a shard document or another rollup) to `into`."""
+    into['revenue_cents'] += rollup.get('revenue_cents') or 0
+    into['orders'] += rollup.get('orders') or 0
+    for name in COUNTED_MAPS:
+        for key, count in (rollup.get(name) or {}).items():
+            into[name][key] = into[name].get(key, 0) + count
+    into['product_names'].update(rollup.get('product_names') or {})
+    return into
+
+
+def read_rollups(db, granularity, first_day, last_day):
+    """
+    Sums the shards of every `granularity` period from `first_day` to `last_day` (dates, inclusive)
+    with one range query on `period`. Returns {period key: rollup}; periods without sales are absent.
+    """
+    query = (
+        db.collection(ROLLUPS_COLLECTION)
+        .where('period', '>=', period_key(granularity, first_day))
+        .where('period', '<=', period_key(granularity, last_day))
+    )
+    rollups = {}
+    for doc in query.stream():
+        data = doc.to_dict()
+        add_rollup(rollups.setdefault(data['period'], empty_rollup()), data)
+    return rollups
+
+
+def default_range(granularity, today=None):
+    """The last 30 days, or the last 12 weeks, up to today."""
+    today = today or timezone.localdate()
+    span = datetime.timedelta(days=29) if granularity == 'day' else datetime.timedelta(weeks=11)
+    return today - span, today
@@ -0,0 +1,247 @@
+"""
+In-memory product search.
+
+An inverted index over product names and descriptions, built from the catalog snapshot
+and updated incrementally as products change. Hebrew text is normalized so that
+niqqud, final letters and geresh/gershayim don't affect matching
+(e.g. "צ׳דר" matches "צדר", "שָׁלוֹם" matches "שלום").
+
+Supports whole-word, prefix and substring matches, ranked in that order,
+with matches in the product name weighted above matches in the description.
+Queries are capped at MAX_QUERY_LENGTH characters and MAX_QUERY_TERMS distinct terms,
+since the endpoint is public and every term costs a pass over its matching products.
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+
+# Final letter forms -> their regular forms
+FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+# Geresh, gershayim and the ASCII quotes commonly typed in their place are dropped
+# (ש״ח -> שח, ג׳ -> ג); the maqaf joins words like a hyphen does, so it becomes a space.
+PUNCTUATION = str.maketrans({'׳': None, '״': None, "'": None, '"': None, '־': ' '})
+TOKEN_RE = re.compile(r'\w+')
+
+FIELD_WEIGHTS = {'name': 3.0, 'description': 1.0}
+MATCH_WEIGHTS = {'exact': 3.0, 'prefix': 2.0, 'substring': 1.0}
+NGRAM = 3
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 8
+# Matches of recently queried terms are kept until the index next changes
+TERM_CACHE_SIZE = 1024
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def normalize(text):
+    """
+    Lowercases `text` and strips niqqud, cantillation marks and geresh/gershayim, and unifies final letters.
+    Documents written outside the API may hold other types, so anything but a string is indexed as str(text)
+    (None as nothing).
+    """
+    if not isinstance(text, str):
+        text = '' if text is None else str(text)
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return text.translate(PUNCTUATION).translate(FINAL_LETTERS).lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def ngrams(token):
+    return {token[i:i + NGRAM] for i in range(len(token) - NGRAM + 1)}
+
+
+class SearchIndex:
+    """
+    Inverted index from normalized tokens to products.
+
+    - `_postings` maps token -> {field weight: set of product ids}; each product sits under
+      the best field it contains the token in
+    - `_vocabulary` is the sorted list of indexed tokens, for prefix lookups
+    - `_ngrams` maps each trigram to the tokens containing it, for substring lookups
+    - `_term_matches` caches _match_term results; any change to the index clears it
+
+    Each term matches a product at one discrete level (match weight x field weight); a product's
+    score is the sum of its levels over the query terms.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._vocabulary = []
+        self._ngrams = {}
+        self._product_tokens = {}
+        self._product_fields = {}
+        self._term_matches = {}
+
+    def __len__(self):
+        return len(self._product_tokens)
+
+    # --- Maintenance ---
+
+    def sync(self, products):
+        """
+        Brings the index in line with `products` (an iterable of product dicts),
+        re-indexing only the products that were added, changed or removed.
+        """
+        with self._lock:
+            seen = set()
+            for product in products:
+                seen.add(product['id'])
+                fields = (product.get('name', ''), product.get('description', ''))
+                if self._product_fields.get(product['id']) != fields:
+                    self._remove(product['id'])
+                    self._add(product['id'], fields)
+            for product_id in set(self._product_tokens) - seen:
+                self._remove(product_id)
+
+    def _add(self, product_id, fields):
+        self._term_matches.clear()
+        weights = {}
+        for field, text in zip(FIELD_WEIGHTS, fields):
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0), FIELD_WEIGHTS[field])
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+                for gram in ngrams(token):
+                    self._ngrams.setdefault(gram, set()).add(token)
+            postings.setdefault(weight, set()).add(product_id)
+
+        self._product_tokens[product_id] = weights
+        self._product_fields[product_id] = fields
+
+    def _remove(self, product_id):
+        self._term_matches.clear()
+        for token, weight in self._product_tokens.pop(product_id, {}).items():
+            postings = self._postings[token]
+            postings[weight].discard(product_id)
+            if not postings[weight]:
+                del postings[weight]
+            if postings:
+                continue
+            del self._postings[token]
+            del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+            for gram in ngrams(token):
+                tokens = self._ngrams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self._ngrams[gram]
+        self._product_fields.pop(product_id, None)
+
+    # --- Querying ---
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` product ids matching every term of `query`, best match first.
+        Products with the same score are ordered by id.
+        Raises InvalidQuery if the query is longer than MAX_QUERY_LENGTH or has more than MAX_QUERY_TERMS terms.
+        """
+        if len(query) > MAX_QUERY_LENGTH:
+            raise InvalidQuery(f"q must be at most {MAX_QUERY_LENGTH} characters.")
+        terms = list(dict.fromkeys(tokenize(query)))
+        if len(terms) > MAX_QUERY_TERMS:
+            raise InvalidQuery(f"q must have at most {MAX_QUERY_TERMS} terms.")
+        if not terms:
+            return []
+
+        with self._lock:
+            term_levels = [self._cached_match(term) for term in terms]
+        if not all(term_levels):
+            return []
+
+        # Every product sits at exactly one level per term, so its score is the sum of those levels.
+        # Products are kept in buckets by score: starting from the term with the fewest matches, each
+        # further term splits every bucket by its own levels with set intersections, and adds the level
+        # to the bucket's score. There are only a few levels, so this never loops over products in Python.
+        term_levels.sort(key=lambda levels: sum(len(ids) for ids in levels.values()))
+        buckets = term_levels[0]
+        for levels in term_levels[1:]:
+            matched = {}
+            for score, ids in buckets.items():
+                for level, level_ids in levels.items():
+                    common = ids & level_ids
+                    if common:
+                        matched.setdefault(score + level, set()).update(common)
+            buckets = matched
+            if not buckets:
+                return []
+        return _best(buckets, limit)
+
+    def _cached_match(self, term):
+        levels = self._term_matches.get(term)
+        if levels is None:
+            if len(self._term_matches) >= TERM_CACHE_SIZE:
+                self._term_matches.clear()
+            levels = self._term_matches[term] = self._match_term(term)
+        return levels
+
+    def _match_term(self, term):
+        """
+        Finds every product matching `term`.
+        Returns {score level: set of product ids}, each product only at its best level.
+        """
+        candidates = {term: MATCH_WEIGHTS['exact']} if term in self._postings else {}
+
+        vocabulary = self._vocabulary
+        for i in range(bisect.bisect_left(vocabulary, term), len(vocabulary)):
+            token = vocabulary[i]
+            if not token.startswith(term):
+                break
+            candidates.setdefault(token, MATCH_WEIGHTS['prefix'])
+
+        if len(term) >= NGRAM:
+            grams = [self._ngrams.get(gram, set()) for gram in ngrams(term)]
+            for token in set.intersection(*sorted(grams, key=len)):
+                if term in token:
+                    candidates.setdefault(token, MATCH_WEIGHTS['substring'])
+
+        levels = {}
+        for token, match_weight in candidates.items():
+            for field_weight, product_ids in self._postings[token].items():
+                level = match_weight * field_weight
+                levels.setdefault(level, set()).update(product_ids)
+
+        seen = set()
+        for level in sorted(levels, reverse=True):
+            levels[level] -= seen
+            seen |= levels[level]
+            if not levels[level]:
+                del levels[level]
+        return levels
+
+
+def _best(buckets, limit):
+    """The `limit` best product ids of {score: set of ids}: highest score first, then by id."""
+    results = []
+    for score in sorted(buckets, reverse=True):
+        results.extend(heapq.nsmallest(limit - len(results), buckets[score]))
+        if len(results) >= limit:
+            break
+    return results
+
+
+class CatalogSearch:
+    """Keeps a SearchIndex in step with the catalog snapshot it is queried against."""
+    def __init__(self):
+        self.index = SearchIndex()
+        self._version = None
+
+    def search(self, snapshot, query, limit=20):
+        if snapshot.version != self._version:
+            self.index.sync(snapshot.products)
+            self._version = snapshot.version
+        products = (snapshot.products_by_id.get(pid) for pid in self.index.search(query, limit))
+        return [product for product in products if product is not None]
+
+
+product_search = CatalogSearch()
@@ -0,0 +1,239 @@
+"""
+Product stock, kept in sharded counters so popular products don't hit Firestore's per-document write limit.
+
+A product's remaining stock is split over STOCK_SHARDS documents, `products/{id}/stock_shards/{n}`,
+each holding a `count`. An order reserves stock inside its transaction by reading one random shard
+per line, all lines in one batched read, and decrementing it; only lines whose shard runs low read
+their other shards, again in one batch. Concurrent orders for the same product therefore mostly
+touch different documents and don't conflict.
+
+The product's `quantity` stays the stock level the admin set. The shards are (re)filled from it on
+the product's next order after a restock: when `quantity` differs from `stockBase`, the quantity they
+were last filled from (so setting a new quantity in Firestore restocks), or when `stockVersion`
+differs from `stockBaseVersion`. POST /api/products/{id}/restock/ bumps `stockVersion`, which also
+restocks a product back to the quantity it already had.
+Products without a `quantity` aren't stock-tracked.
+
+Each product records the shard count it was filled with (`stockShards`). When STOCK_SHARDS changes,
+the product's next order reads all of its old shards, folds what is left into the new number of
+shards and deletes the ones past it, so lowering STOCK_SHARDS doesn't strand stock in shards that
+reservations no longer draw from. Until then its old shards still count towards its stock.
+
+Checkout only gets here after PayPal has captured the payment, so a shortage doesn't fail the
+order: whatever stock is left is reserved and the rest is reported back as backordered.
+"""
+import random
+
+from django.conf import settings
+from firebase_admin import firestore
+
+SHARDS_COLLECTION = 'stock_shards'
+
+
+def num_shards():
+    return getattr(settings, 'STOCK_SHARDS', 10)
+
+
+def shard_ref(db, product_id, index):
+    return db.collection('products').document(product_id).collection(SHARDS_COLLECTION).document(str(index))
+
+
+def initial_counts(quantity, shards):
+    """Spreads `quantity` as evenly as possible over `shards` counters."""
+    base, extra = divmod(max(0, quantity), shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def needs_refill(product):
+    if product.get('quantity') is None:
+        return False
+    return (product.get('stockBase') != product['quantity']
+            or product.get('stockVersion', 0) != product.get('stockBaseVersion', 0))
+
+
+def shards_in_use(product):
+    """How many shards of `product` hold stock: those it was filled with, or STOCK_SHARDS if that is more."""
+    return max(product.get('stockShards') or num_shards(), num_shards())
+
+
+def restock_fields(quantity=None):
+    """The product fields to write to restock it, to `quantity` or to the quantity it already has."""
+    fields = {'stockVersion': firestore.Increment(1)}
+    if quantity is not None:
+        fields['quantity'] = quantity
+    return fields
+
+
+def remaining_stock(product, shard_counts):
+    """
+    A product's remaining stock given its shards' counts ({shard index: count}, see shard_counts).
+    None if it isn't stock-tracked. Shards past those in use are leftovers and aren't counted.
+    """
+    if product.get('quantity') is None:
+        return None
+    if needs_refill(product) or shard_counts is None:
+        return product['quantity']
+    in_use = shards_in_use(product)
+    return sum(count for index, count in shard_counts.items() if index < in_use)
+
+
+def _count(snapshot):
+    return (snapshot.to_dict() or {}).get('count', 0) if snapshot.exists else 0
+
+
+def _reservation(db, lines):
+    """
+    Plans the stock reservation for `lines` (pricing.CartLine) without doing any I/O.
+    A generator: it yields lists of document references to read and is sent back {path: snapshot}.
+    Returns (writes as (op, ref, data) tuples, backordered lines as dicts).
+    """
+    shards = num_shards()
+    product_refs = {line.product_id: db.collection('products').document(line.product_id) for line in lines}
+    snapshots = yield list(product_refs.values())
+    products = {
+        product_id: snapshots[ref.path].to_dict() if snapshots[ref.path].exists else {}
+        for product_id, ref in product_refs.items()
+    }
+
+    writes = []
+    reserved = {}
+    sharded = []
+    resharded = []
+    for line in lines:
+        product = products[line.product_id]
+        if product.get('quantity') is None:
+            continue
+
+        if needs_refill(product):
+            # Restocked (or never sharded): refill every shard, minus this order
+            needed = line.quantity
+            for index, count in enumerate(initial_counts(product['quantity'], shards)):
+                taken = min(count, needed)
+                needed -= taken
+                writes.append(('set', shard_ref(db, line.product_id, index), {'count': count - taken}))
+            writes.extend(_drop_extra_shards(db, line.product_id, product, shards))
+            writes.append(('update', product_refs[line.product_id], {
+                'stockBase': product['quantity'], 'stockBaseVersion': product.get('stockVersion', 0),
+                'stockShards': shards,
+            }))
+            reserved[line.product_id] = line.quantity - needed
+        elif product.get('stockShards', shards) != shards:
+            resharded.append((line, shards_in_use(product)))
+        else:
+            sharded.append((line, random.sample(range(shards), shards)))
+
+    # One random shard per line (every old shard for lines being resharded),
+    # then every other shard of the lines the first one didn't cover
+    takes = {}
+    first_refs = [shard_ref(db, line.product_id, order[0]) for line, order in sharded]
+    reshard_refs = {
+        line.product_id: [shard_ref(db, line.product_id, index) for index in range(in_use)]
+        for line, in_use in resharded
+    }
+    refs_to_read = first_refs + [ref for refs in reshard_refs.values() for ref in refs]
+    snapshots = (yield refs_to_read) if refs_to_read else {}
+
+    for line, _ in resharded:
+        product = products[line.product_id]
+        total = sum(_count(snapshots[ref.path]) for ref in reshard_refs[line.product_id])
+        reserved[line.product_id] = min(total, line.quantity)
+        for index, count in enumerate(initial_counts(total - reserved[line.product_id], shards)):
+            writes.append(('set', shard_ref(db, line.product_id, index), {'count': count}))
+        writes.extend(_drop_extra_shards(db, line.product_id, product, shards))
+        writes.append(('update', product_refs[line.product_id], {'stockShards': shards}))
+
+    short = []
+    for (line, order), ref in zip(sharded, first_refs):
+        count = _count(snapshots[ref.path])
+        taken = min(count, line.quantity)
+        takes[line.product_id] = [(ref, count - taken)] if taken else []
+        reserved[line.product_id] = taken
+        if taken < line.quantity:
+            short.append((line, [shard_ref(db, line.product_id, index) for index in order[1:]]))
+
+    rest_refs = [ref for _, refs in short for ref in refs]
+    snapshots = (yield rest_refs) if rest_refs else {}
+    for line, refs in short:
+        for ref in refs:
+            needed = line.quantity - reserved[line.product_id]
+            count = _count(snapshots[ref.path])
+            taken = min(count, needed)
+            if taken:
+                takes[line.product_id].append((ref, count - taken))
+                reserved[line.product_id] += taken
+
+    # The shards were read in this transaction, so writing the new counts is safe
+    for product_takes in takes.values():
+        writes.extend(('update', ref, {'count': count}) for ref, count in product_takes)
+
+    backordered = [
+        {"id": line.product_id, "name": line.name, "requested": line.quantity,
+         "reserved": reserved[line.product_id], "backordered": line.quantity - reserved[line.product_id]}
+        for line in lines if line.product_id in reserved and reserved[line.product_id] < line.quantity
+    ]
+    return writes, backordered
+
+
+def _drop_extra_shards(db, product_id, product, shards):
+    """Deletes the shards a product was filled with past the first `shards` (after STOCK_SHARDS was lowered)."""
+    return [('delete', shard_ref(db, product_id, index), None) for index in range(shards, shards_in_use(product))]
+
+
+def _run(plan, read):
+    snapshots = None
+    try:
+        while True:
+            refs = plan.send(snapshots)
+            snapshots = {snapshot.reference.path: snapshot for snapshot in read(refs)}
+    except StopIteration as done:
+        return done.value
+
+
+def reserve_stock(db, transaction, lines):
+    """
+    Reserves stock for the order's lines in `transaction`. Reads only: returns (the writes to apply,
+    the lines that could only be partly reserved, see _reservation).
+    """
+    if not getattr(settings, 'STOCK_TRACKING_ENABLED', True):
+        return [], []
+    return _run(_reservation(db, lines), lambda refs: db.get_all(refs, transaction=transaction))
+
+
+async def reserve_stock_async(db, transaction, lines):
+    """reserve_stock on the Firestore AsyncClient."""
+    if not getattr(settings, 'STOCK_TRACKING_ENABLED', True):
+        return [], []
+    plan = _reservation(db, lines)
+    snapshots = None
+    try:
+        while True:
+            refs = plan.send(snapshots)
+            snapshots = {snapshot.reference.path: snapshot async for snapshot in db.get_all(refs, transaction=transaction)}
+    except StopIteration as done:
+        return done.value
+
+
+def apply_writes(transaction, writes):
+    for op, ref, data in writes:
+        if op == 'set':
+            transaction.set(ref, data)
+        elif op == 'delete':
+            transaction.delete(ref)
+        else:
+            transaction.update(ref, data)
+
+
+def shard_counts(shard_docs):
+    """Groups shard snapshots per product. Returns {product id: {shard index: count}} (see remaining_stock)."""
+    counts = {}
+    for doc in shard_docs:
+        if not doc.id.isdigit():
+            continue
+        product_id = doc.reference.parent.parent.id
+        counts.setdefault(product_id, {})[int(doc.id)] = (doc.to_dict() or {}).get('count') or 0
+    return counts
+
+
+def stock_levels(db):
+    """Reads every product's shards with one collection group query. Returns {product id: {shard index: count}}."""
+    return shard_counts(db.collection_group(SHARDS_COLLECTION).select(['count']).stream())
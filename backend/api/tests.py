@@ -0,0 +1,417 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from .catalog import CatalogCache, CatalogSnapshot
+from .checkout import PAYMENT_REVIEWS_COLLECTION
+from .coupons import CouponCache
+from .pricing import CartLine
+from .rollups import add_rollup, empty_rollup, sale_totals
+from .search import SearchIndex
+from .stock import apply_writes, remaining_stock, reserve_stock
+from .views.admin import rollup_summary
+from .views.main import CategoryViewSet, ProductViewSet
+from .views.orders import place_order
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def get(self, field_paths=None):
+        self._db.reads['get'] += 1
+        return FakeSnapshot(self, self._db.docs.get(self.path))
+
+    def set(self, data):
+        self._db.docs[self.path] = data
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+
+class FakeCollection:
+    def __init__(self, db, name, field_paths=None):
+        self._db = db
+        self._name = name
+        self._field_paths = field_paths
+
+    def document(self, doc_id):
+        return FakeDocument(self._db, f"{self._name}/{doc_id}")
+
+    def select(self, field_paths):
+        self._db.selects.append(list(field_paths))
+        return FakeCollection(self._db, self._name, list(field_paths))
+
+    def _project(self, data):
+        # Like Firestore, an empty projection returns every field
+        if not self._field_paths:
+            return data
+        return {key: value for key, value in data.items() if key in self._field_paths}
+
+    def stream(self):
+        self._db.reads['stream'] += 1
+        prefix = f"{self._name}/"
+        return [
+            FakeSnapshot(FakeDocument(self._db, path), self._project(data))
+            for path, data in sorted(self._db.docs.items())
+            if path.startswith(prefix) and '/' not in path[len(prefix):]
+        ]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def create(self, ref, data):
+        self._writes.append(('create', ref, data))
+
+    def update(self, ref, data):
+        self._writes.append(('update', ref, data))
+
+    def delete(self, ref):
+        self._writes.append(('delete', ref, None))
+
+    def commit(self):
+        self._db.commits.append(self._writes)
+
+
+class FakeTransaction:
+    """Applies a transaction's writes straight to the FakeFirestore."""
+    def __init__(self, db):
+        self._db = db
+
+    def set(self, ref, data):
+        self._db.docs[ref.path] = dict(data)
+
+    def update(self, ref, data):
+        self._db.docs[ref.path] = {**self._db.docs[ref.path], **data}
+
+    def delete(self, ref):
+        self._db.docs.pop(ref.path, None)
+
+
+class FakeFirestore:
+    """An in-memory stand-in for the Firestore client that counts every read it serves."""
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = {'get': 0, 'get_all': 0, 'stream': 0}
+        self.get_all_sizes = []
+        self.selects = []
+        self.commits = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        refs = list(refs)
+        self.reads['get_all'] += 1
+        self.get_all_sizes.append(len(refs))
+        return [FakeSnapshot(ref, self.docs.get(ref.path)) for ref in refs]
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductListReadsTest(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeFirestore({'categories/fish': {'name': 'Fish'}, 'categories/cheese': {'name': 'Cheese'}})
+        for i in range(20):
+            category = 'fish' if i % 2 else 'cheese'
+            self.db.docs[f'products/p{i:02d}'] = {
+                'name': f'Product {i}', 'price': 10, 'categoryRef': self.db.collection('categories').document(category),
+            }
+        patcher = mock.patch('api.views.main.get_db', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def list_products(self, query=''):
+        request = APIRequestFactory().get(f'/api/products/{query}')
+        return ProductViewSet.as_view({'get': 'list'})(request)
+
+    def test_list_resolves_categories_with_one_batched_read(self):
+        response = self.list_products()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(response.data[0]['category'], {'id': 'cheese', 'name': 'Cheese'})
+        self.assertEqual(response.data[1]['category'], {'id': 'fish', 'name': 'Fish'})
+        self.assertEqual(self.db.reads, {'get': 0, 'get_all': 1, 'stream': 1})
+        self.assertEqual(self.db.get_all_sizes, [2])
+
+    def test_denormalized_categories_are_not_read(self):
+        for path, data in self.db.docs.items():
+            if path.startswith('products/'):
+                data.update(categoryId=data['categoryRef'].id, categoryName=data['categoryRef'].id.title())
+
+        response = self.list_products()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.reads, {'get': 0, 'get_all': 0, 'stream': 1})
+
+    def test_fields_id_reads_only_document_ids(self):
+        response = self.list_products('?fields=id')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[:2], [{'id': 'p00'}, {'id': 'p01'}])
+        self.assertEqual(self.db.selects, [['__name__']])
+
+    def test_category_fields_id_reads_only_document_ids(self):
+        request = APIRequestFactory().get('/api/categories/?fields=id')
+        response = CategoryViewSet.as_view({'get': 'list'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'id': 'cheese'}, {'id': 'fish'}])
+        self.assertEqual(self.db.selects, [['__name__']])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.list_products('?fields=*')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.db.reads, {'get': 0, 'get_all': 0, 'stream': 0})
+
+    def test_retrieve_returns_only_the_requested_fields(self):
+        request = APIRequestFactory().get('/api/products/p01/?fields=name')
+        response = ProductViewSet.as_view({'get': 'retrieve'})(request, pk='p01')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'id': 'p01', 'name': 'Product 1'})
+
+
+class CatalogRefreshTest(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeFirestore({'categories/fish': {'name': 'Fish'}, 'products/p1': {'name': 'Mackerel', 'price': 10}})
+        patcher = mock.patch('api.catalog.get_db', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(CATALOG_CACHE_ENABLED=True, STOCK_TRACKING_ENABLED=False)
+    def test_refresh_before_first_get_starts_watching(self):
+        cache = CatalogCache()
+        with mock.patch.object(CatalogCache, '_start_watching') as start_watching, \
+                mock.patch.object(CatalogCache, '_bump_version'):
+            snapshot = cache.refresh()
+            self.assertIs(cache.get(), snapshot)
+            cache.refresh()
+
+        start_watching.assert_called_once_with()
+        self.assertEqual([p['id'] for p in snapshot.products], ['p1'])
+
+    def test_snapshot_counts_products_per_category(self):
+        fish = self.db.collection('categories').document('fish')
+        products = [
+            ('p1', {'name': 'Mackerel', 'categoryRef': fish, 'categoryId': 'fish'}),
+            # Moved by the admin UI, which leaves categoryId and the stored counts behind
+            ('p2', {'name': 'Brie', 'categoryRef': self.db.collection('categories').document('cheese'), 'categoryId': 'fish'}),
+        ]
+        categories = [('cheese', {'name': 'Cheese', 'productCount': 0}), ('fish', {'name': 'Fish', 'productCount': 2})]
+
+        snapshot = CatalogSnapshot.from_documents(products, categories)
+
+        self.assertEqual(snapshot.categories_by_id['cheese']['productCount'], 1)
+        self.assertEqual(snapshot.categories_by_id['fish']['productCount'], 1)
+        self.assertEqual(snapshot.products_by_id['p2']['category']['id'], 'cheese')
+
+    @override_settings(CATALOG_CACHE_ENABLED=False)
+    def test_refresh_is_a_no_op_when_the_cache_is_disabled(self):
+        self.assertIsNone(CatalogCache().refresh())
+        self.assertEqual(self.db.reads, {'get': 0, 'get_all': 0, 'stream': 0})
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class BulkProductWritesTest(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeFirestore({
+            'categories/fish': {'name': 'Fish'},
+            'products/p1': {'name': 'Mackerel', 'price': 10, 'categoryId': 'fish', 'categoryName': 'Fish'},
+        })
+        patcher = mock.patch('api.views.main.get_db', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bulk(self, operations):
+        request = APIRequestFactory().post('/api/products/bulk/', operations, format='json')
+        with mock.patch.object(ProductViewSet, 'get_permissions', return_value=[]), mock.patch('api.views.main.catalog'):
+            return ProductViewSet.as_view({'post': 'bulk'})(request)
+
+    def assert_rejected(self, operations, error):
+        response = self.bulk(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(error, response.data['errors'][0]['error'])
+        self.assertEqual(self.db.commits, [])
+
+    def test_duplicate_ids_are_rejected(self):
+        self.assert_rejected([{'op': 'delete', 'id': 'p1'}, {'op': 'delete', 'id': 'p1'}], 'more than one operation')
+
+    def test_create_with_an_existing_id_is_rejected(self):
+        self.assert_rejected(
+            [{'op': 'create', 'id': 'p1', 'data': {'name': 'Herring', 'price': 5, 'category_id': 'fish'}}], 'already exists'
+        )
+
+    def test_delete_of_a_missing_product_is_rejected(self):
+        self.assert_rejected([{'op': 'delete', 'id': 'nope'}], 'does not exist')
+
+    def test_non_object_data_is_rejected(self):
+        self.assert_rejected([{'op': 'update', 'id': 'p1', 'data': ['price', 12]}], 'data must be an object')
+
+    def test_create_never_overwrites(self):
+        response = self.bulk([{'op': 'create', 'id': 'p2', 'data': {'name': 'Herring', 'price': 5, 'category_id': 'fish'}}])
+
+        self.assertEqual(response.status_code, 200)
+        [writes] = self.db.commits
+        self.assertEqual([(op, ref.path) for op, ref, _ in writes], [('create', 'products/p2'), ('update', 'categories/fish')])
+
+
+class SalesRollupTest(SimpleTestCase):
+    def test_revenue_is_summed_in_whole_cents(self):
+        rollup = empty_rollup()
+        for value in ('0.10', '0.20', 19.99, '100.01'):
+            add_rollup(rollup, sale_totals({'amount': {'value': value}, 'items': []}))
+
+        self.assertEqual(rollup['revenue_cents'], 12030)
+        summary = rollup_summary(rollup)
+        self.assertEqual(summary['revenue'], 120.3)
+        self.assertEqual(summary['average_order'], 30.08)
+
+
+class CheckoutPricingTest(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeFirestore({'products/p1': {'name': 'Mackerel', 'price': 10, 'quantity': 5}})
+        self.outbox = mock.patch('api.views.orders.email_outbox').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def checkout(self, client_price, captured):
+        paypal_order = {
+            'status': 'COMPLETED', 'payer': {'email_address': 'shopper@example.com'},
+            'purchase_units': [{'amount': {'value': captured, 'currency_code': 'ILS'},
+                                'payments': {'captures': [{'id': 'CAP-1'}]}}],
+        }
+        mock.patch('api.views.orders.get_paypal_client').start().return_value.verify_payment.return_value = paypal_order
+        cart = [{'id': 'p1', 'price': client_price, 'quantity': 1}]
+        return place_order(self.db, 'PAY-1', {'id': 'PAY-1'}, cart, None, 'pickup')
+
+    def test_a_tampered_price_paid_in_full_is_rejected_and_held_for_refund(self):
+        # FakeFirestore has no transactions, so reaching the order write would raise
+        body, status_code = self.checkout('0.01', '0.01')
+
+        self.assertEqual(status_code, 409)
+        self.assertEqual(body['price_changes'], [
+            {'id': 'p1', 'name': 'Mackerel', 'field': 'price', 'expected': '10.00', 'received': '0.01'},
+        ])
+        review = self.db.docs[f'{PAYMENT_REVIEWS_COLLECTION}/PAY-1']
+        self.assertEqual((review['reason'], review['status'], review['paypal_capture_id']),
+                         ('price_changes', 'refund_pending', 'CAP-1'))
+        self.assertNotIn('orders/PAY-1', self.db.docs)
+        self.outbox.enqueue.assert_called_once_with('payment_review', mock.ANY)
+
+    def test_an_amount_paypal_did_not_charge_is_held_for_refund(self):
+        body, status_code = self.checkout('10.00', '5.00')
+
+        self.assertEqual(status_code, 400)
+        self.assertEqual(self.db.docs[f'{PAYMENT_REVIEWS_COLLECTION}/PAY-1']['reason'], 'amount_mismatch')
+
+
+class SearchIndexTest(SimpleTestCase):
+    def test_non_string_fields_are_indexed_as_text(self):
+        index = SearchIndex()
+        index.sync([
+            {'id': 'a', 'name': None, 'description': 5},
+            {'id': 'b', 'name': ['מקרל'], 'description': {'x': 1}},
+            {'id': 'c', 'name': 'מקרל מעושן'},
+        ])
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search('5'), ['a'])
+        self.assertEqual(index.search('מקרל'), ['b', 'c'])
+
+    def test_cached_term_matches_follow_catalog_changes(self):
+        index = SearchIndex()
+        index.sync([{'id': 'a', 'name': 'מקרל'}])
+        self.assertEqual(index.search('מקרל'), ['a'])
+
+        index.sync([{'id': 'a', 'name': 'סלמון'}, {'id': 'b', 'name': 'מקרל מעושן'}])
+
+        self.assertEqual(index.search('מקרל'), ['b'])
+
+
+@override_settings(COUPON_MISS_TTL=10)
+class CouponCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = CouponCache()
+        mock.patch.object(CouponCache, '_table', return_value={'SAVE10': {'code': 'SAVE10'}}).start()
+        self.query = mock.patch.object(CouponCache, '_query', return_value=None).start()
+        self.clock = mock.patch('api.coupons.time.monotonic', return_value=1000.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_unknown_codes_are_queried_once_per_miss_ttl(self):
+        for _ in range(3):
+            self.assertIsNone(self.cache.get('NOPE'))
+        self.assertEqual(self.query.call_count, 1)
+
+        self.clock.return_value = 1011.0
+        self.assertIsNone(self.cache.get('NOPE'))
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_known_codes_never_query(self):
+        self.assertEqual(self.cache.get('SAVE10'), {'code': 'SAVE10'})
+        self.query.assert_not_called()
+
+
+@override_settings(STOCK_SHARDS=2, STOCK_TRACKING_ENABLED=True)
+class StockShardsTest(SimpleTestCase):
+    def setUp(self):
+        # Filled with 4 shards, before STOCK_SHARDS was lowered to 2
+        self.db = FakeFirestore({
+            'products/p1': {'name': 'Mackerel', 'quantity': 10, 'stockBase': 10, 'stockShards': 4},
+            **{f'products/p1/stock_shards/{index}': {'count': count} for index, count in enumerate([1, 2, 3, 4])},
+        })
+
+    def shard_counts(self):
+        prefix = 'products/p1/stock_shards/'
+        return {int(path[len(prefix):]): data['count'] for path, data in self.db.docs.items() if path.startswith(prefix)}
+
+    def stock(self):
+        return remaining_stock(self.db.docs['products/p1'], self.shard_counts())
+
+    def reserve(self, quantity):
+        writes, backordered = reserve_stock(self.db, None, [CartLine('p1', 'Mackerel', None, quantity, None)])
+        apply_writes(FakeTransaction(self.db), writes)
+        return backordered
+
+    def test_shards_past_stock_shards_are_folded_into_the_kept_ones(self):
+        self.assertEqual(self.stock(), 10)
+
+        self.assertEqual(self.reserve(3), [])
+
+        self.assertEqual(self.shard_counts(), {0: 4, 1: 3})
+        self.assertEqual(self.db.docs['products/p1']['stockShards'], 2)
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(self.reserve(7), [])
+        self.assertEqual(self.stock(), 0)
+
+    def test_leftover_shards_are_not_counted(self):
+        self.db.docs['products/p1']['stockShards'] = 2
+
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(self.reserve(4)[0]['reserved'], 3)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import main, admin, orders
@@ -7,9 +8,33 @@ router = DefaultRouter()
 router.register(r'products', main.ProductViewSet, basename='product')
 router.register(r'categories', main.CategoryViewSet, basename='category')
 
-urlpatterns = [
+urlpatterns = []
+
+if settings.ASYNC_CATALOG_VIEWS:
+    # Under ASGI, catalog reads are served by async views; other methods still reach the viewsets.
+    from .views import catalog_async
+    urlpatterns += [
+        path('products/', catalog_async.product_list, name='product-list'),
+        path('products/search/', catalog_async.product_search_view, name='product-search'),
+        path('products/bulk/', main.ProductViewSet.as_view({'post': 'bulk'}), name='product-bulk'),
+        path('products/<str:pk>/', catalog_async.product_detail, name='product-detail'),
+        path('categories/', catalog_async.category_list, name='category-list'),
+        path('categories/<str:pk>/', catalog_async.category_detail, name='category-detail'),
+    ]
+
+# Under ASGI, checkout is served by the async create_order
+create_order_view = orders.create_order
+if settings.ASYNC_CHECKOUT_VIEW:
+    from .views import orders_async
+    create_order_view = orders_async.create_order
+
+urlpatterns += [
     path('', include(router.urls)),
     path('admin/login/', admin.AdminLoginView.as_view(), name='admin_login'),
-    path('orders/', orders.create_order, name='create-order'),
+    path('admin/email-outbox/', admin.EmailOutboxStatsView.as_view(), name='admin-email-outbox'),
+    path('admin/metrics/', admin.MetricsView.as_view(), name='admin-metrics'),
+    path('admin/orders/', admin.AdminOrderListView.as_view(), name='admin-orders'),
+    path('admin/stats/', admin.SalesStatsView.as_view(), name='admin-stats'),
+    path('orders/', create_order_view, name='create-order'),
     path('health/', health_check, name='health_check'),
-] 
\ No newline at end of file
+]
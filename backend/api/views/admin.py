@@ -1,9 +1,67 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 import requests
 import os
+import threading
+from decimal import Decimal
+from django.conf import settings
+from django.utils.dateparse import parse_date
 from firebase_admin import auth
+from requests.adapters import HTTPAdapter
+
+from ..idempotency import RecentResults
+from ..firebase import get_db
+from ..idtokens import verify_id_token
+from ..metrics import registry as metrics_registry
+from ..order_queries import get_listing_params, get_order_filters, orders_page, orders_page_query
+from ..outbox import email_outbox
+from ..pagination import InvalidPageParams
+from ..pricing import to_money
+from ..ratelimit import rate_limiter
+from ..rollups import GRANULARITIES, add_rollup, default_range, empty_rollup, read_rollups
+
+SIGN_IN_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword"
+SIGN_IN_TIMEOUT = 10
+# Longest range the sales stats endpoint reads, in days
+MAX_STATS_DAYS = 731
+TOP_PRODUCTS = 10
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# Admin status looked up from the user record, by uid, for tokens that don't carry the claim
+admin_status_cache = RecentResults(ttl=settings.ADMIN_STATUS_CACHE_TTL)
+
+
+def identity_toolkit_session():
+    """This process's pooled session for the Identity Toolkit, so logins reuse a warm connection."""
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        with _session_lock:
+            if _session_pid != os.getpid():
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def is_admin(uid, claims):
+    """
+    Whether a user is an admin, from the `isAdmin` custom claim of their verified token.
+    Firebase copies custom claims into every token it issues, so the user record is only read
+    (and its answer cached briefly) for a token without the claim.
+    """
+    if 'isAdmin' in claims:
+        return bool(claims['isAdmin'])
+    cached = admin_status_cache.get(uid)
+    if cached is None:
+        cached = bool((auth.get_user(uid).custom_claims or {}).get('isAdmin', False))
+        admin_status_cache.put(uid, cached)
+    return cached
+
 
 class AdminLoginView(APIView):
     """
@@ -23,9 +81,6 @@ class AdminLoginView(APIView):
         if not web_api_key:
             return Response({'error': 'Server configuration error: Firebase Web API Key not set.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Construct the Firebase Auth REST API URL
-        rest_api_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={web_api_key}"
-        
         # Prepare the payload
         payload = {
             'email': email,
@@ -34,8 +89,10 @@ class AdminLoginView(APIView):
         }
 
         try:
-            # Make the request to Firebase
-            response = requests.post(rest_api_url, json=payload)
+            # Make the request to Firebase (the only outbound call: the token is verified locally)
+            response = identity_toolkit_session().post(
+                SIGN_IN_URL, params={'key': web_api_key}, json=payload, timeout=SIGN_IN_TIMEOUT,
+            )
             response_data = response.json()
 
             if response.status_code != 200:
@@ -45,14 +102,11 @@ class AdminLoginView(APIView):
             # Successfully authenticated with Firebase, now verify admin status
             id_token = response_data.get('idToken')
             try:
-                decoded_token = auth.verify_id_token(id_token)
+                decoded_token = verify_id_token(id_token)
                 uid = decoded_token['uid']
                 
                 # Check for the custom admin claim
-                user_record = auth.get_user(uid)
-                is_admin = user_record.custom_claims.get('isAdmin', False)
-                
-                if not is_admin:
+                if not is_admin(uid, decoded_token):
                     return Response({'error': 'You do not have admin privileges.'}, status=status.HTTP_403_FORBIDDEN)
 
                 # User is an admin, return the token
@@ -68,4 +122,117 @@ class AdminLoginView(APIView):
                  return Response({'error': f'An error occurred during admin verification: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         except requests.exceptions.RequestException as e:
-            return Response({'error': f'Could not connect to authentication service: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE) 
\ No newline at end of file
+            return Response({'error': f'Could not connect to authentication service: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE) 
+
+class EmailOutboxStatsView(APIView):
+    """GET /api/admin/email-outbox/ - Order email queue depth and age (admin only)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        # Also makes sure this worker drains jobs left over from before a restart
+        email_outbox.start()
+        return Response(email_outbox.stats())
+
+
+class MetricsView(APIView):
+    """
+    GET /api/admin/metrics/ - Latency histograms (e.g. each checkout stage), email queue stats
+    and rate limit counters (admin only).
+    Latency is kept per worker process, so this reports the worker that answered; the email queue
+    and rate limit counters are shared by all workers.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'pid': os.getpid(),
+            'latency': metrics_registry.snapshot(),
+            'email_outbox': email_outbox.stats(),
+            'rate_limits': rate_limiter.stats(),
+        })
+
+
+class AdminOrderListView(APIView):
+    """
+    GET /api/admin/orders/ - Orders, newest first (admin only).
+    Filters: `created_from`/`created_to` (ISO dates or datetimes; a `created_to` date includes that
+    whole day), `status` (PayPal payment status), `shipping_method`, and `coupon` (a code, or `none`).
+    Pages hold `limit` orders (default 50); pass the returned `next_cursor` as `cursor` for the next one.
+    Each order is a summary of its main fields; pass `view=full` for the whole documents.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit, cursor, view = get_listing_params(request.query_params)
+            equals, created_from, created_to = get_order_filters(request.query_params)
+        except InvalidPageParams as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders_ref = get_db().collection('orders')
+        query = orders_page_query(orders_ref, equals, created_from, created_to, limit, cursor, view)
+        orders, next_cursor = orders_page([(doc.id, doc.to_dict()) for doc in query.stream()], limit)
+        return Response({'results': orders, 'next_cursor': next_cursor})
+
+
+def rollup_summary(rollup):
+    """The API form of a rollup: money in shekels (rollups keep whole cents), and the products sold ranked by units."""
+    products = sorted(rollup['units'].items(), key=lambda item: item[1], reverse=True)
+    revenue = Decimal(rollup['revenue_cents']) / 100
+    return {
+        'revenue': float(revenue),
+        'orders': rollup['orders'],
+        'average_order': float(to_money(revenue / rollup['orders'])) if rollup['orders'] else None,
+        'coupons': rollup['coupons'],
+        'shipping': rollup['shipping'],
+        'products': [
+            {'id': product_id, 'name': rollup['product_names'].get(product_id), 'units': units}
+            for product_id, units in products
+        ],
+    }
+
+
+class SalesStatsView(APIView):
+    """
+    GET /api/admin/stats/ - Revenue, orders, units per product, coupon usage and the delivery/pickup
+    split per day or per week (`period=day|week`), from `from` to `to` (ISO dates, inclusive;
+    default the last 30 days or 12 weeks), plus totals over the range (admin only).
+    Reads only the sales rollups (see api/rollups.py), never the orders themselves.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        granularity = request.query_params.get('period', 'day')
+        if granularity not in GRANULARITIES:
+            return Response({'error': "period must be 'day' or 'week'."}, status=status.HTTP_400_BAD_REQUEST)
+        first_day, last_day = default_range(granularity)
+        try:
+            if request.query_params.get('from'):
+                first_day = parse_date(request.query_params['from'])
+            if request.query_params.get('to'):
+                last_day = parse_date(request.query_params['to'])
+        except ValueError:
+            first_day = None
+        if first_day is None or last_day is None:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD).'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= (last_day - first_day).days <= MAX_STATS_DAYS:
+            return Response(
+                {'error': f'to must be on or after from, and at most {MAX_STATS_DAYS} days later.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rollups = read_rollups(get_db(), granularity, first_day, last_day)
+        totals = empty_rollup()
+        for rollup in rollups.values():
+            add_rollup(totals, rollup)
+        totals = rollup_summary(totals)
+        totals['products'] = totals['products'][:TOP_PRODUCTS]
+        return Response({
+            'period': granularity,
+            'from': first_day,
+            'to': last_day,
+            'periods': [
+                {'period': key.split('-', 1)[1], **rollup_summary(rollup)} for key, rollup in sorted(rollups.items())
+            ],
+            'totals': totals,
+        })
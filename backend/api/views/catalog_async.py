@@ -0,0 +1,221 @@
+"""
+Async, read-only versions of the catalog endpoints for the ASGI entry point.
+
+When ASYNC_CATALOG_VIEWS is on (claudeShopBackend/asgi.py turns it on), GET and HEAD requests
+for products and categories are served by the coroutines below. They wait on Firestore through
+the AsyncClient instead of holding one of the worker's threads. Every other method is handed to
+the regular DRF viewsets in views/main.py, so writes and permissions behave exactly as before.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from ..catalog import (
+    CATEGORY_FIELDS, PRODUCT_FIELDS, catalog, category_field_paths, category_refs_to_resolve, conditional_headers,
+    filter_products, get_fields_param, product_field_paths, project, serialize_product,
+)
+from ..firebase import get_async_db
+from ..pagination import (
+    DOCUMENT_ID, MAX_PAGE_SIZE, InvalidPageParams, get_page_params, get_stream_format, next_cursor_for,
+    paginate_query, paginate_sorted, streaming_response,
+)
+from ..search import InvalidQuery, product_search
+from .main import CategoryViewSet, ProductViewSet
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def error_response(message, status=400):
+    return json_response({"error": message}, status=status)
+
+
+async def get_snapshot():
+    """Returns the catalog snapshot (None when the cache is disabled). Only the very first load uses a thread."""
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    return catalog.peek() or await sync_to_async(catalog.get, thread_sensitive=False)()
+
+
+async def resolve_categories(db, category_refs):
+    """Async counterpart of catalog.resolve_categories: one batched `get_all` for all references."""
+    unique_refs = {ref.path: ref for ref in category_refs if ref is not None}
+    if not unique_refs:
+        return {}
+
+    categories = {}
+    async for category_doc in db.get_all(list(unique_refs.values())):
+        if category_doc.exists:
+            categories[category_doc.reference.path] = {"id": category_doc.id, **category_doc.to_dict()}
+    return categories
+
+
+async def serialize_products(db, docs):
+    categories = await resolve_categories(db, category_refs_to_resolve(docs))
+    return [serialize_product(doc_id, data, categories) for doc_id, data in docs]
+
+
+async def iter_products(db, query, chunk_size=100):
+    """Async counterpart of catalog.iter_products, streaming products straight from a query."""
+    chunk = []
+    async for doc in query.stream():
+        chunk.append((doc.id, doc.to_dict()))
+        if len(chunk) >= chunk_size:
+            for product in await serialize_products(db, chunk):
+                yield product
+            chunk = []
+    for product in await serialize_products(db, chunk):
+        yield product
+
+
+def catalog_read(read_handler, fallback_view):
+    """
+    Builds the URL-level view: reads go to `read_handler` (with ETag/Cache-Control handling,
+    see conditional_catalog_read), anything else to the DRF `fallback_view`.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(fallback_view)(request, *args, **kwargs)
+
+        snapshot = await get_snapshot()
+        headers, not_modified = conditional_headers(request, snapshot)
+        if not_modified:
+            return HttpResponse(status=304, headers=headers)
+
+        try:
+            response = await read_handler(request, snapshot, *args, **kwargs)
+        except InvalidPageParams as e:
+            return error_response(str(e))
+        if response.status_code == 200:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    # The DRF fallback does its own CSRF checks
+    view.csrf_exempt = True
+    return view
+
+
+# --- Products ---
+
+async def list_products(request, snapshot):
+    """Async ProductViewSet.list: same filters, fields, pagination and streaming."""
+    params = request.GET
+    category_id = params.get('category_id')
+    name_query = params.get('name')
+    fields = get_fields_param(params, PRODUCT_FIELDS)
+    limit, cursor = get_page_params(params)
+    stream_format = get_stream_format(params)
+    if limit and stream_format:
+        return error_response("stream can't be combined with limit.")
+
+    if snapshot is not None:
+        products = filter_products(snapshot.products, category_id, name_query)
+        if limit:
+            page, next_cursor = paginate_sorted(products, limit, cursor)
+            return json_response({"results": [project(p, fields) for p in page], "next_cursor": next_cursor})
+        if stream_format:
+            return streaming_response((project(p, fields) for p in products), stream_format)
+        return json_response([project(p, fields) for p in products])
+
+    db = get_async_db()
+    products_ref = db.collection('products')
+    query = products_ref
+    order_fields = ()
+    if category_id:
+        query = query.where('categoryRef', '==', db.collection('categories').document(category_id))
+    if name_query:
+        query = query.where('name', '>=', name_query).where('name', '<=', name_query + u'\uf8ff')
+        order_fields = ('name',)
+    if fields is not None:
+        query = query.select(product_field_paths(fields, extra=order_fields))
+
+    if limit:
+        query = paginate_query(query, products_ref, limit, cursor, order_fields)
+        docs, next_cursor = next_cursor_for([(doc.id, doc.to_dict()) async for doc in query.stream()], limit, order_fields)
+        page = [project(p, fields) for p in await serialize_products(db, docs)]
+        return json_response({"results": page, "next_cursor": next_cursor})
+
+    if stream_format:
+        async def products():
+            async for product in iter_products(db, query):
+                yield project(product, fields)
+        return streaming_response(products(), stream_format)
+
+    docs = [(doc.id, doc.to_dict()) async for doc in query.stream()]
+    return json_response([project(p, fields) for p in await serialize_products(db, docs)])
+
+
+async def retrieve_product(request, snapshot, pk):
+    """Async ProductViewSet.retrieve."""
+    fields = get_fields_param(request.GET, PRODUCT_FIELDS)
+    if snapshot is not None and pk in snapshot.products_by_id:
+        return json_response(project(snapshot.products_by_id[pk], fields))
+
+    db = get_async_db()
+    # A single document asked for by id alone is read whole; project() trims it
+    field_paths = product_field_paths(fields) if fields is not None else None
+    doc = await db.collection('products').document(pk).get(
+        field_paths=None if field_paths == [DOCUMENT_ID] else field_paths
+    )
+    if not doc.exists:
+        return HttpResponse(status=404)
+    product = (await serialize_products(db, [(doc.id, doc.to_dict())]))[0]
+    return json_response(project(product, fields))
+
+
+async def search_products(request, snapshot):
+    """Async ProductViewSet.search. The index lives in memory, so this never waits on Firestore once warm."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return error_response("q is required.")
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), MAX_PAGE_SIZE))
+    except ValueError:
+        return error_response("limit must be an integer.")
+
+    if snapshot is None:
+        snapshot = await sync_to_async(catalog.get, thread_sensitive=False)()
+    try:
+        return json_response(product_search.search(snapshot, query, limit))
+    except InvalidQuery as e:
+        return error_response(str(e))
+
+
+# --- Categories ---
+
+async def list_categories(request, snapshot):
+    """Async CategoryViewSet.list."""
+    fields = get_fields_param(request.GET, CATEGORY_FIELDS)
+    if snapshot is not None:
+        return json_response([project(c, fields) for c in snapshot.categories])
+
+    query = get_async_db().collection('categories')
+    if fields is not None:
+        query = query.select(category_field_paths(fields))
+    return json_response([project({"id": doc.id, **doc.to_dict()}, fields) async for doc in query.stream()])
+
+
+async def retrieve_category(request, snapshot, pk):
+    """Async CategoryViewSet.retrieve."""
+    if snapshot is not None and pk in snapshot.categories_by_id:
+        return json_response(snapshot.categories_by_id[pk])
+
+    doc = await get_async_db().collection('categories').document(pk).get()
+    if not doc.exists:
+        return HttpResponse(status=404)
+    return json_response({"id": doc.id, **doc.to_dict()})
+
+
+product_list = catalog_read(list_products, ProductViewSet.as_view({'get': 'list', 'post': 'create'}))
+product_search_view = catalog_read(search_products, ProductViewSet.as_view({'get': 'search'}))
+product_detail = catalog_read(retrieve_product, ProductViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}
+))
+category_list = catalog_read(list_categories, CategoryViewSet.as_view({'get': 'list', 'post': 'create'}))
+category_detail = catalog_read(retrieve_category, CategoryViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}
+))
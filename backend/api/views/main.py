@@ -2,20 +2,79 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny
 from firebase_admin import firestore
+import functools
+from collections import namedtuple
 from django.http import JsonResponse
-from rest_framework.decorators import api_view
+from django.conf import settings
+from rest_framework.decorators import api_view, action
+from google.api_core.exceptions import NotFound
 
 # The OrderViewSet still uses Django's ORM and serializers.
 # This would be the next thing to migrate if you want orders in Firestore too.
 from ..models import Order
 from ..serializers import OrderSerializer
+from ..catalog import (
+    CATEGORY_FIELDS, PRODUCT_FIELDS, catalog, category_field_paths, category_id_of, category_refs_to_resolve,
+    conditional_headers, filter_products, get_fields_param, iter_products, product_field_paths, project,
+    resolve_categories, serialize_product,
+)
+from ..firebase import get_db
+from ..search import InvalidQuery, product_search
+from ..stock import restock_fields
+from ..pagination import (
+    DOCUMENT_ID, MAX_PAGE_SIZE, InvalidPageParams, get_page_params, get_stream_format, next_cursor_for,
+    paginate_query, paginate_sorted, streaming_response,
+)
+
+# Firestore commits at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+MAX_BULK_OPERATIONS = 5000
+
+# A validated product write: the operation, the product document and its fields,
+# and the `productCount` change ({category id: +1/-1}) it implies
+ProductWrite = namedtuple('ProductWrite', ['index', 'op', 'doc_ref', 'fields', 'count_deltas'])
+
+
+def parse_number(value, number_type, field):
+    """Converts a request value with `number_type` (int or float), raising ValueError with a readable message."""
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number.")
+
+
+def conditional_catalog_read(handler):
+    """
+    Wraps a catalog read so it sends a strong ETag and CATALOG_CACHE_CONTROL, and answers a
+    matching If-None-Match with 304 before the handler (and any Firestore query) runs.
+    ETags need the in-memory snapshot's version, so they are only sent when the catalog cache is enabled.
+    """
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        snapshot = catalog.get() if settings.CATALOG_CACHE_ENABLED else None
+        headers, not_modified = conditional_headers(request, snapshot)
+        if not_modified:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = handler(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+    return wrapper
+
 
 class CategoryViewSet(viewsets.ViewSet):
     """
     A ViewSet for listing, retrieving, creating, updating, and deleting categories in Firestore.
     """
-    db = firestore.client()
-    categories_ref = db.collection('categories')
+    @property
+    def db(self):
+        return get_db()
+
+    @property
+    def categories_ref(self):
+        return self.db.collection('categories')
 
     def get_permissions(self):
         """
@@ -28,14 +87,34 @@ class CategoryViewSet(viewsets.ViewSet):
             self.permission_classes = [AllowAny]
         return super().get_permissions()
 
+    @conditional_catalog_read
     def list(self, request):
-        """GET /api/categories/ - List all categories."""
-        docs = self.categories_ref.stream()
-        categories = [{"id": doc.id, **doc.to_dict()} for doc in docs]
+        """
+        GET /api/categories/ - List all categories.
+        Pass `fields` (e.g. ?fields=id,name) to get only some fields of each category.
+        """
+        try:
+            fields = get_fields_param(request.query_params, CATEGORY_FIELDS)
+        except InvalidPageParams as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if settings.CATALOG_CACHE_ENABLED:
+            return Response([project(c, fields) for c in catalog.get().categories])
+
+        query = self.categories_ref
+        if fields is not None:
+            # Only the requested fields are transferred from Firestore
+            query = query.select(category_field_paths(fields))
+        categories = [project({"id": doc.id, **doc.to_dict()}, fields) for doc in query.stream()]
         return Response(categories)
 
+    @conditional_catalog_read
     def retrieve(self, request, pk=None):
         """GET /api/categories/{id}/ - Retrieve a single category."""
+        if settings.CATALOG_CACHE_ENABLED:
+            category = catalog.get().categories_by_id.get(pk)
+            if category is not None:
+                return Response(category)
+
         doc_ref = self.categories_ref.document(pk)
         doc = doc_ref.get()
         if doc.exists:
@@ -47,16 +126,36 @@ class CategoryViewSet(viewsets.ViewSet):
         name = request.data.get('name')
         if not name:
             return Response({"error": "Category name is required."}, status=status.HTTP_400_BAD_REQUEST)
-        doc_ref = self.categories_ref.add({'name': name})
+        doc_ref = self.categories_ref.add({'name': name, 'productCount': 0})
+        catalog.refresh()
         return Response({"id": doc_ref[1].id, "name": name}, status=status.HTTP_201_CREATED)
 
     def update(self, request, pk=None):
-        """PUT /api/categories/{id}/ - Update a category."""
+        """
+        PUT /api/categories/{id}/ - Update a category.
+        A rename is also written to the `categoryName` of every product in the category,
+        in batches of FIRESTORE_BATCH_LIMIT writes (the first one also renames the category).
+        """
         doc_ref = self.categories_ref.document(pk)
         name = request.data.get('name')
         if not name:
             return Response({"error": "Category name is required."}, status=status.HTTP_400_BAD_REQUEST)
-        doc_ref.update({'name': name})
+
+        product_refs = [
+            doc.reference for doc in
+            self.db.collection('products').where('categoryRef', '==', doc_ref).select([DOCUMENT_ID]).stream()
+        ]
+        batch = self.db.batch()
+        batch.update(doc_ref, {'name': name})
+        writes = 1
+        for product_ref in product_refs:
+            if writes == FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                batch, writes = self.db.batch(), 0
+            batch.update(product_ref, {'categoryId': pk, 'categoryName': name})
+            writes += 1
+        batch.commit()
+        catalog.refresh()
         return Response({"id": pk, "name": name})
 
     def destroy(self, request, pk=None):
@@ -65,6 +164,7 @@ class CategoryViewSet(viewsets.ViewSet):
         # A more robust implementation might handle that, e.g., using a Cloud Function.
         doc_ref = self.categories_ref.document(pk)
         doc_ref.delete()
+        catalog.refresh()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -73,28 +173,62 @@ class ProductViewSet(viewsets.ViewSet):
     A ViewSet for listing, retrieving, and filtering products from Firestore.
     Admin users can also create, update, and delete products.
     """
-    db = firestore.client()
-    products_ref = db.collection('products')
-    categories_ref = db.collection('categories')
+    @property
+    def db(self):
+        return get_db()
+
+    @property
+    def products_ref(self):
+        return self.db.collection('products')
+
+    @property
+    def categories_ref(self):
+        return self.db.collection('categories')
 
     def get_permissions(self):
         """Set permissions based on action."""
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk', 'restock']:
             self.permission_classes = [IsAdminUser]
         else:
             self.permission_classes = [AllowAny]
         return super().get_permissions()
 
+    @conditional_catalog_read
     def list(self, request):
         """
         GET /api/products/ - List all products.
         Supports filtering by `category_id` and searching by `name`.
         e.g., /api/products/?category_id=...&name=...
+
+        Pass `limit` (and the returned `next_cursor` as `cursor`) to page through the results,
+        or `stream=json`/`stream=ndjson` to have the full listing written out as it is produced.
+        Pass `fields` (e.g. ?fields=id,name,price) to get only some fields of each product;
+        the category is only looked up when `category` is one of them.
         """
-        query = self.products_ref
-        
         category_id = request.query_params.get('category_id')
         name_query = request.query_params.get('name')
+        try:
+            fields = get_fields_param(request.query_params, PRODUCT_FIELDS)
+            limit, cursor = get_page_params(request.query_params)
+            stream_format = get_stream_format(request.query_params)
+        except InvalidPageParams as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if limit and stream_format:
+            return Response({"error": "stream can't be combined with limit."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.CATALOG_CACHE_ENABLED:
+            # Served from this worker's in-memory catalog snapshot, no Firestore round trip
+            products = filter_products(catalog.get().products, category_id, name_query)
+
+            if limit:
+                page, next_cursor = paginate_sorted(products, limit, cursor)
+                return Response({"results": [project(p, fields) for p in page], "next_cursor": next_cursor})
+            if stream_format:
+                return streaming_response((project(p, fields) for p in products), stream_format)
+            return Response([project(p, fields) for p in products])
+
+        query = self.products_ref
+        order_fields = ()
 
         # Filter by category
         if category_id:
@@ -105,88 +239,358 @@ class ProductViewSet(viewsets.ViewSet):
         # For full-text search, a dedicated search service like Algolia or Elasticsearch is recommended.
         if name_query:
             query = query.where('name', '>=', name_query).where('name', '<=', name_query + u'\uf8ff')
+            # Firestore requires a range-filtered field to be ordered first
+            order_fields = ('name',)
+
+        if fields is not None:
+            # Only the requested fields (plus those the cursor needs) are transferred from Firestore
+            query = query.select(product_field_paths(fields, extra=order_fields))
+
+        if limit:
+            query = paginate_query(query, self.products_ref, limit, cursor, order_fields)
+            docs, next_cursor = next_cursor_for([(doc.id, doc.to_dict()) for doc in query.stream()], limit, order_fields)
+            page = [project(p, fields) for p in self._serialize(docs)]
+            return Response({"results": page, "next_cursor": next_cursor})
 
-        docs = query.stream()
-        products = []
-        for doc in docs:
-            product_data = doc.to_dict()
-            # Resolve the category reference to include category name
-            category_doc = product_data['categoryRef'].get()
-            if category_doc.exists:
-                product_data['category'] = {"id": category_doc.id, **category_doc.to_dict()}
-            del product_data['categoryRef'] # Clean up the response
-            products.append({"id": doc.id, **product_data})
-            
-        return Response(products)
+        if stream_format:
+            products = iter_products(self.db, query.stream())
+            return streaming_response((project(p, fields) for p in products), stream_format)
 
+        docs = [(doc.id, doc.to_dict()) for doc in query.stream()]
+        return Response([project(p, fields) for p in self._serialize(docs)])
+
+    def _serialize(self, docs):
+        """Serializes `(id, data)` product pairs, resolving all category references in one batched read."""
+        categories = resolve_categories(self.db, category_refs_to_resolve(docs))
+        return [serialize_product(doc_id, data, categories) for doc_id, data in docs]
+
+    @action(detail=False, methods=['get'])
+    @conditional_catalog_read
+    def search(self, request):
+        """
+        GET /api/products/search/?q=... - Full-text search over product names and descriptions.
+        Matches whole words, prefixes and substrings (ignoring niqqud, final letters and geresh),
+        best matches first. Accepts an optional `limit` (default 20). Long queries (see search.MAX_QUERY_TERMS) get a 400.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), MAX_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return Response(product_search.search(catalog.get(), query, limit))
+        except InvalidQuery as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @conditional_catalog_read
     def retrieve(self, request, pk=None):
-        """GET /api/products/{id}/ - Retrieve a single product."""
+        """
+        GET /api/products/{id}/ - Retrieve a single product.
+        Supports the same `fields` parameter as the list.
+        """
+        try:
+            fields = get_fields_param(request.query_params, PRODUCT_FIELDS)
+        except InvalidPageParams as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if settings.CATALOG_CACHE_ENABLED:
+            product = catalog.get().products_by_id.get(pk)
+            if product is not None:
+                return Response(project(product, fields))
+
         doc_ref = self.products_ref.document(pk)
-        doc = doc_ref.get()
+        # A single document asked for by id alone is read whole; project() trims it
+        field_paths = product_field_paths(fields) if fields is not None else None
+        doc = doc_ref.get(field_paths=None if field_paths == [DOCUMENT_ID] else field_paths)
         if not doc.exists:
             return Response(status=status.HTTP_404_NOT_FOUND)
         
         product_data = doc.to_dict()
-        category_doc = product_data['categoryRef'].get()
-        if category_doc.exists:
-            product_data['category'] = {"id": category_doc.id, **category_doc.to_dict()}
-        del product_data['categoryRef']
-        
-        return Response({"id": doc.id, **product_data})
+        categories = resolve_categories(self.db, category_refs_to_resolve([(doc.id, product_data)]))
+        return Response(project(serialize_product(doc.id, product_data, categories), fields))
     
     def create(self, request):
         """POST /api/products/ - Create a new product."""
         # A proper implementation would use serializers for validation here.
         data = request.data
+        writes, errors = self._prepare_writes([{'op': 'create', 'data': data}])
+        if errors:
+            return Response({"error": errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+        self._commit_writes(writes, raise_errors=True)
+        catalog.refresh()
+        return Response({"id": writes[0].doc_ref.id, **data}, status=status.HTTP_201_CREATED)
+
+    def update(self, request, pk=None):
+        """PUT /api/products/{id}/ - Update a product."""
+        data = request.data
+        writes, errors = self._prepare_writes([{'op': 'update', 'id': pk, 'data': data}])
+        if errors:
+            return Response({"error": errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+        self._commit_writes(writes, raise_errors=True)
+        catalog.refresh()
+        return Response({"id": pk, **data})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        POST /api/products/bulk/ - Create, update and delete many products in one request.
+        The body is a list (or {"operations": [...]}) of operations such as
+        {"op": "update", "id": "...", "data": {"price": 12}}, {"op": "create", "data": {...}}
+        or {"op": "delete", "id": "..."}; `data` takes the same fields as create/update.
+
+        Every operation is validated before anything is written; if any is invalid, nothing is
+        written and the errors are returned. Each product may appear in only one operation, a create
+        can't reuse an existing id, and updates and deletes must name existing products. Otherwise the writes are committed in WriteBatches
+        of up to 500 operations (one round trip each) and one result per operation is returned.
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "A non-empty list of operations is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > MAX_BULK_OPERATIONS:
+            return Response({"error": f"At most {MAX_BULK_OPERATIONS} operations per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        writes, errors = self._prepare_writes(operations)
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = self._commit_writes(writes)
+        catalog.refresh()
+        all_ok = all(result['status'] == 'ok' for result in results)
+        return Response({"results": results}, status=status.HTTP_200_OK if all_ok else status.HTTP_207_MULTI_STATUS)
+
+    @action(detail=True, methods=['post'])
+    def restock(self, request, pk=None):
+        """
+        POST /api/products/{id}/restock/ - Restock a product, to a new `quantity` if one is given.
+        Its remaining stock goes back to its quantity on the next order, even when the quantity
+        is unchanged (see api/stock.py).
+        """
+        quantity = request.data.get('quantity') if isinstance(request.data, dict) else None
+        if quantity is not None:
+            try:
+                quantity = parse_number(quantity, int, 'quantity')
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if quantity < 0:
+                return Response({"error": "quantity must not be negative."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            self.products_ref.document(pk).update(restock_fields(quantity))
+        except NotFound:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        catalog.refresh()
+        body = {"id": pk, "restocked": True}
+        if quantity is not None:
+            body['quantity'] = quantity
+        return Response(body)
+
+    def destroy(self, request, pk=None):
+        """DELETE /api/products/{id}/ - Delete a product."""
+        writes, errors = self._prepare_writes([{'op': 'delete', 'id': pk}])
+        if errors:
+            return Response({"error": errors[0]['error']}, status=status.HTTP_404_NOT_FOUND)
+        self._commit_writes(writes, raise_errors=True)
+        catalog.refresh()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # --- Write helpers ---
+
+    def _prepare_writes(self, operations):
+        """
+        Validates product operations (see `bulk`) and works out everything they write:
+        the product document, its denormalized `categoryId`/`categoryName`, and the
+        `productCount` change of every category the product enters or leaves.
+        The current products and all categories involved are read at most once each, in batch.
+        Returns (writes, errors); `errors` lists {"index", "error"} for every invalid operation.
+        """
+        parsed, errors = [], []
+        seen_ids = set()
+        for index, operation in enumerate(operations):
+            try:
+                op, doc_ref, fields = self._parse_operation(operation)
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+                continue
+            # Each write works out its productCount change on its own, so a product may only appear once
+            if doc_ref.id in seen_ids:
+                errors.append({"index": index, "error": f"Product {doc_ref.id} appears in more than one operation."})
+                continue
+            seen_ids.add(doc_ref.id)
+            parsed.append((index, op, doc_ref, fields))
+
+        # Creates with a client-chosen id are read too, so an existing product isn't overwritten
+        current = self._current_products([
+            doc_ref for index, op, doc_ref, _ in parsed if op != 'create' or operations[index].get('id')
+        ])
+        category_ids = {fields['categoryId'] for _, _, _, fields in parsed if fields and 'categoryId' in fields}
+        category_ids |= {category_id_of(product) for product in current.values()} - {None}
+        category_names = self._category_names(category_ids)
+
+        writes = []
+        for index, op, doc_ref, fields in parsed:
+            if op == 'create' and doc_ref.id in current:
+                errors.append({"index": index, "error": f"Product {doc_ref.id} already exists."})
+                continue
+            if op != 'create' and doc_ref.id not in current:
+                errors.append({"index": index, "error": f"Product {doc_ref.id} does not exist."})
+                continue
+            old_category = category_id_of(current.get(doc_ref.id))
+            new_category = fields.get('categoryId') if fields else None
+            if new_category is not None:
+                if new_category not in category_names:
+                    errors.append({"index": index, "error": f"Category {new_category} does not exist."})
+                    continue
+                fields['categoryName'] = category_names[new_category]
+
+            count_deltas = {}
+            if op == 'create':
+                count_deltas[new_category] = 1
+            elif op == 'update' and new_category is not None and new_category != old_category:
+                count_deltas[new_category] = 1
+                if old_category in category_names:
+                    count_deltas[old_category] = -1
+            elif op == 'delete' and old_category in category_names:
+                count_deltas[old_category] = -1
+            writes.append(ProductWrite(index, op, doc_ref, fields, count_deltas))
+
+        return writes, sorted(errors, key=lambda e: e['index'])
+
+    def _commit_writes(self, writes, raise_errors=False):
+        """
+        Commits product writes, plus their categories' `productCount` increments, in WriteBatches
+        of at most FIRESTORE_BATCH_LIMIT writes, so each product write and its count changes land together.
+        Returns one result per write; with `raise_errors`, a failed commit raises instead.
+        """
+        results = []
+        chunk, touched = [], set()
+
+        def flush():
+            batch = self.db.batch()
+            net_deltas = {}
+            for write in chunk:
+                if write.op == 'create':
+                    batch.create(write.doc_ref, write.fields)
+                elif write.op == 'update':
+                    batch.update(write.doc_ref, write.fields)
+                else:
+                    batch.delete(write.doc_ref)
+                for category_id, delta in write.count_deltas.items():
+                    net_deltas[category_id] = net_deltas.get(category_id, 0) + delta
+            for category_id, delta in net_deltas.items():
+                if delta:
+                    batch.update(self.categories_ref.document(category_id), {'productCount': firestore.Increment(delta)})
+            try:
+                batch.commit()
+                outcome = {"status": "ok"}
+            except Exception as e:
+                if raise_errors:
+                    raise
+                outcome = {"status": "error", "error": str(e)}
+            results.extend({"index": w.index, "op": w.op, "id": w.doc_ref.id, **outcome} for w in chunk)
+            chunk.clear()
+            touched.clear()
+
+        for write in writes:
+            if chunk and len(chunk) + 1 + len(touched | set(write.count_deltas)) > FIRESTORE_BATCH_LIMIT:
+                flush()
+            chunk.append(write)
+            touched.update(write.count_deltas)
+        if chunk:
+            flush()
+        return results
+
+    def _parse_operation(self, operation):
+        """Validates one product operation and returns (op, doc_ref, fields). Raises ValueError."""
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object.")
+        op = operation.get('op')
+        product_id = operation.get('id')
+        data = operation.get('data') or {}
+        if not isinstance(data, dict):
+            raise ValueError("data must be an object.")
+        if product_id is not None and (not isinstance(product_id, str) or '/' in product_id):
+            raise ValueError("id must be a product id.")
+
+        if op == 'create':
+            doc_ref = self.products_ref.document(product_id) if product_id else self.products_ref.document()
+            return op, doc_ref, self._new_product_data(data)
+        if op not in ('update', 'delete'):
+            raise ValueError("op must be one of 'create', 'update' or 'delete'.")
+        if not product_id:
+            raise ValueError(f"id is required for {op}.")
+        doc_ref = self.products_ref.document(product_id)
+        if op == 'delete':
+            return op, doc_ref, None
+
+        update_data = self._update_product_data(data)
+        if not update_data:
+            raise ValueError("data has no fields to update.")
+        return op, doc_ref, update_data
+
+    def _current_products(self, doc_refs):
+        """
+        Returns {id: product} for those of `doc_refs` that exist. Products in the catalog snapshot
+        are taken from memory; the rest are read with one batched `get_all`.
+        """
+        known = catalog.get().products_by_id if settings.CATALOG_CACHE_ENABLED else {}
+        products = {doc_ref.id: known[doc_ref.id] for doc_ref in doc_refs if doc_ref.id in known}
+        to_read = [doc_ref for doc_ref in doc_refs if doc_ref.id not in known]
+        if to_read:
+            products.update({doc.id: doc.to_dict() for doc in self.db.get_all(to_read) if doc.exists})
+        return products
+
+    def _category_names(self, category_ids):
+        """Returns {id: name} for those of `category_ids` that exist, from the snapshot or one batched read."""
+        known = catalog.get().categories_by_id if settings.CATALOG_CACHE_ENABLED else {}
+        names = {cid: known[cid].get('name') for cid in category_ids if cid in known}
+        to_read = [self.categories_ref.document(cid) for cid in category_ids if cid not in known]
+        if to_read:
+            names.update({doc.id: doc.get('name') for doc in self.db.get_all(to_read) if doc.exists})
+        return names
+
+    def _new_product_data(self, data):
+        """Builds the document for a new product from request data. Raises ValueError if it is invalid."""
         category_id = data.get('category_id')
         if not category_id:
-             return Response({"error": "category_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+            raise ValueError("category_id is required.")
 
-        category_ref = self.categories_ref.document(category_id)
-        
         new_product = {
             'name': data.get('name', ''),
             'description': data.get('description', ''),
-            'price': float(data.get('price', 0)),
-            'quantity': int(data.get('quantity', 0)),
+            'price': parse_number(data.get('price', 0), float, 'price'),
+            'quantity': parse_number(data.get('quantity', 0), int, 'quantity'),
             'imageUrl': data.get('imageUrl', ''),
-            'categoryRef': category_ref
+            'categoryRef': self.categories_ref.document(category_id),
+            'categoryId': category_id,
         }
         # Basic validation
         if not new_product['name'] or new_product['price'] <= 0:
-            return Response({"error": "Valid name and price are required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        doc_ref = self.products_ref.add(new_product)
-        return Response({"id": doc_ref[1].id, **data}, status=status.HTTP_201_CREATED)
+            raise ValueError("Valid name and price are required.")
+        return new_product
 
-    def update(self, request, pk=None):
-        """PUT /api/products/{id}/ - Update a product."""
-        doc_ref = self.products_ref.document(pk)
-        data = request.data
-        
+    def _update_product_data(self, data):
+        """Builds the fields to update from request data, skipping those not given. Raises ValueError if invalid."""
         update_data = {
             'name': data.get('name'),
             'description': data.get('description'),
-            'price': float(data.get('price')) if data.get('price') is not None else None,
-            'quantity': int(data.get('quantity')) if data.get('quantity') is not None else None,
+            'price': parse_number(data.get('price'), float, 'price') if data.get('price') is not None else None,
+            'quantity': parse_number(data.get('quantity'), int, 'quantity') if data.get('quantity') is not None else None,
             'imageUrl': data.get('imageUrl') if 'imageUrl' in data else None
         }
-        
+
         # Filter out any None values so we don't overwrite fields with nulls
         update_data = {k: v for k, v in update_data.items() if v is not None}
-        
+
         if 'category_id' in data:
             category_ref = self.categories_ref.document(data['category_id'])
             update_data['categoryRef'] = category_ref
+            update_data['categoryId'] = data['category_id']
+        return update_data
 
-        doc_ref.update(update_data)
-        return Response({"id": pk, **data})
-
-    def destroy(self, request, pk=None):
-        """DELETE /api/products/{id}/ - Delete a product."""
-        doc_ref = self.products_ref.document(pk)
-        doc_ref.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class OrderViewSet(viewsets.ModelViewSet):
     """
@@ -1,114 +1,36 @@
-import os
-import sys
-from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
 import json
 import datetime
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-import requests # Will be used for PayPal API calls
-
-# --- Firebase Initialization ---
-# This setup is based on your populate_firestore.py script
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-sys.path.append(project_root)
-env_path = os.path.join(project_root, 'backend', '.env')
-load_dotenv(dotenv_path=env_path)
-
-def initialize_firebase():
-    """Initializes the Firebase Admin SDK if not already initialized."""
-    if not firebase_admin._apps:
-        try:
-            private_key = os.getenv('PRIVATE_KEY', '').replace('\\n', '\n')
-            creds = {
-                "type": os.getenv("TYPE"),
-                "project_id": os.getenv("PROJECT_ID"),
-                "private_key_id": os.getenv("PRIVATE_KEY_ID"),
-                "private_key": private_key,
-                "client_email": os.getenv("CLIENT_EMAIL"),
-                "client_id": os.getenv("CLIENT_ID"),
-                "auth_uri": os.getenv("AUTH_URI"),
-                "token_uri": os.getenv("TOKEN_URI"),
-                "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
-                "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
-                "universe_domain": os.getenv("UNIVERSE_DOMAIN")
-            }
-            if not all(creds.values()):
-                raise ValueError("Missing one or more Firebase credentials in .env file.")
-            
-            cred = credentials.Certificate(creds)
-            firebase_admin.initialize_app(cred)
-            print("Firebase initialized successfully for orders.")
-        except Exception as e:
-            print(f"Error initializing Firebase for orders: {e}")
-            # In a real app, you might want to handle this more gracefully
-            raise e
-    return firestore.client()
-
-# --- PayPal Verification Functions ---
-
-# Use an explicit environment variable for PayPal's mode
-PAYPAL_MODE = os.getenv('PAYPAL_MODE', 'sandbox') # Default to sandbox for safety
-PAYPAL_API_BASE = "https://api-m.sandbox.paypal.com" if PAYPAL_MODE == 'sandbox' else "https://api-m.paypal.com"
-
-def get_paypal_access_token():
-    """Get access token from PayPal."""
-    client_id = os.getenv("PAYPAL_CLIENT_ID")
-    client_secret = os.getenv("PAYPAL_CLIENT_SECRET")
-    
-    if not client_id or not client_secret:
-        raise ValueError("Missing PayPal API credentials in .env file.")
-
-    auth_url = f"{PAYPAL_API_BASE}/v1/oauth2/token"
-    headers = {"Accept": "application/json", "Accept-Language": "en_US"}
-    auth = (client_id, client_secret)
-    data = {"grant_type": "client_credentials"}
-    
-    try:
-        response = requests.post(auth_url, headers=headers, auth=auth, data=data)
-        response.raise_for_status()  # Raises an exception for bad responses (4xx or 5xx)
-        return response.json()["access_token"]
-    except requests.exceptions.RequestException as e:
-        print(f"Error getting PayPal access token: {e}")
-        return None
-
-def verify_paypal_payment(paypal_order_id):
-    """
-    Verify the payment with PayPal's API to ensure it's legitimate.
-    Returns the verified order details from PayPal or None if invalid.
-    """
-    access_token = get_paypal_access_token()
-    if not access_token:
-        return None
-
-    verify_url = f"{PAYPAL_API_BASE}/v2/checkout/orders/{paypal_order_id}"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-    }
-    
-    try:
-        response = requests.get(verify_url, headers=headers)
-        response.raise_for_status()
-        verified_order_data = response.json()
-        
-        # Check if the payment status is COMPLETED
-        if verified_order_data.get("status") == "COMPLETED":
-            return verified_order_data
-        else:
-            print(f"PayPal payment not completed. Status: {verified_order_data.get('status')}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error verifying PayPal payment: {e}")
-        return None
-
-def send_order_emails(order_data):
-    """Helper function to send customer and admin emails in a structured HTML format."""
+import logging
+
+from ..checkout import (
+    COUPON_ALREADY_USED_MESSAGE, PAYMENT_REVIEWS_COLLECTION, amount_matches, build_order_data, coupon_discount,
+    email_payload, order_created_result, order_total, paid_amount, payer_email_from, payment_review_data,
+    redemption_data, trace, with_backorders,
+)
+from ..coupons import coupon_cache, redemption_ref
+from ..firebase import get_db
+from ..idempotency import RecentResults
+from ..metrics import span, timed_view
+from ..outbox import email_outbox
+from ..paypal import get_paypal_client
+from ..pricing import CartError, price_cart
+from ..rollups import record_sale
+from ..stock import apply_writes, reserve_stock
+
+logger = logging.getLogger(__name__)
+
+# Recently completed orders, keyed by PayPal order ID
+recent_orders = RecentResults(ttl=settings.ORDER_RESULT_CACHE_TTL)
+
+def build_order_emails(order_data):
+    """Builds the customer and admin emails for an order in a structured HTML format."""
     
     # --- Data Preparation ---
     items_list_text = ""
@@ -141,6 +63,17 @@ def send_order_emails(order_data):
         </p>
         """
 
+    # --- Review Notes for Admin (not fully in stock) ---
+    review_lines = [
+        f"חסר במלאי: {line['name']} (חסרות {line['backordered']} יחידות)" for line in order_data.get('backordered', [])
+    ]
+    review_text = "\nלבדיקה:\n" + "".join(f"- {line}\n" for line in review_lines) if review_lines else ""
+    review_items_html = "".join(f"<li>{line}</li>" for line in review_lines)
+    review_html = f"""
+        <h3 style="color: #dc3545;">לבדיקה</h3>
+        <ul>{review_items_html}</ul>
+        """ if review_lines else ""
+
     # --- Details for Admin ---
     payment_time_raw = order_data.get('payment_time')
     payment_time_formatted = 'לא צוין'
@@ -213,7 +146,6 @@ def send_order_emails(order_data):
         to=[payer_email]
     )
     msg_customer.attach_alternative(html_content_customer, "text/html")
-    msg_customer.send(fail_silently=False)
 
 
     # --- Email to Admin ---
@@ -238,6 +170,7 @@ def send_order_emails(order_data):
     {items_list_text}
     {discount_text}
     סך הכל: ₪{total_price:.2f}
+    {review_text}
     """
     
     html_content_admin = f"""
@@ -267,6 +200,7 @@ def send_order_emails(order_data):
         </ul>
         {discount_html}
         <p style="font-size: 1.1em;"><strong>סך הכל: ₪{total_price:.2f}</strong></p>
+        {review_html}
     </div>
     """
 
@@ -277,8 +211,166 @@ def send_order_emails(order_data):
         to=[settings.ADMIN_EMAIL]
     )
     msg_admin.attach_alternative(html_content_admin, "text/html")
-    msg_admin.send(fail_silently=False)
 
+    return [msg_customer, msg_admin]
+
+
+email_outbox.register('order_emails', build_order_emails)
+
+
+def build_payment_review_emails(review):
+    """Tells the admin about a captured payment that was rejected, so it can be refunded."""
+    amount = review.get('amount') or {}
+    changes_text = "".join(
+        f"- {change['name']}: נשלח ₪{change['received']}, מחיר בקטלוג ₪{change['expected']}\n"
+        for change in review.get('price_changes', [])
+    )
+    text_content = f"""
+    תשלום התקבל ב-PayPal אך ההזמנה נדחתה ולא נשמרה. יש לבצע החזר או לטפל בהזמנה ידנית.
+
+    מספר הזמנה ב-PayPal: {review['order_id']}
+    מספר עסקה: {review.get('paypal_capture_id')}
+    סכום: {amount.get('value')} {amount.get('currency_code', '')}
+    אימייל המשלם: {review.get('payer_email')}
+    סיבה: {review.get('message')}
+    {changes_text}
+    """
+    message = EmailMultiAlternatives(
+        subject=f"נדרש החזר: תשלום {review['order_id']} ללא הזמנה",
+        body=text_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[settings.ADMIN_EMAIL],
+    )
+    return [message]
+
+
+email_outbox.register('payment_review', build_payment_review_emails)
+
+
+def report_held_payment(review):
+    """Logs a payment held in `payment_reviews` and queues the admin email about it."""
+    logger.critical(
+        "Payment for Order %s was captured but the order was rejected (%s); held for refund", review['order_id'],
+        review['reason'], extra={'paypal_order_id': review['order_id'], 'changes': review['price_changes']},
+    )
+    try:
+        email_outbox.enqueue('payment_review', email_payload(review))
+    except Exception:
+        logger.exception("Could not queue the payment review email for order %s", review['order_id'])
+
+
+def hold_payment(db, review):
+    """Keeps a rejected, already captured payment (see checkout.payment_review_data) for an admin to refund."""
+    db.collection(PAYMENT_REVIEWS_COLLECTION).document(review['order_id']).set(review)
+    report_held_payment(review)
+
+def place_order(db, paypal_order_id, paypal_details, cart_items, coupon_code, shipping_method):
+    """
+    Verifies the payment, checks the total, and saves the order (document ID = PayPal order ID).
+    Returns the response body and status code.
+    """
+    order_ref = db.collection('orders').document(paypal_order_id)
+
+    # 1. Verify payment with PayPal
+    trace.info("Verifying PayPal Order ID: %s", paypal_order_id)
+    with span('paypal'):
+        verified_paypal_order = get_paypal_client().verify_payment(paypal_order_id)
+    if not verified_paypal_order:
+        logger.critical("PayPal payment verification failed for Order ID: %s", paypal_order_id, extra={'paypal_order_id': paypal_order_id})
+        return {'message': 'PayPal payment verification failed.'}, 400
+
+    trace.info("PayPal verification successful for Order ID: %s", paypal_order_id)
+
+    # 2. Price the cart from the catalog and apply coupon if applicable
+    try:
+        with span('pricing'):
+            cart_lines, subtotal = price_cart(db, cart_items)
+    except CartError as e:
+        hold_payment(db, payment_review_data(
+            paypal_order_id, verified_paypal_order, 'price_changes' if e.changes else 'cart_rejected', str(e), e.changes,
+        ))
+        return {'message': str(e), 'price_changes': e.changes}, e.status
+
+    discount_percentage = 0
+    coupon_redemption_ref = None
+    payer_email = None
+    if coupon_code:
+        trace.info("Attempting to apply coupon: %s", coupon_code)
+        payer_email = payer_email_from(paypal_details, verified_paypal_order)
+        if payer_email:
+            # Check if this email has already used this coupon (a single point read)
+            coupon_redemption_ref = redemption_ref(db, coupon_code, payer_email)
+            with span('redemption'):
+                already_redeemed = coupon_redemption_ref.get().exists
+            if already_redeemed:
+                logger.info("Coupon '%s' already used by %s", coupon_code, payer_email)
+                return {'message': COUPON_ALREADY_USED_MESSAGE}, 400
+
+        with span('coupon'):
+            found_coupon = coupon_cache.get(coupon_code)
+        discount_percentage = coupon_discount(coupon_code, found_coupon)
+        if discount_percentage:
+            trace.info("Applied %s%% discount.", discount_percentage)
+
+    # 3. Validate server total against PayPal total
+    server_total = order_total(subtotal, discount_percentage, shipping_method)
+    if not amount_matches(server_total, verified_paypal_order):
+        logger.critical(
+            "Amount mismatch for Order %s. Server: %.2f, PayPal: %s", paypal_order_id, server_total, paid_amount(verified_paypal_order),
+            extra={'paypal_order_id': paypal_order_id},
+        )
+        hold_payment(db, payment_review_data(
+            paypal_order_id, verified_paypal_order, 'amount_mismatch', 'Order amount validation failed.',
+        ))
+        return {'message': 'Order amount validation failed.'}, 400
+
+    # 4. Prepare and save order data to Firestore
+    order_data = build_order_data(paypal_order_id, verified_paypal_order, cart_lines, coupon_code, discount_percentage, shipping_method)
+
+    # The order, its stock reservation, the coupon redemption and the sales rollups are written in one transaction.
+    # The order and redemption are only created if absent: if this order was saved by a concurrent
+    # submission, or another order redeemed the same coupon for this email in the meantime, the
+    # commit fails and nothing is written. Lines stock can't fully cover are saved as backordered.
+    @firestore.transactional
+    def save_order(transaction):
+        writes, backordered = reserve_stock(db, transaction, cart_lines)
+        apply_writes(transaction, writes)
+        order = with_backorders(order_data, backordered)
+        transaction.create(order_ref, order)
+        if order['coupon_used'] and coupon_redemption_ref is not None:
+            transaction.create(coupon_redemption_ref, redemption_data(coupon_code, payer_email, paypal_order_id))
+        record_sale(db, transaction, order)
+        return order
+
+    try:
+        with span('order_write'):
+            order_data = save_order(db.transaction())
+    except AlreadyExists:
+        existing_order = order_ref.get()
+        if existing_order.exists:
+            logger.info("Order %s was already saved by another request.", paypal_order_id)
+            return order_created_result(existing_order.to_dict()), 200
+        logger.info("Coupon '%s' already used by %s", coupon_code, payer_email)
+        return {'message': COUPON_ALREADY_USED_MESSAGE}, 400
+
+    if order_data['backordered']:
+        logger.critical(
+            "Paid Order %s is partly out of stock; saved as backordered", paypal_order_id,
+            extra={'paypal_order_id': paypal_order_id, 'backordered': order_data['backordered']},
+        )
+
+    # 5. Queue the confirmation emails; they are sent (and retried) off the request path
+    try:
+        with span('email_enqueue'):
+            email_outbox.enqueue('order_emails', email_payload(order_data))
+    except Exception:
+        # Log email error but don't fail the entire transaction
+        logger.exception("Could not queue confirmation emails for order %s", paypal_order_id)
+
+    return order_created_result(order_data), 200
+
+
+@timed_view('checkout')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def create_order(request):
@@ -294,109 +386,32 @@ def create_order(request):
         coupon_code = data.get('couponCode', None)
         shipping_method = data.get('shippingMethod', 'pickup')
 
-        db = initialize_firebase()
+        db = get_db()
         
         paypal_order_id = paypal_details.get('id')
 
-        if not paypal_order_id or not cart_items:
+        if not isinstance(paypal_order_id, str) or '/' in paypal_order_id or not cart_items:
             return JsonResponse({'message': 'Missing PayPal order ID or cart items.'}, status=400)
 
-        # 1. Verify payment with PayPal
-        print(f"Verifying PayPal Order ID: {paypal_order_id}")
-        verified_paypal_order = verify_paypal_payment(paypal_order_id)
-        if not verified_paypal_order:
-            print(f"CRITICAL: PayPal payment verification failed for Order ID: {paypal_order_id}")
-            return JsonResponse({'message': 'PayPal payment verification failed.'}, status=400)
-        
-        print(f"PayPal verification successful for Order ID: {paypal_order_id}")
-
-        # 2. Calculate server-side total and apply coupon if applicable
-        server_total = sum(float(item['price']) * int(item['quantity']) for item in cart_items)
-        discount_percentage = 0
-
-        if coupon_code:
-            print(f"Attempting to apply coupon: {coupon_code}")
-            # Get payer email from PayPal details (if available)
-            payer_email = None
-            if 'payer' in paypal_details and 'email_address' in paypal_details['payer']:
-                payer_email = paypal_details['payer']['email_address']
-            elif 'payer' in verified_paypal_order and 'email_address' in verified_paypal_order['payer']:
-                payer_email = verified_paypal_order['payer']['email_address']
-            else:
-                payer_email = None
-
-            if payer_email:
-                # Check if this email has already used this coupon
-                orders_ref = db.collection('orders')
-                prior_orders = orders_ref.where('coupon_used', '==', coupon_code).where('payer_email', '==', payer_email).limit(1).stream()
-                for _ in prior_orders:
-                    print(f"Coupon '{coupon_code}' already used by {payer_email}")
-                    return JsonResponse({'message': 'קופון זה כבר נוצל על ידי כתובת האימייל שלך.'}, status=400)
-
-            coupons_ref = db.collection('coupons')
-            coupon_query = coupons_ref.where('code', '==', coupon_code).where('isActive', '==', True).limit(1).stream()
-            found_coupon = None
-            for coupon_doc in coupon_query:
-                found_coupon = coupon_doc.to_dict()
-                break
-
-            if found_coupon:
-                expires_at = found_coupon.get('expiresAt')
-                if expires_at and expires_at.timestamp() > datetime.datetime.now().timestamp():
-                    discount_percentage = float(found_coupon.get('percentageOff', 0))
-                    server_total *= (1 - discount_percentage / 100)
-                    print(f"Applied {discount_percentage}% discount. New total: {server_total}")
+        # A retried or double-clicked checkout gets the stored result back without calling out again
+        with recent_orders.lock(paypal_order_id):
+            result = recent_orders.get(paypal_order_id)
+            if result is None:
+                with span('existing_order'):
+                    existing_order = db.collection('orders').document(paypal_order_id).get()
+                if existing_order.exists:
+                    result = order_created_result(existing_order.to_dict())
                 else:
-                    print(f"Coupon '{coupon_code}' has expired.")
-            else:
-                print(f"Coupon '{coupon_code}' not found or is not active.")
-
-        # NEW: Add shipping cost to server total
-        if shipping_method == 'delivery' and server_total > 0 and server_total < 100:
-            server_total += 20 # Add the standard shipping fee
-
-        # 3. Validate server total against PayPal total
-        paypal_amount = float(verified_paypal_order["purchase_units"][0]["amount"]["value"])
-        
-        # Use a small tolerance for floating point comparison
-        if not -0.02 <= server_total - paypal_amount <= 0.02:
-            print(f"CRITICAL: Amount mismatch for Order {paypal_order_id}. Client: {server_total:.2f}, PayPal: {paypal_amount}")
-            return JsonResponse({'message': 'Order amount validation failed.'}, status=400)
-
-        # 4. Prepare and save order data to Firestore
-        purchase_unit = verified_paypal_order.get("purchase_units", [{}])[0]
-        payer_info = verified_paypal_order.get("payer", {})
-        
-        order_data = {
-            "order_id": paypal_order_id,
-            "paypal_capture_id": purchase_unit.get("payments", {}).get("captures", [{}])[0].get("id"),
-            "status": verified_paypal_order.get("status"),
-            "amount": purchase_unit.get("amount"),
-            "items": cart_items,
-            "payer_email": payer_info.get("email_address"),
-            "customer_name": f"{payer_info.get('name', {}).get('given_name', '')} {payer_info.get('name', {}).get('surname', '')}".strip(),
-            "shipping_address": purchase_unit.get("shipping", {}).get("address", {}),
-            "payment_time": verified_paypal_order.get("create_time"), # or update_time
-            "created_at": firestore.SERVER_TIMESTAMP,
-            "coupon_used": coupon_code if discount_percentage > 0 else None,
-            "discount_percentage": discount_percentage,
-            "shipping_method": shipping_method
-        }
-
-        db.collection('orders').add(order_data)
-        
-        # 5. Send confirmation emails
-        try:
-            send_order_emails(order_data)
-        except Exception as e:
-            # Log email error but don't fail the entire transaction
-            print(f"ERROR: Could not send confirmation emails for order {paypal_order_id}: {e}")
-
-        return JsonResponse({'message': 'Order created successfully', 'paypal_capture_id': order_data['paypal_capture_id']}, status=200)
+                    body, status_code = place_order(db, paypal_order_id, paypal_details, cart_items, coupon_code, shipping_method)
+                    if status_code != 200:
+                        return JsonResponse(body, status=status_code)
+                    result = body
+                recent_orders.put(paypal_order_id, result)
+        return JsonResponse(result, status=200)
 
     except json.JSONDecodeError:
         return JsonResponse({'message': 'Invalid JSON in request body.'}, status=400)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'message': f'An unexpected error occurred: {e}'}, status=500) 
\ No newline at end of file
+    except Exception:
+        # The details are in the log (find them by the X-Request-ID header); they aren't shown to the shopper
+        logger.exception("Unexpected error while creating an order")
+        return JsonResponse({'message': 'An unexpected error occurred.'}, status=500) 
\ No newline at end of file
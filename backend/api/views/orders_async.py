@@ -0,0 +1,201 @@
+"""
+Async version of `create_order` for the ASGI entry point (used when ASYNC_CHECKOUT_VIEW is on).
+
+It follows the same checkout rules as views/orders.py (see api/checkout.py), but waits on
+PayPal through httpx and on Firestore through the AsyncClient, so a checkout doesn't hold a
+thread. The steps that don't depend on each other run concurrently: PayPal verification, cart
+pricing, the coupon lookup and the coupon redemption check. The order write still waits for all of them.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from ..checkout import (
+    COUPON_ALREADY_USED_MESSAGE, PAYMENT_REVIEWS_COLLECTION, amount_matches, build_order_data, coupon_discount,
+    email_payload, order_created_result, order_total, paid_amount, payer_email_from, payment_review_data,
+    redemption_data, trace, with_backorders,
+)
+from ..coupons import coupon_cache, redemption_ref
+from ..firebase import get_async_db
+from ..metrics import span, timed, timed_view
+from ..outbox import email_outbox
+from ..paypal import get_async_paypal_client
+from ..pricing import CartError, price_cart_async
+from ..rollups import record_sale
+from ..stock import apply_writes, reserve_stock_async
+from .orders import recent_orders, report_held_payment
+
+logger = logging.getLogger(__name__)
+
+
+async def redemption_exists(coupon_redemption_ref):
+    if coupon_redemption_ref is None:
+        return False
+    return (await coupon_redemption_ref.get()).exists
+
+
+async def find_coupon(coupon_code):
+    if not coupon_code:
+        return None
+    # Served from memory once warm; the first load (and a rare miss) queries Firestore in a thread
+    return await sync_to_async(coupon_cache.get, thread_sensitive=False)(coupon_code)
+
+
+async def hold_payment_async(db, review):
+    """Async views/orders.hold_payment."""
+    await db.collection(PAYMENT_REVIEWS_COLLECTION).document(review['order_id']).set(review)
+    await sync_to_async(report_held_payment, thread_sensitive=False)(review)
+
+
+async def place_order(db, paypal_order_id, paypal_details, cart_items, coupon_code, shipping_method):
+    """Async views/orders.place_order. Returns the response body and status code."""
+    order_ref = db.collection('orders').document(paypal_order_id)
+    payer_email = payer_email_from(paypal_details) if coupon_code else None
+    coupon_redemption_ref = redemption_ref(db, coupon_code, payer_email) if payer_email else None
+
+    trace.info("Verifying PayPal Order ID: %s", paypal_order_id)
+    verified_paypal_order, priced_cart, found_coupon, already_redeemed = await asyncio.gather(
+        timed('paypal', get_async_paypal_client().verify_payment(paypal_order_id)),
+        timed('pricing', price_cart_async(db, cart_items)),
+        timed('coupon', find_coupon(coupon_code)),
+        timed('redemption', redemption_exists(coupon_redemption_ref)),
+        return_exceptions=True,
+    )
+    for result in (verified_paypal_order, found_coupon, already_redeemed):
+        if isinstance(result, BaseException):
+            raise result
+
+    # Report problems in the same order as the sync view
+    if not verified_paypal_order:
+        logger.critical("PayPal payment verification failed for Order ID: %s", paypal_order_id, extra={'paypal_order_id': paypal_order_id})
+        return {'message': 'PayPal payment verification failed.'}, 400
+    trace.info("PayPal verification successful for Order ID: %s", paypal_order_id)
+
+    if isinstance(priced_cart, CartError):
+        await hold_payment_async(db, payment_review_data(
+            paypal_order_id, verified_paypal_order, 'price_changes' if priced_cart.changes else 'cart_rejected',
+            str(priced_cart), priced_cart.changes,
+        ))
+        return {'message': str(priced_cart), 'price_changes': priced_cart.changes}, priced_cart.status
+    if isinstance(priced_cart, BaseException):
+        raise priced_cart
+    cart_lines, subtotal = priced_cart
+
+    discount_percentage = 0
+    if coupon_code:
+        trace.info("Attempting to apply coupon: %s", coupon_code)
+        if payer_email is None:
+            # The browser didn't send the payer's email; use the one PayPal verified
+            payer_email = payer_email_from(paypal_details, verified_paypal_order)
+            if payer_email:
+                coupon_redemption_ref = redemption_ref(db, coupon_code, payer_email)
+                with span('redemption'):
+                    already_redeemed = await redemption_exists(coupon_redemption_ref)
+        if already_redeemed:
+            logger.info("Coupon '%s' already used by %s", coupon_code, payer_email)
+            return {'message': COUPON_ALREADY_USED_MESSAGE}, 400
+
+        discount_percentage = coupon_discount(coupon_code, found_coupon)
+        if discount_percentage:
+            trace.info("Applied %s%% discount.", discount_percentage)
+
+    server_total = order_total(subtotal, discount_percentage, shipping_method)
+    if not amount_matches(server_total, verified_paypal_order):
+        logger.critical(
+            "Amount mismatch for Order %s. Server: %.2f, PayPal: %s", paypal_order_id, server_total, paid_amount(verified_paypal_order),
+            extra={'paypal_order_id': paypal_order_id},
+        )
+        await hold_payment_async(db, payment_review_data(
+            paypal_order_id, verified_paypal_order, 'amount_mismatch', 'Order amount validation failed.',
+        ))
+        return {'message': 'Order amount validation failed.'}, 400
+
+    order_data = build_order_data(paypal_order_id, verified_paypal_order, cart_lines, coupon_code, discount_percentage, shipping_method)
+    # One transaction for the order, its stock reservation, the coupon redemption and the sales rollups (see views/orders.py)
+    @firestore.async_transactional
+    async def save_order(transaction):
+        writes, backordered = await reserve_stock_async(db, transaction, cart_lines)
+        apply_writes(transaction, writes)
+        order = with_backorders(order_data, backordered)
+        transaction.create(order_ref, order)
+        if order['coupon_used'] and coupon_redemption_ref is not None:
+            transaction.create(coupon_redemption_ref, redemption_data(coupon_code, payer_email, paypal_order_id))
+        record_sale(db, transaction, order)
+        return order
+
+    try:
+        with span('order_write'):
+            order_data = await save_order(db.transaction())
+    except AlreadyExists:
+        existing_order = await order_ref.get()
+        if existing_order.exists:
+            logger.info("Order %s was already saved by another request.", paypal_order_id)
+            return order_created_result(existing_order.to_dict()), 200
+        logger.info("Coupon '%s' already used by %s", coupon_code, payer_email)
+        return {'message': COUPON_ALREADY_USED_MESSAGE}, 400
+
+    if order_data['backordered']:
+        logger.critical(
+            "Paid Order %s is partly out of stock; saved as backordered", paypal_order_id,
+            extra={'paypal_order_id': paypal_order_id, 'backordered': order_data['backordered']},
+        )
+
+    try:
+        with span('email_enqueue'):
+            await sync_to_async(email_outbox.enqueue, thread_sensitive=False)('order_emails', email_payload(order_data))
+    except Exception:
+        # Log email error but don't fail the entire transaction
+        logger.exception("Could not queue confirmation emails for order %s", paypal_order_id)
+
+    return order_created_result(order_data), 200
+
+
+@timed_view('checkout')
+@csrf_exempt
+async def create_order(request):
+    """POST /api/orders/ - Async views/orders.create_order."""
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        paypal_details = data.get('paypalDetails', {})
+        cart_items = data.get('cartItems', [])
+        coupon_code = data.get('couponCode', None)
+        shipping_method = data.get('shippingMethod', 'pickup')
+
+        db = get_async_db()
+
+        paypal_order_id = paypal_details.get('id')
+
+        if not isinstance(paypal_order_id, str) or '/' in paypal_order_id or not cart_items:
+            return JsonResponse({'message': 'Missing PayPal order ID or cart items.'}, status=400)
+
+        # A retried or double-clicked checkout gets the stored result back without calling out again
+        async with recent_orders.async_lock(paypal_order_id):
+            result = recent_orders.get(paypal_order_id)
+            if result is None:
+                with span('existing_order'):
+                    existing_order = await db.collection('orders').document(paypal_order_id).get()
+                if existing_order.exists:
+                    result = order_created_result(existing_order.to_dict())
+                else:
+                    body, status_code = await place_order(db, paypal_order_id, paypal_details, cart_items, coupon_code, shipping_method)
+                    if status_code != 200:
+                        return JsonResponse(body, status=status_code)
+                    result = body
+                recent_orders.put(paypal_order_id, result)
+        return JsonResponse(result, status=200)
+
+    except json.JSONDecodeError:
+        return JsonResponse({'message': 'Invalid JSON in request body.'}, status=400)
+    except Exception:
+        # The details are in the log (find them by the X-Request-ID header); they aren't shown to the shopper
+        logger.exception("Unexpected error while creating an order")
+        return JsonResponse({'message': 'An unexpected error occurred.'}, status=500)
@@ -12,5 +12,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'claudeShopBackend.settings')
+# Serve catalog reads with the async views (api/views/catalog_async.py) when running under ASGI
+os.environ.setdefault('ASYNC_CATALOG_VIEWS', 'True')
+# ... and checkout with the async create_order (api/views/orders_async.py)
+os.environ.setdefault('ASYNC_CHECKOUT_VIEW', 'True')
 
 application = get_asgi_application()
+
+# Start this worker's background threads (email outbox, ID token keys); the app is loaded after gunicorn forks
+from api.apps import start_worker_threads  # noqa: E402
+
+start_worker_threads()
@@ -48,7 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.logs.RequestIdMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.ratelimit.RateLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -149,6 +151,8 @@ else:
     ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Let the frontend read the request ID (to quote in bug reports) and the checkout timings
+CORS_EXPOSE_HEADERS = ['X-Request-ID', 'Server-Timing']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -172,3 +176,92 @@ DEFAULT_FROM_EMAIL = os.getenv('SENDGRID_FROM_EMAIL', 'noreply@yourclaudeShop.co
 
 # The email address for the admin to receive order notifications.
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
+
+# --- Catalog Cache ---
+# Products and categories are served from an in-memory snapshot kept fresh by Firestore listeners.
+# If listeners are unavailable, each worker polls the catalog version every CATALOG_POLL_INTERVAL seconds.
+CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'True').lower() == 'true'
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', '30'))
+# Without listeners, remaining stock is re-summed from the stock shards at most this often (seconds).
+CATALOG_STOCK_REFRESH_INTERVAL = float(os.getenv('CATALOG_STOCK_REFRESH_INTERVAL', '300'))
+# Sent with every catalog read (products, categories, search) so browsers and CDNs can reuse responses.
+# Responses also carry a strong ETag, so revalidation is answered with 304 from memory.
+CATALOG_CACHE_CONTROL = os.getenv('CATALOG_CACHE_CONTROL', 'public, max-age=60, stale-while-revalidate=300')
+# Serve catalog reads with async views on the Firestore AsyncClient. Only useful under ASGI,
+# so claudeShopBackend/asgi.py turns it on by default and the WSGI entry point leaves it off.
+ASYNC_CATALOG_VIEWS = os.getenv('ASYNC_CATALOG_VIEWS', 'False').lower() == 'true'
+
+# --- Email Outbox ---
+# Order emails are queued in a local SQLite file and sent by background threads (see api/outbox.py).
+# Failed sends are retried with exponential backoff, starting at EMAIL_OUTBOX_BACKOFF_BASE seconds.
+EMAIL_OUTBOX_PATH = os.getenv('EMAIL_OUTBOX_PATH', str(BASE_DIR / 'email_outbox.sqlite3'))
+EMAIL_OUTBOX_WORKERS = int(os.getenv('EMAIL_OUTBOX_WORKERS', '2'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+EMAIL_OUTBOX_BACKOFF_BASE = float(os.getenv('EMAIL_OUTBOX_BACKOFF_BASE', '5'))
+EMAIL_OUTBOX_BACKOFF_MAX = float(os.getenv('EMAIL_OUTBOX_BACKOFF_MAX', '900'))
+
+# --- Coupons ---
+# Active coupons are cached in memory and kept fresh by a Firestore listener (see api/coupons.py).
+# If the listener can't be started, the cache is reloaded when it is older than this many seconds.
+COUPON_CACHE_TTL = float(os.getenv('COUPON_CACHE_TTL', '60'))
+# A code that isn't found is remembered as missing for this many seconds, so retrying an unknown
+# code doesn't query Firestore each time. A coupon created meanwhile still arrives through the listener.
+COUPON_MISS_TTL = float(os.getenv('COUPON_MISS_TTL', '10'))
+
+# --- Orders ---
+# Orders are stored under their PayPal order ID. Each worker also remembers recently completed
+# orders for this many seconds, so a retried checkout is answered without any outbound call.
+ORDER_RESULT_CACHE_TTL = float(os.getenv('ORDER_RESULT_CACHE_TTL', '600'))
+# Each order reserves stock from sharded counters (see api/stock.py). More shards allow more
+# concurrent orders of one product. After STOCK_SHARDS changes, each product's stock is folded
+# into the new number of shards on its next order.
+STOCK_TRACKING_ENABLED = os.getenv('STOCK_TRACKING_ENABLED', 'True').lower() == 'true'
+STOCK_SHARDS = int(os.getenv('STOCK_SHARDS', '10'))
+# Serve checkout with the async create_order (httpx + Firestore AsyncClient). Only useful under ASGI,
+# so claudeShopBackend/asgi.py turns it on by default.
+ASYNC_CHECKOUT_VIEW = os.getenv('ASYNC_CHECKOUT_VIEW', 'False').lower() == 'true'
+
+# --- Logging ---
+# Logs are written to stdout as one JSON object per line, by a background thread (see api/logs.py).
+# Each record carries the ID of the request it was logged from, also sent back as X-Request-ID.
+# The verbose step-by-step checkout lines are kept for LOG_TRACE_SAMPLE_RATE of requests (0 to 1).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_TRACE_SAMPLE_RATE = float(os.getenv('LOG_TRACE_SAMPLE_RATE', '1'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'trace_sample': {'()': 'api.logs.SamplingFilter', 'rate': LOG_TRACE_SAMPLE_RATE},
+    },
+    'handlers': {
+        'queue': {'()': 'api.logs.QueueLogHandler'},
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'api.checkout.trace': {'filters': ['trace_sample']},
+    },
+}
+
+# --- Authentication ---
+# Each worker remembers this many recently verified Firebase ID tokens (and their users) until
+# they expire, so repeat requests skip signature verification and the user lookup. 0 turns it off.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024'))
+# Admin login reads the isAdmin claim from the token. For a token without it, the user record's
+# answer is cached for this many seconds.
+ADMIN_STATUS_CACHE_TTL = float(os.getenv('ADMIN_STATUS_CACHE_TTL', '60'))
+
+# --- Rate Limits ---
+# Checkout and admin login are limited per client IP and per email, as 'requests/seconds'
+# (see api/ratelimit.py). The buckets are shared by all workers through a local SQLite file.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', str(BASE_DIR / 'rate_limits.sqlite3'))
+RATE_LIMIT_CHECKOUT = os.getenv('RATE_LIMIT_CHECKOUT', '10/60')
+RATE_LIMIT_ADMIN_LOGIN = os.getenv('RATE_LIMIT_ADMIN_LOGIN', '5/60')
+# Number of reverse proxies in front of the app (Render has one); the client IP is read from X-Forwarded-For
+RATE_LIMIT_PROXY_COUNT = int(os.getenv('RATE_LIMIT_PROXY_COUNT', '1'))
+
+# --- Sales Rollups ---
+# Each order adds to daily and weekly sales totals, split over this many documents per period
+# (see api/rollups.py), which GET /api/admin/stats/ reads instead of the orders.
+SALES_ROLLUP_SHARDS = int(os.getenv('SALES_ROLLUP_SHARDS', '10'))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'claudeShopBackend.settings')
 
 application = get_wsgi_application()
+
+# Start this worker's background threads (email outbox, ID token keys); the app is loaded after gunicorn forks
+from api.apps import start_worker_threads  # noqa: E402
+
+start_worker_threads()
@@ -0,0 +1,99 @@
+"""
+Measures the per-request cost of FirebaseAuthentication with and without the verified-token cache.
+
+Usage: python scripts/benchmark_auth.py [--calls 2000] [--users 50]
+
+Runs offline: ID tokens are signed with a local RSA key pair, which the token verifier
+(api/idtokens.py) is given through a StaticKeyStore instead of Google's certificates.
+Users live in an in-memory SQLite database. Each call authenticates a request carrying one of `users` tokens, round-robin.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+import django
+from django.conf import settings
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+settings.configure(
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth'],
+    AUTH_TOKEN_CACHE_SIZE=1024,
+)
+django.setup()
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from google.auth import crypt, jwt  # noqa: E402
+
+from api import authentication  # noqa: E402
+from api.idtokens import StaticKeyStore, id_token_verifier  # noqa: E402
+
+PROJECT_ID = 'benchmark-project'
+
+
+def local_key_pair():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return crypt.RSASigner.from_string(private_pem, 'bench-key'), public_pem
+
+
+def mint_token(signer, uid):
+    now = int(time.time())
+    return jwt.encode(signer, {
+        'iss': f'https://securetoken.google.com/{PROJECT_ID}', 'aud': PROJECT_ID,
+        'sub': uid, 'uid': uid, 'iat': now, 'exp': now + 3600,
+    }).decode('ascii')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    signer, public_pem = local_key_pair()
+    id_token_verifier.key_store = StaticKeyStore({'bench-key': public_pem})
+    id_token_verifier.project_id = PROJECT_ID
+
+    factory = RequestFactory()
+    requests = [
+        factory.get('/api/admin/', HTTP_AUTHORIZATION=f'Bearer {mint_token(signer, f"user-{i}")}')
+        for i in range(args.users)
+    ]
+    backend = authentication.FirebaseAuthentication()
+    calls = iter(range(10 ** 12))
+
+    def authenticate():
+        return backend.authenticate(requests[next(calls) % len(requests)])
+
+    def uncached():
+        authentication.token_cache.clear()
+        return authenticate()
+
+    # Create the users up front, so both runs measure the lookup rather than the insert
+    for _ in requests:
+        uncached()
+
+    results = {}
+    for name, func in (('uncached (before)', uncached), ('cached (after)', authenticate)):
+        seconds = timeit.timeit(func, number=args.calls)
+        results[name] = seconds / args.calls * 1e6
+        print(f"{name:>18}: {results[name]:8.2f} µs per request ({args.calls} calls)")
+    print(f"{'speedup':>18}: {results['uncached (before)'] / results['cached (after)']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
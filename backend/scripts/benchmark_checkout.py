@@ -0,0 +1,145 @@
+"""
+Checkout benchmark: POST /api/orders/ against a running backend, with PayPal replaced by a local stand-in.
+
+Usage: python scripts/benchmark_checkout.py URL [--concurrency 16] [--orders 500] [--paypal-port 8099] [--paypal-latency-ms 80]
+
+The script starts a PayPal stand-in on --paypal-port that answers the OAuth and order lookups after
+--paypal-latency-ms, and seeds one product ('bench-product') into Firestore. Run it against the
+Firestore emulator (FIRESTORE_EMULATOR_HOST), never a real project: every order it places is saved.
+Start the backend pointed at the same Firestore and at the stand-in, e.g. for the ASGI deployment:
+
+    FIRESTORE_EMULATOR_HOST=localhost:8080 PAYPAL_API_BASE=http://127.0.0.1:8099 \\
+    PAYPAL_CLIENT_ID=bench PAYPAL_CLIENT_SECRET=bench EMAIL_OUTBOX_WORKERS=0 \\
+    gunicorn --bind 0.0.0.0:8000 --workers 2 -k uvicorn.workers.UvicornWorker claudeShopBackend.asgi:application
+
+and for the WSGI one the same with `--workers 2 --threads 2 claudeShopBackend.wsgi:application`.
+Then: python scripts/benchmark_checkout.py http://localhost:8000/api/orders/
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from api.firebase import get_db  # noqa: E402
+
+PRODUCT_ID = 'bench-product'
+PRODUCT_PRICE = 25
+QUANTITY = 2
+
+
+def percentile(sorted_values, fraction):
+    index = max(0, int(round(len(sorted_values) * fraction)) - 1)
+    return sorted_values[index]
+
+
+def make_paypal_handler(latency):
+    class PayPalStandIn(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload):
+            time.sleep(latency)
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._reply({"access_token": "bench-token", "expires_in": 32400})
+
+        def do_GET(self):
+            # Order IDs look like BENCH-<uuid>-<amount>
+            order_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+            amount = order_id.rsplit('-', 1)[-1]
+            self._reply({
+                "id": order_id,
+                "status": "COMPLETED",
+                "create_time": "2024-01-01T00:00:00Z",
+                "payer": {"email_address": "bench@example.com", "name": {"given_name": "Bench", "surname": "Mark"}},
+                "purchase_units": [{
+                    "amount": {"currency_code": "ILS", "value": amount},
+                    "payments": {"captures": [{"id": f"CAPTURE-{order_id}"}]},
+                }],
+            })
+
+    return PayPalStandIn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--paypal-port', type=int, default=8099)
+    parser.add_argument('--paypal-latency-ms', type=float, default=80)
+    args = parser.parse_args()
+
+    if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+        print("Refusing to run without FIRESTORE_EMULATOR_HOST: the benchmark writes orders.")
+        sys.exit(1)
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.paypal_port), make_paypal_handler(args.paypal_latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    get_db().collection('products').document(PRODUCT_ID).set({
+        "name": "Benchmark product", "price": PRODUCT_PRICE, "isAvailable": True, "isActive": True, "quantity": 10 ** 6,
+    })
+
+    amount = f"{PRODUCT_PRICE * QUANTITY:.2f}"
+    sessions = threading.local()
+    statuses = {}
+    status_lock = threading.Lock()
+
+    def place_order(_):
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        payload = {
+            "paypalDetails": {"id": f"BENCH-{uuid.uuid4().hex}-{amount}", "payer": {"email_address": "bench@example.com"}},
+            "cartItems": [{"id": PRODUCT_ID, "name": "Benchmark product", "price": PRODUCT_PRICE, "quantity": QUANTITY}],
+            "shippingMethod": "pickup",
+        }
+        started = time.perf_counter()
+        response = session.post(args.url, json=payload)
+        response.content  # Read the whole body
+        elapsed = (time.perf_counter() - started) * 1000
+        with status_lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return elapsed
+
+    # Warm up connections, PayPal tokens and Firestore clients
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(place_order, range(args.concurrency)))
+    statuses.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        timings = sorted(pool.map(place_order, range(args.orders)))
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"{args.orders} orders, concurrency {args.concurrency}, PayPal latency {args.paypal_latency_ms:.0f} ms, {wall:.2f} s")
+    print(f"  throughput: {args.orders / wall:.1f} orders/s")
+    print(f"  latency ms: mean {statistics.mean(timings):.1f}, p50 {percentile(timings, 0.5):.1f}, "
+          f"p90 {percentile(timings, 0.9):.1f}, p99 {percentile(timings, 0.99):.1f}")
+    print(f"  statuses: {statuses}")
+
+
+if __name__ == '__main__':
+    main()
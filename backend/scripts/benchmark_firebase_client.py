@@ -0,0 +1,55 @@
+"""
+Measures the cost of getting a Firestore client, at startup and per request.
+
+Usage: python scripts/benchmark_firebase_client.py [--calls 100000]
+
+Needs the Firebase credentials in backend/.env (no network calls are made: creating a client
+doesn't connect until the first query). Compares the shared provider in api/firebase.py with
+the per-request path create_order used to take: reloading .env, checking the credentials
+and asking firebase_admin for its client.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+# Adjust the path to go up one level to find the 'backend' directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    from api.firebase import credentials_from_env, get_db, initialize_firebase
+    initialize_firebase()
+    initialized = time.perf_counter()
+    get_db()
+    first_client = time.perf_counter()
+    print(f"Startup: import + app init {(initialized - started) * 1000:.1f} ms, "
+          f"first client {(first_client - initialized) * 1000:.1f} ms")
+
+    import firebase_admin
+    from firebase_admin import firestore
+
+    def legacy_per_request():
+        # What create_order did on every request before api/firebase.py
+        creds = credentials_from_env()
+        if not firebase_admin._apps and not all(creds.values()):
+            raise ValueError("Missing one or more Firebase credentials in .env file.")
+        return firestore.client()
+
+    for name, func, calls in (
+        ('shared get_db()', get_db, args.calls),
+        ('legacy per-request init', legacy_per_request, max(1, args.calls // 100)),
+    ):
+        seconds = timeit.timeit(func, number=calls)
+        print(f"{name:>24}: {seconds / calls * 1e6:8.2f} µs per request ({calls} calls)")
+
+
+if __name__ == '__main__':
+    main()
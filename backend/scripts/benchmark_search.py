@@ -0,0 +1,95 @@
+"""
+Benchmarks the in-memory product search index (api/search.py) on a synthetic catalog.
+
+Usage: python scripts/benchmark_search.py [--products 10000] [--queries 2000]
+
+Needs no Firebase credentials; the catalog is generated from a small Hebrew vocabulary.
+The per-query lines at the end are cold timings (no cached term matches).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Allow `import api...` when run from the backend directory or from scripts/
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from api.search import SearchIndex  # noqa: E402
+
+WORDS = [
+    "מקרל", "מעושן", "סלמון", "טונה", "הרינג", "מטיאס", "זית", "זיתים", "ירוק", "שחור", "יווני",
+    "מרוקאי", "סורי", "גבינה", "צ׳דר", "פרמזן", "בולגרית", "פסטרמה", "נקניק", "סלט", "חריף",
+    "בצל", "שמיר", "קופסא", "גרם", "ליחידה", "ארוז", "בוואקום", "מגולען", "ענק", "כבוש", "בחומץ",
+    "שָׁלוֹם", "חלבה", "טחינה", "ממרח", "פלפל", "קלוי", "עגבניות", "מיובשות", "ש״ח", "Feta", "Brie",
+]
+QUERIES = ["מקרל", "מעוש", "זית ירוק", "צדר", "ג׳בינה", "רמז", "שלום", "סלט חריף", "feta", "ושן", "בוואק"]
+# Longer queries, up to MAX_QUERY_TERMS terms; the single letters each match most of the catalog
+MULTI_TERM_QUERIES = [
+    "זית ירוק מגולען כבוש בחומץ",
+    "מקרל מעושן בוואקום ארוז גרם ליחידה קופסא",
+    "ס מ ז ג ב פ ק ח",
+    "a b c d e f g h",
+]
+
+
+def synthetic_catalog(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"p{i:06d}",
+            "name": " ".join(rng.sample(WORDS, 3)) + f" {i}",
+            "description": " ".join(rng.sample(WORDS, 6)),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    products = synthetic_catalog(args.products)
+    index = SearchIndex()
+
+    started = time.perf_counter()
+    index.sync(products)
+    print(f"Indexed {len(index)} products in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    # Incremental update: change 1% of the catalog
+    changed = [dict(p, name=p["name"] + " חדש") if i % 100 == 0 else p for i, p in enumerate(products)]
+    started = time.perf_counter()
+    index.sync(changed)
+    print(f"Re-synced after changing {len(products) // 100} products in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    # Warm runs reuse the cached matches of terms seen before; cold runs clear that cache first,
+    # as after every catalog change
+    groups = [(label, queries, cold) for cold in (False, True)
+              for label, queries in (("1-2 term", QUERIES), ("Multi-term", MULTI_TERM_QUERIES))]
+    for label, queries, cold in groups:
+        timings = []
+        for i in range(args.queries):
+            query = queries[i % len(queries)]
+            if cold:
+                index._term_matches.clear()
+            started = time.perf_counter()
+            index.search(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        print(f"{label} queries ({args.queries}, {'cold' if cold else 'warm'}): mean {statistics.mean(timings):.3f} ms, "
+              f"p50 {statistics.median(timings):.3f} ms, p99 {p99:.3f} ms")
+    for query in QUERIES + MULTI_TERM_QUERIES:
+        index._term_matches.clear()
+        started = time.perf_counter()
+        hits = index.search(query, limit=20)
+        print(f"  {query!r:>44}: {len(hits):2d} hits in {(time.perf_counter() - started) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Contention benchmark for stock reservation on a hot product (api/stock.py).
+
+Usage: python scripts/benchmark_stock.py [--threads 32] [--orders 2000] [--shards 1 10 20]
+
+Runs against the Firestore emulator (FIRESTORE_EMULATOR_HOST) as a local stand-in; it refuses to
+run without it. For each shard count it restocks one product, then places `orders` single-unit
+reservations from `threads` threads, each in its own transaction, exactly like checkout does.
+It reports reservations per second, latency percentiles, and how many transaction attempts were
+retried because of contention. The final stock is checked against the number of reservations.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from firebase_admin import firestore
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+settings.configure(STOCK_SHARDS=10, STOCK_TRACKING_ENABLED=True)
+
+from api.firebase import get_db  # noqa: E402
+from api.pricing import CartLine  # noqa: E402
+from api.stock import SHARDS_COLLECTION, apply_writes, reserve_stock  # noqa: E402
+
+PRODUCT_ID = 'bench-hot-product'
+
+
+def percentile(sorted_values, fraction):
+    index = max(0, int(round(len(sorted_values) * fraction)) - 1)
+    return sorted_values[index]
+
+
+def restock(db, quantity):
+    product_ref = db.collection('products').document(PRODUCT_ID)
+    for shard in product_ref.collection(SHARDS_COLLECTION).stream():
+        shard.reference.delete()
+    product_ref.set({"name": "Hot product", "price": 10, "quantity": quantity})
+
+
+def run(db, shards, threads, orders):
+    settings.STOCK_SHARDS = shards
+    restock(db, orders * 2)
+    line = CartLine(PRODUCT_ID, "Hot product", None, 1, None)
+    attempts = []
+    attempts_lock = threading.Lock()
+
+    def reserve(_):
+        calls = 0
+
+        @firestore.transactional
+        def save(transaction):
+            nonlocal calls
+            calls += 1
+            writes, _ = reserve_stock(db, transaction, [line])
+            apply_writes(transaction, writes)
+
+        started = time.perf_counter()
+        save(db.transaction(max_attempts=20))
+        elapsed = (time.perf_counter() - started) * 1000
+        with attempts_lock:
+            attempts.append(calls)
+        return elapsed
+
+    # The first reservation fills the shards; keep it out of the measurement
+    reserve(None)
+    attempts.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        timings = sorted(pool.map(reserve, range(orders)))
+    wall = time.perf_counter() - started
+
+    shard_docs = db.collection('products').document(PRODUCT_ID).collection(SHARDS_COLLECTION).stream()
+    remaining = sum(doc.to_dict().get('count', 0) for doc in shard_docs)
+    expected = orders * 2 - orders - 1
+
+    print(f"{shards} shard(s): {orders} reservations from {threads} threads in {wall:.2f} s")
+    print(f"  throughput: {orders / wall:.1f} reservations/s")
+    print(f"  latency ms: p50 {percentile(timings, 0.5):.1f}, p99 {percentile(timings, 0.99):.1f}, mean {statistics.mean(timings):.1f}")
+    print(f"  retried attempts: {sum(attempts) - len(attempts)} ({(sum(attempts) - len(attempts)) / len(attempts):.2f} per reservation)")
+    print(f"  remaining stock: {remaining} (expected {expected}){'' if remaining == expected else '  MISMATCH'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 10, 20])
+    args = parser.parse_args()
+
+    if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+        print("Refusing to run without FIRESTORE_EMULATOR_HOST: the benchmark rewrites a product's stock.")
+        sys.exit(1)
+
+    db = get_db()
+    for shards in args.shards:
+        run(db, shards, args.threads, args.orders)
+
+
+if __name__ == '__main__':
+    main()
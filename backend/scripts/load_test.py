@@ -0,0 +1,67 @@
+"""
+Simple HTTP load generator for comparing deployments (e.g. WSGI vs. ASGI, see README).
+
+Usage: python scripts/load_test.py URL [--concurrency 32] [--requests 2000] [--header 'Name: value']
+
+Sends GET requests to URL from `concurrency` threads, each with its own keep-alive session,
+and reports throughput and latency percentiles.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(sorted_values, fraction):
+    index = max(0, int(round(len(sorted_values) * fraction)) - 1)
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--header', action='append', default=[], help="Extra request header, e.g. 'If-None-Match: \"...\"'")
+    args = parser.parse_args()
+
+    headers = dict(h.split(':', 1) for h in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+    sessions = threading.local()
+    statuses = {}
+    status_lock = threading.Lock()
+
+    def fetch(_):
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        started = time.perf_counter()
+        response = session.get(args.url, headers=headers)
+        response.content  # Read the whole body
+        elapsed = (time.perf_counter() - started) * 1000
+        with status_lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return elapsed
+
+    # Warm up connections and any server-side caches
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(fetch, range(args.concurrency)))
+    statuses.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        timings = sorted(pool.map(fetch, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {wall:.2f} s")
+    print(f"  throughput: {args.requests / wall:.1f} req/s")
+    print(f"  latency ms: mean {statistics.mean(timings):.1f}, p50 {percentile(timings, 0.5):.1f}, "
+          f"p90 {percentile(timings, 0.9):.1f}, p99 {percentile(timings, 0.99):.1f}")
+    print(f"  statuses: {statuses}")
+
+
+if __name__ == '__main__':
+    main()
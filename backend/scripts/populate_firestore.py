@@ -1,5 +1,3 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 import sys
 from dotenv import load_dotenv
@@ -10,40 +8,22 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(project_root)
 load_dotenv(os.path.join(project_root, '.env'))
 
+from api.firebase import get_db  # noqa: E402
+
 
 def initialize_firebase():
-    """Initializes the Firebase Admin SDK using environment variables."""
+    """Initializes the Firebase Admin SDK using environment variables and returns the shared Firestore client."""
+    if not os.getenv("FIREBASE_WEB_API_KEY"):
+        print("Error: Missing FIREBASE_WEB_API_KEY in your .env file.")
+        sys.exit(1)
     try:
-        private_key = os.getenv('PRIVATE_KEY', '').replace('\\n', '\n')
-
-        creds = {
-            "type": os.getenv("TYPE"),
-            "project_id": os.getenv("PROJECT_ID"),
-            "private_key_id": os.getenv("PRIVATE_KEY_ID"),
-            "private_key": private_key,
-            "client_email": os.getenv("CLIENT_EMAIL"),
-            "client_id": os.getenv("CLIENT_ID"),
-            "auth_uri": os.getenv("AUTH_URI"),
-            "token_uri": os.getenv("TOKEN_URI"),
-            "auth_provider_x509_cert_url": os.getenv("AUTH_PROVIDER_X509_CERT_URL"),
-            "client_x509_cert_url": os.getenv("CLIENT_X509_CERT_URL"),
-            "universe_domain": os.getenv("UNIVERSE_DOMAIN"),
-            "firebase_web_api_key": os.getenv("FIREBASE_WEB_API_KEY")
-        }
-        
-        # Check if all required credentials are present
-        if not all(creds.values()):
-            print("Error: Missing one or more Firebase credentials in your .env file.")
-            print("Required: TYPE, PROJECT_ID, PRIVATE_KEY_ID, PRIVATE_KEY, CLIENT_EMAIL, CLIENT_ID, AUTH_URI, TOKEN_URI, AUTH_PROVIDER_X509_CERT_URL, CLIENT_X509_CERT_URL, UNIVERSE_DOMAIN, FIREBASE_WEB_API_KEY")
-            sys.exit(1)
-
-        # Remove the web API key before initializing the admin SDK
-        creds.pop("firebase_web_api_key")
-
-        cred = credentials.Certificate(creds)
-        firebase_admin.initialize_app(cred)
+        db = get_db()
         print("Firebase initialized successfully.")
-        return firestore.client()
+        return db
+    except ValueError:
+        print("Error: Missing one or more Firebase credentials in your .env file.")
+        print("Required: TYPE, PROJECT_ID, PRIVATE_KEY_ID, PRIVATE_KEY, CLIENT_EMAIL, CLIENT_ID, AUTH_URI, TOKEN_URI, AUTH_PROVIDER_X509_CERT_URL, CLIENT_X509_CERT_URL, UNIVERSE_DOMAIN, FIREBASE_WEB_API_KEY")
+        sys.exit(1)
     except Exception as e:
         print(f"Error initializing Firebase: {e}")
         sys.exit(1)
@@ -125,13 +105,16 @@ def populate_data(db):
     for category_name, products in MENU_DATA.items():
         # Create category document and get its reference
         category_doc_ref = categories_collection.document()
-        category_doc_ref.set({'name': category_name})
+        category_doc_ref.set({'name': category_name, 'productCount': len(products)})
         print(f"Created category: '{category_name}'")
 
         for product_data in products:
-            # Add product data and include a reference to its category
+            # Add product data and include a reference to its category,
+            # plus its id and name so product reads don't need to look the category up
             product_data_with_ref = product_data.copy()
             product_data_with_ref['categoryRef'] = category_doc_ref
+            product_data_with_ref['categoryId'] = category_doc_ref.id
+            product_data_with_ref['categoryName'] = category_name
             products_collection.add(product_data_with_ref)
             total_products += 1
             print(f"  - Added product: {product_data['name']}")